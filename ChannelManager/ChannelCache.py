@@ -0,0 +1,56 @@
+import time
+from typing import Optional
+import discord
+from discord.abc import GuildChannel
+from Metrics import Metrics
+
+class ChannelCache:
+    """
+    The class representing a singleton per shard that resolves channel IDs to channel objects.
+    The gateway cache is used first, and channels fetched over REST are kept for rest_ttl seconds.
+    """
+
+    _instances = {}
+    rest_ttl = 300.0
+
+    def __new__(cls, shard_id: int = 0):
+        if shard_id not in cls._instances:
+            instance = super(ChannelCache, cls).__new__(cls)
+            instance.metrics = Metrics(shard_id)
+            instance._fetched = {}  # map of channel ID to (channel, expiration time)
+            cls._instances[shard_id] = instance
+        return cls._instances[shard_id]
+
+    def get(self, guild: discord.Guild, channel_id: int) -> Optional[GuildChannel]:
+        """
+        Get a channel without any REST call.
+        """
+        channel = guild.get_channel(channel_id)
+        if channel is not None:
+            self.metrics.increment("channel_cache_gateway_hits")
+            return channel
+
+        entry = self._fetched.get(channel_id)
+        if entry is not None:
+            if entry[1] > time.monotonic():
+                self.metrics.increment("channel_cache_rest_hits")
+                return entry[0]
+            del self._fetched[channel_id]
+        return None
+
+    async def resolve(self, guild: discord.Guild, channel_id: int) -> GuildChannel:
+        """
+        Get a channel, fetching it over REST only if it is not cached.
+        Raises the same errors as discord.Guild.fetch_channel.
+        """
+        channel = self.get(guild, channel_id)
+        if channel is not None:
+            return channel
+
+        self.metrics.increment("channel_cache_misses")
+        channel = await guild.fetch_channel(channel_id)
+        self._fetched[channel_id] = (channel, time.monotonic() + self.rest_ttl)
+        return channel
+
+    def invalidate(self, channel_id: int):
+        self._fetched.pop(channel_id, None)
@@ -0,0 +1,44 @@
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+class ChannelMailbox:
+    """
+    The class representing an ordered event queue of a single voice channel.
+    Jobs run one at a time in posting order, and the mailbox releases itself once it is drained.
+    """
+
+    def __init__(self, channel_id: int, on_idle: Callable[["ChannelMailbox"], None]):
+        """
+        The constructor for ChannelMailbox class.
+
+        Parameters:
+            channel_id (int): ID of the voice channel the events belong to
+            on_idle (Callable[[ChannelMailbox], None]): called when the last job has finished
+        """
+        self.channel_id = channel_id
+        self.on_idle = on_idle
+        self.__jobs: deque[Callable[[], Awaitable[None]]] = deque()
+        self.__task: Optional[asyncio.Task] = None
+
+    def post(self, job: Callable[[], Awaitable[None]]):
+        """
+        Queue a job. It runs after every job posted before it has finished.
+        """
+        self.__jobs.append(job)
+        if self.__task is None:
+            self.__task = asyncio.get_running_loop().create_task(self.__run())
+
+    def __len__(self):
+        return len(self.__jobs)
+
+    async def __run(self):
+        while len(self.__jobs) > 0:
+            job = self.__jobs.popleft()
+            try:
+                await job()
+            except Exception as e:
+                print(f"An error occurred while handling an event of the channel {self.channel_id}: {e}")
+        # no await between the last check and here, so nothing can be posted in between
+        self.__task = None
+        self.on_idle(self)
@@ -1,6 +1,14 @@
-﻿import discord
+﻿import asyncio
+import discord
 from discord.ext import commands
 import os
+import signal
+from ChannelSettings import ChannelSettings
+from CommandSync import sync_command_tree
+from GameVoiceChannel import GameVoiceChannel
+from GameVoiceChannelManager import GameVoiceChannelManager
+from Roster import Roster
+from database.UserData import UserData
 
 intents = discord.Intents.default()
 intents.message_content = True
@@ -8,11 +16,33 @@ intents.members = True
 intents.moderation = True
 intents.voice_states = True  
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+options = {}
+# CHANNEL_MANAGER_LEAN_MEMBERS=1 caches only the members in voice channels and skips chunking, for large guilds.
+# Other members are fetched on demand through MemberResolver.
+if os.getenv("CHANNEL_MANAGER_LEAN_MEMBERS") == "1":
+    member_cache_flags = discord.MemberCacheFlags.none()
+    member_cache_flags.voice = True
+    options["member_cache_flags"] = member_cache_flags
+    options["chunk_guilds_at_startup"] = False
+
+# CHANNEL_MANAGER_SHARDED=1 runs one gateway connection per shard, and CHANNEL_MANAGER_SHARD_COUNT overrides the recommended count.
+# The channel managers, mailboxes, caches and metrics are kept per shard.
+# CHANNEL_MANAGER_SHARD_IDS limits the process to some of the shards, and is set by Cluster.py.
+if os.getenv("CHANNEL_MANAGER_SHARDED") == "1":
+    shard_count = os.getenv("CHANNEL_MANAGER_SHARD_COUNT")
+    if shard_count:
+        options["shard_count"] = int(shard_count)
+    shard_ids = os.getenv("CHANNEL_MANAGER_SHARD_IDS")
+    if shard_ids:
+        options["shard_ids"] = [int(shard_id) for shard_id in shard_ids.split(",")]
+    bot = commands.AutoShardedBot(command_prefix="!", intents=intents, **options)
+else:
+    bot = commands.Bot(command_prefix="!", intents=intents, **options)
 
 @bot.event
-async def on_ready():
-    modules = ["events.VoiceChannelEvents", "commands.CommandTree"]
+async def setup_hook():
+    # setup_hook runs once per process, unlike on_ready which runs again on every reconnect
+    modules = ["events.VoiceChannelEvents", "events.GuildChannelEvents", "events.ChannelSettingsEvents", "events.ChannelStateEvents", "events.SharedStoreEvents", "commands.CommandTree"]
 
     # Load cogs
     for module in modules:
@@ -22,8 +52,41 @@ async def on_ready():
         except Exception as e:
             print(f"Failed to load module \"{module}\". {e}")
    
+    # Cluster.py and service managers stop the process with SIGTERM, which closes the bot like Ctrl+C,
+    # so that the cogs save the channel state and the queued writes are flushed before the process exits
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(bot.close()))
+    except NotImplementedError:
+        # the event loop of Windows has no signal handlers
+        pass
+
+    # CHANNEL_MANAGER_IDLE_TTL is how many seconds an empty voice channel is kept before it is torn down
+    idle_ttl = os.getenv("CHANNEL_MANAGER_IDLE_TTL")
+    if idle_ttl:
+        GameVoiceChannelManager.idle_ttl = float(idle_ttl)
+
+    # CHANNEL_MANAGER_STATUS_TTL is how many seconds an unchanged VC status is trusted before it is written again
+    status_ttl = os.getenv("CHANNEL_MANAGER_STATUS_TTL")
+    if status_ttl:
+        GameVoiceChannel.status_ttl = float(status_ttl)
+
+    # CHANNEL_MANAGER_SETTINGS_TTL is how many seconds the settings of an unused guild are kept in memory
+    settings_ttl = os.getenv("CHANNEL_MANAGER_SETTINGS_TTL")
+    if settings_ttl:
+        ChannelSettings.shard_ttl = float(settings_ttl)
+
+    # CHANNEL_MANAGER_USER_TEXTS_CACHE is how many pairs of user and category keep their input history in memory
+    user_texts_cache = os.getenv("CHANNEL_MANAGER_USER_TEXTS_CACHE")
+    if user_texts_cache:
+        UserData.cache_capacity = int(user_texts_cache)
+
+    # CHANNEL_MANAGER_ROSTER_SELF_CHECK=1 verifies the member index of every voice channel against the cache after each update
+    Roster.self_check = os.getenv("CHANNEL_MANAGER_ROSTER_SELF_CHECK") == "1"
 
-    await bot.tree.sync()
+    # the command tree is global, so only the first process of a cluster syncs it
+    if os.getenv("CHANNEL_MANAGER_CLUSTER_ID", "0") == "0":
+        # CHANNEL_MANAGER_FORCE_SYNC=1 syncs even if the command tree has not changed
+        await sync_command_tree(bot.tree, os.getenv("CHANNEL_MANAGER_FORCE_SYNC") == "1")
 
 # Launch bot
 bot_token = os.getenv("CHANNEL_MANAGER_BOT_TOKEN")
@@ -1,10 +1,19 @@
-﻿import json, os
-from typing import Callable, Optional
+﻿import asyncio, copy, itertools, json, os, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Optional
 
+import discord
 from discord.ui import Select
+from Metrics import Metrics
+from database.SettingsJournal import SettingsJournal
+from database.SharedStore import SharedStore
 
 class ChannelSetting:
-    def __init__(self, recruitment_channel: Optional[int] = None, with_random_status: bool = False, with_live_status: bool = False, with_number_status: bool = True, can_edit_max_number: bool = False, max_number: Optional[int] = None, category: Optional[str] = None, selects: list[str] = []):
+    # the fields that are saved, followed by the render plan that is compiled from them
+    _fields = ("with_random_status", "with_live_status", "with_number_status", "can_edit_max_number", "max_number", "recruitment_channel", "category", "selects", "single_panel", "spectator_backend", "spectator_role")
+    __slots__ = _fields + ("render_plan",)
+
+    def __init__(self, recruitment_channel: Optional[int] = None, with_random_status: bool = False, with_live_status: bool = False, with_number_status: bool = True, can_edit_max_number: bool = False, max_number: Optional[int] = None, category: Optional[str] = None, selects: Iterable[str] = (), single_panel: bool = False, spectator_backend: str = "nickname", spectator_role: Optional[int] = None):
         self.with_random_status = with_random_status
         self.with_live_status = with_live_status
         self.with_number_status = with_number_status
@@ -12,7 +21,18 @@ class ChannelSetting:
         self.max_number = max_number
         self.recruitment_channel = recruitment_channel
         self.category = category
-        self.selects = selects
+        self.selects = list(selects)
+        self.single_panel = single_panel
+        self.spectator_backend = spectator_backend  # "nickname" or "role"
+        self.spectator_role = spectator_role
+        self.render_plan: Optional[RenderPlan] = None
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self._fields}
+
+    def assign(self, other: "ChannelSetting"):
+        for name in self._fields:
+            setattr(self, name, getattr(other, name))
 
     @classmethod
     def from_dict(cls, data):
@@ -33,6 +53,9 @@ class ChannelSetting:
             if isinstance(val, list):
                 return  [item for item in val if isinstance(item, str)]
             return []
+        def get_spectator_backend():
+            val = get_str("spectator_backend", "nickname")
+            return val if val in ("nickname", "role") else "nickname"
 
         return cls(
             get_optional_int("recruitment_channel", None),
@@ -42,17 +65,29 @@ class ChannelSetting:
             get_bool("can_edit_max_number", False),
             get_optional_int("max_number", 4),
             get_str("category", "DEFAULT"),
-            get_str_array("selects")
+            get_str_array("selects"),
+            get_bool("single_panel", False),
+            get_spectator_backend(),
+            get_optional_int("spectator_role", None)
             )
 
 class SelectsSetting:
-    def __init__(self, label: Optional[str] = None, selects: list[str] = [], default_value: Optional[str] = None):
+    __slots__ = ("label", "selects", "default_value")
+
+    def __init__(self, label: Optional[str] = None, selects: Iterable[str] = (), default_value: Optional[str] = None):
         self.label = label or self.error_select_label
-        self.selects = selects
+        self.selects = list(selects)
         self.default_value = default_value
 
     error_select_label = "不明な選択肢"
 
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def assign(self, other: "SelectsSetting"):
+        for name in self.__slots__:
+            setattr(self, name, getattr(other, name))
+
     @classmethod
     def from_dict(cls, data):
         def get_optional_str(label: str, default_value: Optional[str]):
@@ -78,6 +113,8 @@ class SelectsSetting:
             )
 
 class ChannelLiveSetting:
+    __slots__ = ("live_status", "random_status", "max_number", "message", "selects")
+
     def __init__(self, live_status: str, random_status: str, max_number: Optional[int], message: str, selects: dict[str,str]):
         self.live_status = live_status
         self.random_status = random_status
@@ -85,81 +122,432 @@ class ChannelLiveSetting:
         self.message = message
         self.selects = selects
 
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        def get_optional_str(label: str):
+            val = data[label] if label in data else None
+            if isinstance(val, str):
+                return val
+            return None
+        def get_optional_int(label: str):
+            num = data[label] if label in data else None
+            if isinstance(num, int):
+                return num
+            return None
+        def get_str_dict(label: str):
+            val = data[label] if label in data else {}
+            if isinstance(val, dict):
+                return {k: v for k, v in val.items() if isinstance(k, str) and isinstance(v, str)}
+            return {}
+
+        return cls(
+            get_optional_str("live_status"),
+            get_optional_str("random_status"),
+            get_optional_int("max_number"),
+            get_optional_str("message"),
+            get_str_dict("selects")
+            )
+
+class RenderField:
+    """
+    The class representing a selector field of the recruitment embed, resolved from the settings.
+    """
+
+    __slots__ = ("selects_id", "label", "default_value", "enabled")
+
+    def __init__(self, selects_id: str, label: str, default_value: Optional[str], enabled: bool):
+        self.selects_id = selects_id
+        self.label = label
+        self.default_value = default_value
+        self.enabled = enabled  # False if the selector does not exist
+
+class RenderPlan:
+    """
+    The class representing the part of the recruitment embed that only depends on the settings.
+    It is compiled once per category, and compiled again after the settings have been edited.
+    """
+
+    __slots__ = ("version", "fields")
+
+    def __init__(self, version: int, fields: tuple[RenderField, ...]):
+        self.version = version
+        self.fields = fields
+
+class GuildSettings:
+    """
+    The class representing the settings of one guild, which are loaded and evicted together.
+    """
+
+    __slots__ = ("guild_id", "channel_settings", "selects_settings", "last_used", "version")
+
+    def __init__(self, guild_id: int, channel_settings: dict[int, ChannelSetting], selects_settings: dict[str, SelectsSetting], version: int = 0):
+        self.guild_id = guild_id
+        self.channel_settings = channel_settings
+        self.selects_settings = selects_settings
+        self.last_used = time.monotonic()
+        self.version = version  # changed by every change of the settings of the guild, which invalidates their render plans
+
 class ChannelSettings:
     """
     The class representing a singleton that saves channel settings.
+    The settings are partitioned per guild. The settings of a guild are loaded in the background on the first event of the guild,
+    or the first time they are used if nothing has preloaded them, and evicted from memory once they have not been used for a while.
+    The settings are saved to local files, or to the shared store when the bot runs as a cluster.
+    Only the changed setting is written, and it is written by a background thread, so commands never wait for the disk.
     """
 
     _instance = None
+    # the flat settings files of older versions, which are migrated into the guild shards
     channel_settings_path = "channel_settings.json"
     selects_settings_path = "selects_settings.json"
-    
+    channel_settings_dir = "channel_settings"
+    selects_settings_dir = "selects_settings"
+    channel_settings_namespace = "channel_settings"
+    selects_settings_namespace = "selects_settings"
+    # seconds after which the settings of an unused guild are evicted from memory
+    shard_ttl = 600.0
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(ChannelSettings, cls).__new__(cls)
+            cls._instance._shards = {}  # map of guild ID to the loaded GuildSettings
+            cls._instance._journals = {}  # map of (namespace, guild ID) to the SettingsJournal of a loaded guild
+            cls._instance._loading = {}  # map of guild ID to the task that loads its settings in the background
+            # the shared store is written by a single thread, so that the writes keep their order
+            cls._instance._store_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ChannelSettings") if SharedStore.enabled() else None
+            cls._instance._guild_ids = cls._instance.__list_guilds()
+            # the versions of the guilds are never reused, so a plan compiled before an eviction never matches a reloaded guild
+            cls._instance._versions = itertools.count(1)
+            cls._instance.metrics = Metrics()
 
-            cls._instance._channel_settings = {}
-            if os.path.isfile(cls.channel_settings_path):
-                with open(cls.channel_settings_path, "r", encoding='utf-8-sig') as f:
-                    data = json.load(f)
-                    for key, value in data.items():
-                        cls._instance._channel_settings[int(key)] = ChannelSetting.from_dict(value)
+        return cls._instance
 
-            cls._instance._selects_settings = {}
-            if os.path.isfile(cls.selects_settings_path):
-                with open(cls.selects_settings_path, "r", encoding='utf-8-sig') as f:
-                    data = json.load(f)
-                    for key, value in data.items():
-                        cls._instance._selects_settings[key] = SelectsSetting.from_dict(value)
+    def __list_guilds(self) -> set[int]:
+        # only the names of the shards are read at startup
+        names = []
+        for directory in (self.channel_settings_dir, self.selects_settings_dir):
+            if os.path.isdir(directory):
+                # a shard may only have a journal, if the process stopped before it was compacted
+                names += [name.split(".", 1)[0] for name in os.listdir(directory) if name.endswith((".json", ".json.journal"))]
+        if SharedStore.enabled():
+            for namespace in (self.channel_settings_namespace, self.selects_settings_namespace):
+                names += [name.split(":", 1)[1] for name in SharedStore().get_namespaces(namespace + ":")]
+        return {int(name) for name in names if name.isdigit()}
 
-        return cls._instance
+    def __get_journal(self, namespace: str, guild_id: int) -> SettingsJournal:
+        key = (namespace, guild_id)
+        if key not in self._journals:
+            directory = self.channel_settings_dir if namespace == self.channel_settings_namespace else self.selects_settings_dir
+            self._journals[key] = SettingsJournal(os.path.join(directory, f"{guild_id}.json"))
+        return self._journals[key]
+
+    def __read(self, namespace: str, guild_id: int) -> dict:
+        if SharedStore.enabled():
+            data = SharedStore().get_all(f"{namespace}:{guild_id}")
+            if len(data) > 0:
+                return data
+
+        journal = self.__get_journal(namespace, guild_id)
+        data = journal.load()
+        if SharedStore.enabled() and len(data) > 0:
+            # the first process of a cluster moves the local settings into the shared store,
+            # and the local files are retired so that a namespace emptied later is never filled from them again
+            SharedStore().replace(f"{namespace}:{guild_id}", data)
+            journal.retire()
+        return data
+
+    def __put(self, namespace: str, guild_id: int, key: str, value: dict):
+        if self._store_writer is not None:
+            # the value is copied now, since the setting may be edited again before it is written
+            self._store_writer.submit(SharedStore().put, f"{namespace}:{guild_id}", key, copy.deepcopy(value))
+        else:
+            self.__get_journal(namespace, guild_id).put(key, value)
+
+    def __delete(self, namespace: str, guild_id: int, key: str):
+        if self._store_writer is not None:
+            self._store_writer.submit(SharedStore().delete, f"{namespace}:{guild_id}", key)
+        else:
+            self.__get_journal(namespace, guild_id).delete(key)
+
+    def flush(self):
+        """
+        Wait until every change of the settings has been written.
+        """
+        if self._store_writer is not None:
+            self._store_writer.submit(lambda: None).result()
+        SettingsJournal.flush()
+
+    @staticmethod
+    def __merge(current: dict, loaded: dict):
+        # the settings are updated in place, since voice channels keep references to them
+        for key in [k for k in current if k not in loaded]:
+            current.pop(key)
+        for key, setting in loaded.items():
+            if key in current:
+                current[key].assign(setting)
+            else:
+                current[key] = setting
+
+    def __load_channels(self, guild_id: int) -> dict[int, ChannelSetting]:
+        return {int(k): ChannelSetting.from_dict(v) for k, v in self.__read(self.channel_settings_namespace, guild_id).items()}
+
+    def __load_selects(self, guild_id: int) -> dict[str, SelectsSetting]:
+        return {k: SelectsSetting.from_dict(v) for k, v in self.__read(self.selects_settings_namespace, guild_id).items()}
 
-    def __save_channels(self):
-        with open(self.channel_settings_path, "w", encoding='utf-8-sig') as f:
-            json.dump({str(k): v.__dict__ for k, v in self._channel_settings.items()}, f, indent=4)
+    def __get_shard(self, guild_id: int, create: bool = False) -> Optional[GuildSettings]:
+        shard = self._shards.get(guild_id)
+        if shard is None:
+            if guild_id not in self._guild_ids and not create:
+                # the guild has never been configured, so there is nothing to load
+                return None
+            if guild_id in self._guild_ids:
+                # nothing has preloaded the guild, so its settings are read on the event loop
+                self.metrics.increment("settings_shards_loaded_on_loop")
+            shard = self.__add_shard(guild_id, self.__load_channels(guild_id), self.__load_selects(guild_id))
+        shard.last_used = time.monotonic()
+        return shard
 
-    def remove_channel_setting(self, category_id: int):
-        if category_id in self._channel_settings:
-            self._channel_settings.pop(category_id)
-            self.__save_channels()
+    def __add_shard(self, guild_id: int, channel_settings: dict[int, ChannelSetting], selects_settings: dict[str, SelectsSetting]) -> GuildSettings:
+        shard = GuildSettings(guild_id, channel_settings, selects_settings, next(self._versions))
+        self._shards[guild_id] = shard
+        self._guild_ids.add(guild_id)
+        self.metrics.increment("settings_shards_loaded")
+        self.metrics.set_gauge("settings_shards_live", len(self._shards))
+        return shard
+
+    def __run_in_background(self, function: Callable, *args):
+        # the shared store is read by its writer thread, so that the changes queued before are read back
+        return asyncio.get_running_loop().run_in_executor(self._store_writer, function, *args)
+
+    async def preload(self, guild_id: int):
+        """
+        Load the settings of a configured guild in the background, so that the event loop never waits for the disk when they are used.
+        Does nothing if the settings are already loaded.
+        """
+        if guild_id in self._shards or guild_id not in self._guild_ids:
+            return
+        task = self._loading.get(guild_id)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self.__preload(guild_id))
+            self._loading[guild_id] = task
+            task.add_done_callback(lambda _: self._loading.pop(guild_id, None))
+        await asyncio.shield(task)
+
+    async def __preload(self, guild_id: int):
+        # the journals are created on the event loop, only their files are read in the background
+        for namespace in (self.channel_settings_namespace, self.selects_settings_namespace):
+            self.__get_journal(namespace, guild_id)
+        try:
+            channel_settings = await self.__run_in_background(self.__load_channels, guild_id)
+            selects_settings = await self.__run_in_background(self.__load_selects, guild_id)
+        except Exception as e:
+            print(f"Failed to load the settings of guild {guild_id}. {e}")
+            return
+        # the settings may have been loaded on the event loop in the meantime
+        if guild_id not in self._shards:
+            self.__add_shard(guild_id, channel_settings, selects_settings).last_used = time.monotonic()
+
+    def evict(self, pinned: set[int]) -> int:
+        """
+        Evict the settings of the guilds that have not been used for shard_ttl seconds.
+
+        Parameters:
+            pinned (set[int]): IDs of the guilds whose settings are referenced by live voice channels
+        """
+        deadline = time.monotonic() - self.shard_ttl
+        evicted = [guild_id for guild_id, shard in self._shards.items() if shard.last_used < deadline and guild_id not in pinned]
+        for guild_id in evicted:
+            del self._shards[guild_id]
+            for namespace in (self.channel_settings_namespace, self.selects_settings_namespace):
+                journal = self._journals.pop((namespace, guild_id), None)
+                if journal is not None:
+                    journal.close()
+        if len(evicted) > 0:
+            self.metrics.increment("settings_shards_evicted", len(evicted))
+            self.metrics.set_gauge("settings_shards_live", len(self._shards))
+        return len(evicted)
+
+    async def reload(self, namespaces: set[str]):
+        """
+        Load the settings again after another process of the cluster has changed them.
+        The settings are read in the background and merged on the event loop.
+        """
+        if SharedStore.lost_changes_namespace in namespaces:
+            # the changes that were dropped from the log are unknown, so every loaded guild is read again
+            # and the guilds that have been configured in the meantime are listed again
+            namespaces = namespaces | {f"{namespace}:{guild_id}" for guild_id in self._shards for namespace in (self.channel_settings_namespace, self.selects_settings_namespace)}
+            try:
+                self._guild_ids.update(await self.__run_in_background(self.__list_guilds))
+            except Exception as e:
+                print(f"Failed to list the configured guilds. {e}")
+        for namespace in namespaces:
+            kind, _, guild_id = namespace.partition(":")
+            if not guild_id.isdigit():
+                continue
+            guild_id = int(guild_id)
+            self._guild_ids.add(guild_id)
+            shard = self._shards.get(guild_id)
+            if shard is None:
+                # the settings are read from the shared store when the guild is used
+                continue
+            try:
+                if kind == self.channel_settings_namespace:
+                    self.__merge(shard.channel_settings, await self.__run_in_background(self.__load_channels, guild_id))
+                elif kind == self.selects_settings_namespace:
+                    self.__merge(shard.selects_settings, await self.__run_in_background(self.__load_selects, guild_id))
+            except Exception as e:
+                print(f"Failed to reload the settings of guild {guild_id}. {e}")
+                continue
+            shard.version = next(self._versions)
+
+    @staticmethod
+    def __read_legacy_file(path: str) -> dict:
+        if not os.path.isfile(path):
+            return {}
+        with open(path, "r", encoding='utf-8-sig') as f:
+            return json.load(f)
+
+    def __read_legacy(self, namespace: str, path: str) -> dict:
+        if not SharedStore.enabled():
+            return self.__read_legacy_file(path)
+        if os.path.isfile(path):
+            # every process of a cluster migrates at startup, but only the first one copies the file into the store,
+            # so a later process never brings back the categories that have been migrated since
+            SharedStore().seed(namespace, self.__read_legacy_file(path))
+            try:
+                os.replace(path, path + ".migrated")
+            except FileNotFoundError:
+                # another process has retired the file
+                pass
+        return SharedStore().get_all(namespace)
+
+    @staticmethod
+    def __write_legacy(path: str, data: dict):
+        if len(data) > 0:
+            temp_path = path + ".tmp"
+            with open(temp_path, "w", encoding='utf-8-sig') as f:
+                json.dump(data, f, indent=4, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        elif os.path.isfile(path):
+            os.replace(path, path + ".migrated")
+
+    def migrate(self, guilds: Iterable[discord.Guild]) -> int:
+        """
+        Move the settings of the flat settings files of older versions into the shards of the guilds.
+        The settings of categories that none of the guilds contain are left in the flat files.
+        """
+        channels = self.__read_legacy(self.channel_settings_namespace, self.channel_settings_path)
+        if len(channels) == 0:
+            return 0
+        selects = self.__read_legacy(self.selects_settings_namespace, self.selects_settings_path)
+
+        migrated = 0
+        moved_keys = []
+        for guild in guilds:
+            keys = [str(category.id) for category in guild.categories if str(category.id) in channels]
+            if len(keys) == 0:
+                continue
+            shard = self.__get_shard(guild.id, True)
+            for key in keys:
+                value = channels.pop(key)
+                moved_keys.append(key)
+                # a setting that has been edited since the last migration is kept
+                if int(key) not in shard.channel_settings:
+                    shard.channel_settings[int(key)] = ChannelSetting.from_dict(value)
+                    self.__put(self.channel_settings_namespace, guild.id, key, shard.channel_settings[int(key)].to_dict())
+                    migrated += 1
+            # the selectors were shared by every guild, so each guild gets a copy of them
+            for key, value in selects.items():
+                if key not in shard.selects_settings:
+                    shard.selects_settings[key] = SelectsSetting.from_dict(value)
+                    self.__put(self.selects_settings_namespace, guild.id, key, shard.selects_settings[key].to_dict())
+            shard.version = next(self._versions)
+
+        if SharedStore.enabled():
+            # the other processes migrate the categories of their own guilds at the same time,
+            # so only the moved categories are deleted instead of writing back the rest
+            for key in moved_keys:
+                SharedStore().delete(self.channel_settings_namespace, key)
+            if len(SharedStore().get_all(self.channel_settings_namespace)) == 0:
+                SharedStore().replace(self.selects_settings_namespace, {})
+        else:
+            self.__write_legacy(self.channel_settings_path, channels)
+            if len(channels) == 0:
+                self.__write_legacy(self.selects_settings_path, {})
+        return migrated
+
+    def remove_channel_setting(self, guild_id: int, category_id: int):
+        shard = self.__get_shard(guild_id)
+        if shard is not None and category_id in shard.channel_settings:
+            shard.channel_settings.pop(category_id)
+            shard.version = next(self._versions)
+            self.__delete(self.channel_settings_namespace, guild_id, str(category_id))
             return True
         else:
             return False
 
-    def get_channel_setting(self, category_id: int) -> Optional[ChannelSetting]:
-        if category_id in self._channel_settings:
-            return self._channel_settings[category_id]
+    def get_channel_setting(self, guild_id: int, category_id: int) -> Optional[ChannelSetting]:
+        shard = self.__get_shard(guild_id)
+        if shard is not None and category_id in shard.channel_settings:
+            return shard.channel_settings[category_id]
         return None
 
-    def edit_channel_setting(self, channel_id: int, editor: Callable[[ChannelSetting], None]):
-        if channel_id in self._channel_settings:
-            editor(self._channel_settings[channel_id])
+    def edit_channel_setting(self, guild_id: int, channel_id: int, editor: Callable[[ChannelSetting], None]):
+        shard = self.__get_shard(guild_id, True)
+        if channel_id in shard.channel_settings:
+            editor(shard.channel_settings[channel_id])
         else:
             new_setting = ChannelSetting()
             editor(new_setting)
-            self._channel_settings[channel_id] = new_setting
-        self.__save_channels()
-
-    def __save_selects(self):
-        with open(self.selects_settings_path, "w", encoding='utf-8-sig') as f:
-            json.dump({str(k): v.__dict__ for k, v in self._selects_settings.items()}, f, indent=4)
-            
-    def get_selects_setting(self, selects_id: str) -> Optional[SelectsSetting]:
-        if selects_id in self._selects_settings:
-            return self._selects_settings[selects_id]
+            shard.channel_settings[channel_id] = new_setting
+        shard.version = next(self._versions)
+        self.__put(self.channel_settings_namespace, guild_id, str(channel_id), shard.channel_settings[channel_id].to_dict())
+
+    def get_selects_setting(self, guild_id: int, selects_id: str) -> Optional[SelectsSetting]:
+        shard = self.__get_shard(guild_id)
+        if shard is not None and selects_id in shard.selects_settings:
+            return shard.selects_settings[selects_id]
         return None
-    
-    def edit_selects_settings(self, selects_id: str, editor: Callable[[SelectsSetting], None]):
-        if selects_id in self._selects_settings:
-            editor(self._selects_settings[selects_id])
+
+    def edit_selects_settings(self, guild_id: int, selects_id: str, editor: Callable[[SelectsSetting], None]):
+        shard = self.__get_shard(guild_id, True)
+        if selects_id in shard.selects_settings:
+            editor(shard.selects_settings[selects_id])
         else:
             new_setting = SelectsSetting()
             editor(new_setting)
-            self._selects_settings[selects_id] = new_setting
-        self.__save_selects()
+            shard.selects_settings[selects_id] = new_setting
+        shard.version = next(self._versions)
+        self.__put(self.selects_settings_namespace, guild_id, str(selects_id), shard.selects_settings[selects_id].to_dict())
+
+    def get_render_plan(self, guild_id: int, setting: ChannelSetting) -> RenderPlan:
+        """
+        Get the render plan of a category, compiling it again if the settings of its guild have changed since it was compiled.
+        """
+        shard = self.__get_shard(guild_id)
+        version = shard.version if shard is not None else 0
+        plan = setting.render_plan
+        if plan is None or plan.version != version:
+            fields = []
+            for selects_id in setting.selects:
+                selects_setting = self.get_selects_setting(guild_id, selects_id)
+                if selects_setting is None:
+                    fields.append(RenderField(selects_id, SelectsSetting.error_select_label, None, False))
+                else:
+                    fields.append(RenderField(selects_id, selects_setting.label, selects_setting.default_value, True))
+            plan = RenderPlan(version, tuple(fields))
+            setting.render_plan = plan
+        return plan
 
-    def get_all_channels(self):
-        return self._channel_settings.keys()
+    def get_all_channels(self, guild_id: int):
+        shard = self.__get_shard(guild_id)
+        return shard.channel_settings.keys() if shard is not None else {}.keys()
 
-    def get_all_selects(self):
-        return self._selects_settings.keys()
+    def get_all_selects(self, guild_id: int):
+        shard = self.__get_shard(guild_id)
+        return shard.selects_settings.keys() if shard is not None else {}.keys()
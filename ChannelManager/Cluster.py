@@ -0,0 +1,161 @@
+"""
+Launch the bot as a cluster of worker processes. Each worker runs ChannelManager.py for a contiguous range of shards,
+and all workers share their settings and channel state through the shared store.
+
+Environment variables:
+    CHANNEL_MANAGER_BOT_TOKEN: the bot token
+    CHANNEL_MANAGER_PROCESSES: the number of worker processes (default: the number of CPUs)
+    CHANNEL_MANAGER_SHARD_COUNT: the total number of shards (default: the number recommended by Discord)
+    CHANNEL_MANAGER_SHARED_STORE: the path of the shared store (default: shared_store.db)
+"""
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Optional
+import aiohttp
+
+# seconds to wait before a crashed worker is started again
+restart_delay = 5.0
+# seconds to wait for the first worker to be ready before the other workers are started anyway
+ready_timeout = 600.0
+# seconds to wait for a worker to close the bot before it is killed
+stop_timeout = 30.0
+
+def mark_ready():
+    """
+    Tell the cluster that this worker has synced the command tree and migrated the settings.
+    Does nothing if the worker was not started by the cluster.
+    """
+    path = os.getenv("CHANNEL_MANAGER_READY_FILE")
+    if path:
+        with open(path, "w", encoding='utf-8') as f:
+            f.write(str(os.getpid()))
+
+async def fetch_recommended_shards(token: str) -> int:
+    async with aiohttp.ClientSession() as session:
+        async with session.get("https://discord.com/api/v10/gateway/bot", headers={"Authorization": f"Bot {token}"}) as response:
+            response.raise_for_status()
+            data = await response.json()
+            return int(data["shards"])
+
+def get_shard_ranges(shard_count: int, processes: int) -> list[list[int]]:
+    """
+    Split the shards into contiguous ranges of nearly equal size, one per process.
+    """
+    processes = max(1, min(processes, shard_count))
+    ranges = []
+    start = 0
+    for i in range(processes):
+        size = shard_count // processes + (1 if i < shard_count % processes else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return ranges
+
+class Worker:
+    """
+    The class representing a worker process of the cluster.
+    """
+
+    def __init__(self, cluster_id: int, shard_ids: list[int], shard_count: int, store_path: str, ready_path: Optional[str] = None):
+        self.cluster_id = cluster_id
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.store_path = store_path
+        self.ready_path = ready_path
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self):
+        env = dict(os.environ)
+        env["CHANNEL_MANAGER_SHARDED"] = "1"
+        env["CHANNEL_MANAGER_SHARD_COUNT"] = str(self.shard_count)
+        env["CHANNEL_MANAGER_SHARD_IDS"] = ",".join(map(str, self.shard_ids))
+        env["CHANNEL_MANAGER_CLUSTER_ID"] = str(self.cluster_id)
+        env["CHANNEL_MANAGER_SHARED_STORE"] = self.store_path
+        if self.ready_path is not None:
+            env["CHANNEL_MANAGER_READY_FILE"] = self.ready_path
+            if os.path.exists(self.ready_path):
+                os.remove(self.ready_path)
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ChannelManager.py")
+        # Ctrl+C reaches only the cluster, which stops every worker once
+        self.process = subprocess.Popen([sys.executable, script], env=env, start_new_session=os.name != "nt")
+        print(f"Started worker {self.cluster_id} for shards {self.shard_ids}.")
+
+    def is_ready(self) -> bool:
+        return self.ready_path is not None and os.path.exists(self.ready_path)
+
+    def stop(self):
+        # the worker closes the bot on SIGTERM, so that the channel state is saved and the queued writes are flushed
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+
+    def wait(self):
+        if self.process is None:
+            return
+        try:
+            self.process.wait(stop_timeout)
+        except subprocess.TimeoutExpired:
+            print(f"Worker {self.cluster_id} did not stop in {stop_timeout} seconds. Killing it.")
+            self.process.kill()
+            self.process.wait()
+
+def main():
+    token = os.getenv("CHANNEL_MANAGER_BOT_TOKEN")
+    if not token:
+        print("There is no CHANNEL_MANAGER_BOT_TOKEN!")
+        return
+
+    processes = int(os.getenv("CHANNEL_MANAGER_PROCESSES") or os.cpu_count() or 1)
+    shard_count = os.getenv("CHANNEL_MANAGER_SHARD_COUNT")
+    shard_count = int(shard_count) if shard_count else asyncio.run(fetch_recommended_shards(token))
+    store_path = os.path.abspath(os.getenv("CHANNEL_MANAGER_SHARED_STORE") or "shared_store.db")
+
+    workers = [Worker(i, shard_ids, shard_count, store_path) for i, shard_ids in enumerate(get_shard_ranges(shard_count, processes))]
+    workers[0].ready_path = store_path + ".ready"
+    print(f"Launching {len(workers)} workers for {shard_count} shards.")
+
+    stopping = False
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    # the first worker syncs the command tree and moves the local settings into the shared store, so it starts alone
+    # and the others wait until it reports that it is done
+    workers[0].start()
+    deadline = time.monotonic() + ready_timeout
+    while not stopping and not workers[0].is_ready():
+        if workers[0].process.poll() is not None:
+            print(f"Worker 0 exited with {workers[0].process.returncode} before it was ready.")
+            break
+        if time.monotonic() >= deadline:
+            print(f"Worker 0 was not ready in {ready_timeout} seconds.")
+            break
+        time.sleep(0.5)
+    if not stopping:
+        for worker in workers[1:]:
+            worker.start()
+
+    restarts = {}  # map of cluster ID to the time to start it again
+    while not stopping:
+        time.sleep(1.0)
+        for worker in workers:
+            if worker.process.poll() is None:
+                continue
+            if worker.cluster_id not in restarts:
+                print(f"Worker {worker.cluster_id} exited with {worker.process.returncode}.")
+                restarts[worker.cluster_id] = time.monotonic() + restart_delay
+            elif restarts[worker.cluster_id] <= time.monotonic():
+                del restarts[worker.cluster_id]
+                worker.start()
+
+    for worker in workers:
+        worker.stop()
+    for worker in workers:
+        worker.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import hashlib
+import json
+import os
+from discord import app_commands
+
+command_hash_path = "command_tree.hash"
+
+def get_command_tree_hash(tree: app_commands.CommandTree) -> str:
+    """
+    Get a stable hash of the global commands as they are sent to Discord.
+    The application ID is included, so that switching the bot account always syncs.
+    """
+    commands = sorted((command.to_dict(tree) for command in tree.get_commands()), key=lambda c: (c.get("type", 1), c["name"]))
+    payload = json.dumps({"application_id": tree.client.application_id, "commands": commands}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _load_synced_hash():
+    if not os.path.isfile(command_hash_path):
+        return None
+    with open(command_hash_path, "r", encoding='utf-8') as f:
+        return f.read().strip()
+
+def _save_synced_hash(value: str):
+    with open(command_hash_path, "w", encoding='utf-8') as f:
+        f.write(value)
+
+async def sync_command_tree(tree: app_commands.CommandTree, force: bool = False) -> bool:
+    """
+    Sync the command tree only if it has changed since the last sync.
+
+    Parameters:
+        tree (app_commands.CommandTree): the command tree of the bot
+        force (bool): sync even if the command tree has not changed
+    Returns:
+        bool: whether the command tree was synced
+    """
+    current_hash = get_command_tree_hash(tree)
+    if not force and _load_synced_hash() == current_hash:
+        print("The command tree is unchanged. Skipped syncing.")
+        return False
+
+    await tree.sync()
+    _save_synced_hash(current_hash)
+    print("Synced the command tree.")
+    return True
@@ -1,23 +1,45 @@
 ﻿from ast import Delete
 import re
 from tkinter import SEL
-from typing import Optional, Protocol, Tuple
+import time
+from typing import Awaitable, Callable, Optional, Protocol, Tuple, TypeVar
 from urllib import response
 from discord import Message, VoiceChannel, Member
 from discord.abc import GuildChannel
 import discord
-import NicknameUtils
+import hashlib
+import json
+import SpectatorUtils
 from ChannelSettings import ChannelSetting, ChannelLiveSetting, ChannelSettings, SelectsSetting
 from ui.RecruitmentOwnerUI import RecruitmentOwnerUI, RecruitmentOwnerUICallbacks
 from ui.ManagementUI import ManagementUI, ManagementUICallbacks
 from ui.RecruitmentUI import RecruitmentUI, RecruimentUICallbacks
 from ui.ToggleUserStateUI import ToggleUserStateUI
+from RenderScheduler import RenderScheduler
+from Metrics import Metrics
+from RestScheduler import RestPriority, RestScheduler
+from TransitionPlan import TransitionPlan
+from ChannelCache import ChannelCache
+from Roster import Roster
 
+T = TypeVar("T")
 
 class GameVoiceChannel:
     """
     The class representing a game voice channel.
     """
+
+    __slots__ = ("voice_channel", "vc_id", "owner", "no_owner_ui_message", "management_ui_message", "recruitment_ui_message", "recruitment_message",
+                 "setting", "current_setting", "render_scheduler", "recruitment_fingerprint", "last_status", "last_status_at", "panel_message", "panel_view", "panel_state",
+                 "views", "metrics", "rest", "roster")
+
+    # seconds to coalesce status updates into one recruitment edit and one VC status edit
+    render_interval = 1.0
+    # marker for a VC status that has not been written by this bot yet
+    unknown_status = object()
+    # seconds after which the last written VC status is written again even if it has not changed,
+    # since a status changed by someone else is not reported by discord.py
+    status_ttl = 300.0
     
     #def __init__(self, voice_channel: VoiceChannel | GuildChannel, setting: ChannelSetting):
     def __init__(self, voice_channel: VoiceChannel, setting: ChannelSetting):
@@ -39,6 +61,17 @@ class GameVoiceChannel:
         self.recruitment_message: Optional[Message] = None
         self.setting = setting
         self.current_setting: Optional[ChannelLiveSetting] = None
+        self.render_scheduler = RenderScheduler(self.__render_status, self.render_interval)
+        self.recruitment_fingerprint: Optional[str] = None
+        self.last_status = self.unknown_status
+        self.last_status_at = 0.0
+        self.panel_message: Optional[Message] = None
+        self.panel_view: Optional[discord.ui.View] = None
+        self.panel_state: Optional[str] = None
+        self.views: dict[int, discord.ui.View] = {}  # views of the UI messages, keyed by the message ID
+        self.metrics = Metrics(voice_channel.guild.shard_id)
+        self.rest = RestScheduler(voice_channel.guild.shard_id)
+        self.roster = Roster(voice_channel, lambda member: SpectatorUtils.is_spectator(member, self.setting))
 
     # Recruitment Message
 
@@ -49,13 +82,15 @@ class GameVoiceChannel:
             return [False, "このチャンネルでの募集は無効です。"]
 
         try:
-            send_to = await self.voice_channel.guild.fetch_channel(self.setting.recruitment_channel)
+            send_to = await ChannelCache(self.voice_channel.guild.shard_id).resolve(self.voice_channel.guild, self.setting.recruitment_channel)
         except Exception as e:
             print(f"There is no a recruitment channel! unknown channel id: {self.setting.recruitment_channel} \ne: {e}")
             return [False, "募集チャンネルを見つけられませんでした。"]
         
         try:
-            self.recruitment_message = await send_to.send(embed=self.__get_recuitment_embed())
+            embed = self.__get_recuitment_embed()
+            self.recruitment_message = await self.rest.request(RestPriority.INTERACTIVE, ("channel", send_to.id), lambda: send_to.send(embed=embed))
+            self.recruitment_fingerprint = self.__get_embed_fingerprint(embed)
         except Exception as e:
             print(f"An error occurred while sending a recruitment message. {e}")
             return [False, "募集の掲示中にエラーが発生しました。"]
@@ -69,8 +104,17 @@ class GameVoiceChannel:
         if self.recruitment_message is None:
             return [False, "募集が開始されていません。"]
         
+        embed = self.__get_recuitment_embed()
+        fingerprint = self.__get_embed_fingerprint(embed)
+        if fingerprint == self.recruitment_fingerprint:
+            self.metrics.increment("edits_skipped")
+            return [True, "募集を更新しました。"]
+
         try:
-            await self.recruitment_message.edit(embed=self.__get_recuitment_embed())
+            message = self.recruitment_message
+            await self.rest.request(RestPriority.BACKGROUND, ("channel", message.channel.id), lambda: message.edit(embed=embed))
+            self.metrics.increment("edits_sent")
+            self.recruitment_fingerprint = fingerprint
         except Exception as e:
             print(f"An error occurred while updating the recruitment message: {e}")
             return [False, "募集の掲示中にエラーが発生しました。"]
@@ -81,22 +125,44 @@ class GameVoiceChannel:
         if self.recruitment_message is None:
             return
         try:
-            await self.recruitment_message.delete()
+            message = self.recruitment_message
+            await self.rest.request(RestPriority.BACKGROUND, ("channel", message.channel.id), message.delete)
         except Exception as e:
             # if the message is already deleted, ignore the error
             pass
         finally:
             self.recruitment_message = None
+            self.recruitment_fingerprint = None
+
+    async def __edit_vc_status(self, status: Optional[str]):
+        """
+        Write the VC status unless it is the same as the last written one, which is trusted for status_ttl seconds.
+        """
+        if status == self.last_status and time.monotonic() - self.last_status_at < self.status_ttl:
+            self.metrics.increment("edits_skipped")
+            return
+        await self.rest.request(RestPriority.BACKGROUND, ("channel", self.vc_id), lambda: self.voice_channel.edit(status=status))
+        self.metrics.increment("edits_sent")
+        self.last_status = status
+        self.last_status_at = time.monotonic()
 
     async def __update_vc_status(self):
-        if len(self.voice_channel.members) > 0:
+        if len(self.roster) > 0:
             if self.setting.with_number_status and self.get_max_players() is not None:
-                await self.voice_channel.edit(status=self.__get_left_players_text())
+                await self.__edit_vc_status(self.__get_left_players_text())
 
     async def clear_status(self):
-         await self.voice_channel.edit(status=None)
+         await self.__edit_vc_status(None)
 
     async def update_status(self):
+        """
+        Schedule the recruitment message and the VC status to be rewritten.
+        Bursts of updates within render_interval are written only once.
+        """
+        if self.setting.recruitment_channel is not None:
+            self.render_scheduler.mark_dirty()
+
+    async def __render_status(self):
         if self.setting.recruitment_channel is not None:
             await self.__update_recruitment_message()
             await self.__update_vc_status()
@@ -111,18 +177,22 @@ class GameVoiceChannel:
         if self.setting.with_random_status:
             embed.add_field(name="ゲーム中の雑談", value=self.current_setting.random_status, inline=False)
 
-        for selects_id in self.setting.selects:
-            selects_setting: Optional[SelectsSetting] = ChannelSettings().get_selects_setting(selects_id)
-            if selects_id is None:
+        for field in ChannelSettings().get_render_plan(self.voice_channel.guild.id, self.setting).fields:
+            if not field.enabled:
                 continue
-            select = (self.current_setting.selects[selects_id] if selects_id in self.current_setting.selects else None) or selects_setting.default_value
+            select = self.current_setting.selects.get(field.selects_id) or field.default_value
             if select is not None:
-                embed.add_field(name=selects_setting.label, value=select, inline=False)
+                embed.add_field(name=field.label, value=select, inline=False)
 
         embed.set_footer(text=f"募集主: {self.owner.display_name}", icon_url= self.owner.avatar.url if self.owner.avatar else self.owner.default_avatar.url)
 
         return embed
 
+    @staticmethod
+    def __get_embed_fingerprint(embed: discord.Embed) -> str:
+        payload = json.dumps(embed.to_dict(), sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
     def __get_left_players_text(self):
         max_players = self.get_max_players()
         if max_players is None:
@@ -131,6 +201,79 @@ class GameVoiceChannel:
         left = max_players - self.count_players()
         return "@" + str(left) if left > 0 else "〆"
 
+    # Views
+
+    async def __send_ui(self, embed: discord.Embed, view: discord.ui.View) -> Optional[Message]:
+        """
+        Send a UI message to the voice channel and keep its view, so that it can be released later.
+        """
+        try:
+            message = await self.rest.request(RestPriority.INTERACTIVE, ("channel", self.vc_id), lambda: self.voice_channel.send(embed=embed, view=view))
+        except Exception as e:
+            print(f"An error occurred while sending the message {e}")
+            return None
+        self.views[message.id] = view
+        return message
+
+    def __release_view(self, message: Optional[Message]):
+        """
+        Stop listening to the view of a UI message.
+        """
+        if message is None:
+            return
+        view = self.views.pop(message.id, None)
+        if view is not None:
+            view.stop()
+
+    # Control Panel
+
+    async def __show_panel(self, state: str, embed: discord.Embed, view: discord.ui.View):
+        """
+        Show the UI in the single control panel message of the voice channel.
+        The panel is edited in place and only sent when it does not exist yet.
+        """
+        if self.panel_view is not None:
+            self.panel_view.stop()
+        self.panel_view = view
+        self.panel_state = state
+
+        if self.panel_message is not None:
+            message = self.panel_message
+            try:
+                await self.rest.request(RestPriority.INTERACTIVE, ("channel", self.vc_id), lambda: message.edit(embed=embed, view=view))
+                return
+            except Exception as e:
+                print(f"An error occurred while editing the control panel: {e}")
+
+        try:
+            self.panel_message = await self.rest.request(RestPriority.INTERACTIVE, ("channel", self.vc_id), lambda: self.voice_channel.send(embed=embed, view=view))
+        except Exception as e:
+            print(f"An error occurred while sending the control panel: {e}")
+            self.panel_message = None
+
+    async def __delete_panel(self):
+        """
+        Delete the control panel message if it exists.
+        """
+        if self.panel_view is not None:
+            self.panel_view.stop()
+            self.panel_view = None
+        self.panel_state = None
+        if self.panel_message is None:
+            return
+        try:
+            await self.rest.request(RestPriority.INTERACTIVE, ("channel", self.vc_id), self.panel_message.delete)
+        except Exception as e:
+            print(f"An error occurred while deleting the message: {e}")
+        finally:
+            self.panel_message = None
+
+    async def __update_panel_embed(self, embed: discord.Embed):
+        if self.panel_message is None:
+            return
+        message = self.panel_message
+        await self.rest.request(RestPriority.INTERACTIVE, ("channel", self.vc_id), lambda: message.edit(embed=embed))
+
     # NoOwnerUI
 
     async def __delete_no_owner_ui(self):
@@ -140,10 +283,11 @@ class GameVoiceChannel:
         if self.no_owner_ui_message is None:
             return
         try:
-            await self.no_owner_ui_message.delete()
+            await self.rest.request(RestPriority.INTERACTIVE, ("channel", self.vc_id), self.no_owner_ui_message.delete)
         except Exception as e:
             print(f"An error occurred while deleting the message: {e}")
         finally:
+            self.__release_view(self.no_owner_ui_message)
             self.no_owner_ui_message = None
 
     async def __show_no_owner_ui(self):
@@ -154,9 +298,25 @@ class GameVoiceChannel:
         if self.no_owner_ui_message is not None:
             await self.__delete_no_owner_ui()
 
+        if self.setting.single_panel:
+            if self.panel_state != "no_owner" or self.panel_message is None:
+                await self.__show_panel("no_owner", *RecruitmentOwnerUI.build_owner_selection_message(self.__get_no_owner_callbacks()))
+            return
+
+        self.no_owner_ui_message = await self.__send_ui(*RecruitmentOwnerUI.build_owner_selection_message(self.__get_no_owner_callbacks()))
+
+    async def __run_in_order(self, job: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run a UI callback in the mailbox of the voice channel, after the events queued before it.
+        """
+        # imported here, since the manager imports this module
+        from GameVoiceChannelManager import GameVoiceChannelManager
+        return await GameVoiceChannelManager(self.voice_channel.guild.shard_id).run_event(self.vc_id, job)
+
+    def __get_no_owner_callbacks(self) -> RecruitmentOwnerUICallbacks:
         async def callback(interaction : discord.Interaction) -> tuple[bool, str]:
-            return await self.try_set_owner(interaction.user, interaction.message)
-        self.no_owner_ui_message = await RecruitmentOwnerUI.send_owner_selection_message(self.voice_channel, RecruitmentOwnerUICallbacks(callback))
+            return await self.__run_in_order(lambda: self.try_set_owner(interaction.user, interaction.message))
+        return RecruitmentOwnerUICallbacks(callback)
 
     # ManagementUI
 
@@ -167,10 +327,11 @@ class GameVoiceChannel:
         if self.management_ui_message is None:
             return
         try:
-            await self.management_ui_message.delete()
+            await self.rest.request(RestPriority.INTERACTIVE, ("channel", self.vc_id), self.management_ui_message.delete)
         except Exception as e:
             print(f"An error occurred while deleting the message: {e}")
         finally:
+            self.__release_view(self.management_ui_message)
             self.management_ui_message = None
 
     async def __show_management_ui(self):
@@ -180,28 +341,47 @@ class GameVoiceChannel:
         if self.management_ui_message is not None:
             await self.__delete_management_ui()
 
+        await self.__ensure_owner_is_player()
+        if self.setting.single_panel:
+            await self.__show_panel("management", *ManagementUI.build_management_message(self.setting, self.current_setting, self.owner, self.__get_management_callbacks()))
+            return
+        self.management_ui_message = await self.__send_ui(*ManagementUI.build_management_message(self.setting, self.current_setting, self.owner, self.__get_management_callbacks()))
+
+    def __get_management_callbacks(self) -> ManagementUICallbacks:
         async def change_players_callback(interaction : discord.Interaction):
             await self.update_status()
 
         async def edit_recruitment(interaction: discord.Interaction):
-            await self.__show_recruitment_ui()
-            return [True, "編集を開始します。"]
+            async def job():
+                if self.owner is None or self.owner.id != interaction.user.id:
+                    return [False, "募集主のみ使用できます。"]
+                await self.__show_recruitment_ui()
+                return [True, "編集を開始します。"]
+            return await self.__run_in_order(job)
 
         async def release_owner(interaction: discord.Interaction):
-            await self.set_owner(None, True)
+            async def job():
+                # the owner may have left or released the channel while the job was queued
+                if self.owner is not None and self.owner.id == interaction.user.id:
+                    await self.set_owner(None, True)
+            await self.__run_in_order(job)
 
         async def change_max_player(interaction: discord.Interaction, num: int):
-            self.current_setting.max_number = num
-            try:
-                await interaction.response.send_message(f"最大人数を{num}人に変更しました。", delete_after=5)
-            except Exception:
-                pass
-            await self.update_status()
-
+            async def job():
+                self.current_setting.max_number = num
+                try:
+                    await interaction.response.send_message(f"最大人数を{num}人に変更しました。", delete_after=5)
+                except Exception:
+                    pass
+                await self.update_status()
+            await self.__run_in_order(job)
+
+        return ManagementUICallbacks(change_players_callback, change_players_callback, edit_recruitment, release_owner, change_max_player)
+
+    async def __ensure_owner_is_player(self):
         member = self.owner
-        if NicknameUtils.is_spectator(member):
-            await NicknameUtils.change_to_player(member)
-        self.management_ui_message = await ManagementUI.send_management_message(self.voice_channel, self.setting, self.current_setting, member, ManagementUICallbacks(change_players_callback, change_players_callback, edit_recruitment, release_owner, change_max_player))
+        if self.roster.is_spectator(member.id):
+            await SpectatorUtils.change_to_player(member, self.setting)
 
     # RecruimentUI
 
@@ -212,10 +392,11 @@ class GameVoiceChannel:
         if self.recruitment_ui_message is None:
             return
         try:
-            await self.recruitment_ui_message.delete()
+            await self.rest.request(RestPriority.INTERACTIVE, ("channel", self.vc_id), self.recruitment_ui_message.delete)
         except Exception as e:
             print(f"An error occurred while deleting the message: {e}")
         finally:
+            self.__release_view(self.recruitment_ui_message)
             self.recruitment_ui_message = None
 
     async def __show_recruitment_ui(self):
@@ -225,8 +406,22 @@ class GameVoiceChannel:
         if self.recruitment_ui_message is not None:
             await self.__delete_recruitment_ui()
 
+        if self.setting.single_panel:
+            await self.__show_panel("recruitment", *await RecruitmentUI.build_edit_recruitment_message(self.setting, self.current_setting, self.owner, self.__get_recruitment_callbacks(), self.__update_panel_embed))
+            return
+
+        self.recruitment_ui_message = await self.__send_ui(*await RecruitmentUI.build_edit_recruitment_message(self.setting, self.current_setting, self.owner, self.__get_recruitment_callbacks(), self.__update_recruitment_ui_embed))
+
+    def __get_recruitment_callbacks(self) -> RecruimentUICallbacks:
         async def start_recruitment_callback(interaction : discord.Interaction, live_settings: ChannelLiveSetting):
-            await self.update_current_setting(live_settings)
+            await self.__run_in_order(lambda: start_recruitment(interaction, live_settings))
+
+        async def start_recruitment(interaction : discord.Interaction, live_settings: ChannelLiveSetting):
+            if self.setting.single_panel:
+                # the panel switches to the management UI only after the recruitment is posted
+                self.current_setting = live_settings
+            else:
+                await self.update_current_setting(live_settings)
             result = await self.__send_recruitment_message()
 
             try:
@@ -235,20 +430,25 @@ class GameVoiceChannel:
                 pass
 
             if result[0]:
-                await self.__delete_recruitment_ui()
+                if self.setting.single_panel:
+                    await self.__show_management_ui()
+                else:
+                    await self.__delete_recruitment_ui()
+
+        return RecruimentUICallbacks(start_recruitment_callback)
 
-        self.recruitment_ui_message = await RecruitmentUI.send_edit_recruitment_message(self.voice_channel, self.setting, self.current_setting, self.owner, RecruimentUICallbacks(start_recruitment_callback))
+    async def __update_recruitment_ui_embed(self, embed: discord.Embed):
+        if self.recruitment_ui_message is None:
+            return
+        message = self.recruitment_ui_message
+        await self.rest.request(RestPriority.INTERACTIVE, ("channel", self.vc_id), lambda: message.edit(embed=embed))
 
     async def update_current_setting(self, new_setting: ChannelLiveSetting):
         self.current_setting = new_setting
         await self.__show_management_ui()
 
     def count_players(self):
-        players = 0
-        for member in self.voice_channel.members:
-           if not NicknameUtils.is_spectator(member):
-               players += 1
-        return players
+        return self.roster.count_players()
 
     def get_max_players(self):
         if self.setting.can_edit_max_number:
@@ -272,13 +472,17 @@ class GameVoiceChannel:
                 return [False, "既にあなたが募集主です。"]
             return [False, "既に募集主が決定しています。"]
 
-        if self.no_owner_ui_message is None:
+        no_owner_ui_message = self.no_owner_ui_message
+        if self.setting.single_panel:
+            no_owner_ui_message = self.panel_message if self.panel_state == "no_owner" else None
+
+        if no_owner_ui_message is None:
             return [False, "現在は募集主変更のリクエストを受け付けていません。"]
 
-        if self.no_owner_ui_message.id != message.id:
+        if no_owner_ui_message.id != message.id:
             return [False, "無効なインタラクションです。"]
 
-        if not any(map(lambda m: m.id == owner.id, self.voice_channel.members)):
+        if owner.id not in self.roster:
             return [False, "VCのメンバーのみ募集主をリクエストできます。"]
 
         if self.owner is None:
@@ -294,25 +498,51 @@ class GameVoiceChannel:
             owner_id (int, optional): ID of the new owner
         """
         self.owner = owner
-        await self.clear_status()
-        await self.__delete_recruitment_message()
+        await self.plan_owner_transition(owner).execute()
+
+    def plan_owner_transition(self, owner: Optional[Member]) -> TransitionPlan:
+        """
+        Plan the REST actions needed to show the UI for the given owner.
+        Only the message order in the text chat is a dependency, everything else runs concurrently.
+        """
+        plan = TransitionPlan()
+        plan.add("clear_status", self.clear_status)
+        if self.recruitment_message is not None:
+            plan.add("delete_recruitment_message", self.__delete_recruitment_message)
+
         if owner is None:
-            await self.__show_no_owner_ui()
-            await self.__delete_management_ui()
-            await self.__delete_recruitment_ui()
-            
+            plan.add("show_no_owner_ui", self.__show_no_owner_ui)
+            if self.management_ui_message is not None:
+                plan.add("delete_management_ui", self.__delete_management_ui)
+            if self.recruitment_ui_message is not None:
+                plan.add("delete_recruitment_ui", self.__delete_recruitment_ui)
+
+        elif self.setting.single_panel:
+            # one edit of the panel replaces the management UI and the recruitment UI,
+            # so the panel waits for the owner to become a player as the management UI would
+            plan.add("ensure_owner_is_player", self.__ensure_owner_is_player)
+            plan.add("show_recruitment_ui", self.__show_recruitment_ui, depends_on=("ensure_owner_is_player",))
+
         else:
-            await self.__delete_no_owner_ui()
-            await self.__show_management_ui()
-            await self.__show_recruitment_ui()
+            if self.no_owner_ui_message is not None:
+                plan.add("delete_no_owner_ui", self.__delete_no_owner_ui)
+            plan.add("show_management_ui", self.__show_management_ui)
+            plan.add("show_recruitment_ui", self.__show_recruitment_ui, depends_on=("show_management_ui",))
+        return plan
 
     async def show_no_recruitment_ui(self):
+        if self.setting.single_panel:
+            if self.panel_state != "toggle" or self.panel_message is None:
+                await self.__show_panel("toggle", *ToggleUserStateUI.build_toggle_state_message(self.setting))
+            return
+
         await self.__delete_no_owner_ui()
         await self.__delete_recruitment_ui()
         await self.__delete_management_ui()
-        self.management_ui_message = await ToggleUserStateUI.send_toggle_state_message(self.voice_channel)
+        self.management_ui_message = await self.__send_ui(*ToggleUserStateUI.build_toggle_state_message(self.setting))
 
     async def on_left_member(self, member: Member) -> None:
+        self.roster.remove(member)
         if self.setting.recruitment_channel is None:
             #await self.show_no_recruitment_ui()
             pass
@@ -323,26 +553,182 @@ class GameVoiceChannel:
             await self.update_status()
 
     async def on_join_member(self, member: Member) -> None:
+        self.roster.add(member)
         if self.setting.recruitment_channel is None:
             await self.show_no_recruitment_ui()
         else:
             if self.owner is None:
-                if len(self.voice_channel.members) == 1:
+                if len(self.roster) == 1:
                     await self.set_owner(member)
                 else:
                     await self.__show_no_owner_ui()
 
             max_players = self.get_max_players()
             if max_players is None or self.count_players() <= max_players:
-                await NicknameUtils.change_to_player(member)
+                await SpectatorUtils.change_to_player(member, self.setting)
             else:
-                await NicknameUtils.change_to_spectator(member)
+                await SpectatorUtils.change_to_spectator(member, self.setting)
 
             await self.update_status()
 
-    async def on_update_member(self) -> None:
+    # Reconciliation
+
+    def needs_reconcile(self, members: list[Member]) -> bool:
+        """
+        Check whether the channel state differs from the given current members of the voice channel.
+        """
+        if len(members) == 0:
+            return False
+        if self.setting.recruitment_channel is None:
+            return self.management_ui_message is None and self.panel_message is None
+        if self.owner is not None:
+            return not any(m.id == self.owner.id for m in members)
+        if self.setting.single_panel:
+            return self.panel_state != "no_owner" or self.panel_message is None
+        return self.no_owner_ui_message is None
+
+    async def reconcile(self, members: list[Member]) -> None:
+        """
+        Apply the members that joined or left while the bot was not receiving events.
+        """
+        if not self.needs_reconcile(members):
+            return
+
+        if self.setting.recruitment_channel is None:
+            await self.show_no_recruitment_ui()
+            return
+
+        if self.owner is not None:
+            # the owner left while the bot was offline
+            await self.set_owner(None)
+        if len(members) == 1:
+            await self.set_owner(members[0])
+        elif self.owner is None:
+            await self.__show_no_owner_ui()
         await self.update_status()
 
+    # Lifecycle
+
+    async def teardown(self):
+        """
+        Delete all messages of the voice channel and release their views.
+        The object must not be used after this.
+        """
+        self.render_scheduler.cancel()
+        await self.plan_teardown().execute()
+
+        for view in self.views.values():
+            view.stop()
+        self.views.clear()
+        self.owner = None
+
+    def plan_teardown(self) -> TransitionPlan:
+        """
+        Plan the REST actions needed to delete all messages of the voice channel.
+        None of them depend on each other.
+        """
+        plan = TransitionPlan()
+        if self.recruitment_message is not None:
+            plan.add("delete_recruitment_message", self.__delete_recruitment_message)
+        if self.no_owner_ui_message is not None:
+            plan.add("delete_no_owner_ui", self.__delete_no_owner_ui)
+        if self.management_ui_message is not None:
+            plan.add("delete_management_ui", self.__delete_management_ui)
+        if self.recruitment_ui_message is not None:
+            plan.add("delete_recruitment_ui", self.__delete_recruitment_ui)
+        if self.panel_message is not None or self.panel_view is not None:
+            plan.add("delete_panel", self.__delete_panel)
+        return plan
 
+    # Snapshot
 
-        
\ No newline at end of file
+    def to_snapshot(self) -> dict:
+        """
+        Get the state that is needed to resume the voice channel after a restart.
+        """
+        def get_message_id(message: Optional[Message]):
+            return message.id if message is not None else None
+
+        return {
+            "owner": self.owner.id if self.owner is not None else None,
+            "no_owner_ui_message": get_message_id(self.no_owner_ui_message),
+            "management_ui_message": get_message_id(self.management_ui_message),
+            "recruitment_ui_message": get_message_id(self.recruitment_ui_message),
+            "panel_message": get_message_id(self.panel_message),
+            "panel_state": self.panel_state,
+            "recruitment_message": [self.recruitment_message.channel.id, self.recruitment_message.id] if self.recruitment_message is not None else None,
+            "current_setting": self.current_setting.to_dict() if self.current_setting is not None else None
+        }
+
+    @classmethod
+    def from_snapshot(cls, voice_channel: VoiceChannel, setting: ChannelSetting, data: dict, owner: Optional[Member]):
+        """
+        Create a GameVoiceChannel from a snapshot without sending anything.
+        The messages are restored as partial messages, so no REST call is needed.
+        """
+        game_voice_channel = cls(voice_channel, setting)
+        game_voice_channel.__restore_snapshot(data, owner)
+        return game_voice_channel
+
+    def __restore_snapshot(self, data: dict, owner: Optional[Member]):
+        def get_message(key: str):
+            message_id = data[key] if key in data else None
+            if isinstance(message_id, int):
+                return self.voice_channel.get_partial_message(message_id)
+            return None
+
+        self.owner = owner
+        self.no_owner_ui_message = get_message("no_owner_ui_message")
+        self.management_ui_message = get_message("management_ui_message")
+        self.recruitment_ui_message = get_message("recruitment_ui_message")
+        self.panel_message = get_message("panel_message")
+        self.panel_state = data["panel_state"] if isinstance(data.get("panel_state"), str) else None
+
+        recruitment_message = data.get("recruitment_message")
+        if isinstance(recruitment_message, list) and len(recruitment_message) == 2:
+            channel = ChannelCache(self.voice_channel.guild.shard_id).get(self.voice_channel.guild, recruitment_message[0])
+            if channel is not None:
+                self.recruitment_message = channel.get_partial_message(recruitment_message[1])
+
+        if isinstance(data.get("current_setting"), dict):
+            self.current_setting = ChannelLiveSetting.from_dict(data["current_setting"])
+
+    async def get_persistent_views(self) -> list[tuple[discord.ui.View, int]]:
+        """
+        Build the views of the restored messages, paired with their message IDs, for bot.add_view.
+        """
+        views: list[tuple[discord.ui.View, int]] = []
+        def track(view: discord.ui.View, message: Message):
+            self.views[message.id] = view
+            views.append((view, message.id))
+
+        if self.no_owner_ui_message is not None:
+            track(RecruitmentOwnerUI.build_owner_selection_message(self.__get_no_owner_callbacks())[1], self.no_owner_ui_message)
+
+        if self.management_ui_message is not None:
+            if self.setting.recruitment_channel is None:
+                track(ToggleUserStateUI.build_toggle_state_message(self.setting)[1], self.management_ui_message)
+            elif self.owner is not None:
+                track(ManagementUI.build_management_message(self.setting, self.current_setting, self.owner, self.__get_management_callbacks())[1], self.management_ui_message)
+
+        if self.recruitment_ui_message is not None and self.owner is not None:
+            track((await RecruitmentUI.build_edit_recruitment_message(self.setting, self.current_setting, self.owner, self.__get_recruitment_callbacks(), self.__update_recruitment_ui_embed))[1], self.recruitment_ui_message)
+
+        if self.panel_message is not None:
+            view: Optional[discord.ui.View] = None
+            if self.panel_state == "no_owner":
+                view = RecruitmentOwnerUI.build_owner_selection_message(self.__get_no_owner_callbacks())[1]
+            elif self.panel_state == "toggle":
+                view = ToggleUserStateUI.build_toggle_state_message(self.setting)[1]
+            elif self.panel_state == "management" and self.owner is not None:
+                view = ManagementUI.build_management_message(self.setting, self.current_setting, self.owner, self.__get_management_callbacks())[1]
+            elif self.panel_state == "recruitment" and self.owner is not None:
+                view = (await RecruitmentUI.build_edit_recruitment_message(self.setting, self.current_setting, self.owner, self.__get_recruitment_callbacks(), self.__update_panel_embed))[1]
+            if view is not None:
+                self.panel_view = view
+                views.append((view, self.panel_message.id))
+        return views
+
+    async def on_update_member(self, member: Member) -> None:
+        self.roster.update(member)
+        await self.update_status()
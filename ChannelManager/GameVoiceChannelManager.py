@@ -1,26 +1,60 @@
+import asyncio
 import discord
+from typing import Awaitable, Callable, Iterable, TypeVar
 from GameVoiceChannel import GameVoiceChannel
 from ChannelSettings import ChannelSetting, ChannelSettings
+from ChannelMailbox import ChannelMailbox
+from Metrics import Metrics
+from SpectatorRegistry import SpectatorRegistry
+from MemberResolver import MemberResolver
+from IngressFilter import IngressFilter
+
+T = TypeVar("T")
 
 class GameVoiceChannelManager:
     """
-    The class representing a singleton manager for game voice channels.
+    The class representing a singleton manager for game voice channels per shard.
+    Each shard has its own channels, mailboxes and metrics, so a busy shard never delays the others.
     """
 
-    _instance = None
+    _instances = {}
+    reconcile_workers = 8
+    # seconds a voice channel has to stay empty before its GameVoiceChannel is torn down
+    idle_ttl = 300.0
     
-    # getter for the singleton instance
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(GameVoiceChannelManager, cls).__new__(cls)
-            cls._instance._channels = {}  # VoiceChannelIDL[Ƃ}bv
-        return cls._instance
+    # getter for the singleton instance of the shard
+    def __new__(cls, shard_id: int = 0):
+        if shard_id not in cls._instances:
+            instance = super(GameVoiceChannelManager, cls).__new__(cls)
+            instance.shard_id = shard_id
+            instance.metrics = Metrics(shard_id)
+            instance._mailboxes = {}  # map of VoiceChannel ID to its pending events
+            instance._evictions = {}  # map of VoiceChannel ID to its scheduled teardown
+            SpectatorRegistry().add_listener(instance.__on_spectator_changed)
+            instance._channels = {}  # VoiceChannelIDL[Ƃ}bv
+            cls._instances[shard_id] = instance
+        return cls._instances[shard_id]
+
+    @classmethod
+    def for_guild(cls, guild: discord.Guild) -> "GameVoiceChannelManager":
+        """
+        Get the manager of the shard that receives the events of the guild.
+        """
+        return cls(guild.shard_id)
+
+    @classmethod
+    def shards(cls) -> list["GameVoiceChannelManager"]:
+        """
+        Get the managers of all shards that have been used, sorted by shard ID.
+        """
+        return [cls._instances[k] for k in sorted(cls._instances)]
     
     def __add_channel(self, game_voice_channel: GameVoiceChannel):
         """
         Add a GameVoiceChannel to the manager.
         """
         self._channels[game_voice_channel.vc_id] = game_voice_channel
+        self.metrics.set_gauge("channels_live", len(self._channels))
         return game_voice_channel
         
     def __get_channel(self, channel_id):
@@ -35,9 +69,90 @@ class GameVoiceChannelManager:
         """
         if game_voice_channel.vc_id in self._channels:
             del self._channels[game_voice_channel.vc_id]
+            self.metrics.set_gauge("channels_live", len(self._channels))
             return True
         return False
 
+    @staticmethod
+    def __is_empty(voice_channel: discord.VoiceChannel) -> bool:
+        return not any(not m.bot for m in voice_channel.members)
+
+    def __schedule_eviction(self, game_voice_channel: GameVoiceChannel):
+        """
+        Tear down the GameVoiceChannel after it has stayed empty for idle_ttl seconds.
+        """
+        vc_id = game_voice_channel.vc_id
+        if vc_id in self._evictions:
+            return
+
+        def evict():
+            self._evictions.pop(vc_id, None)
+            self.post_event(vc_id, lambda: self.__evict(game_voice_channel))
+        self._evictions[vc_id] = asyncio.get_running_loop().call_later(self.idle_ttl, evict)
+
+    def __cancel_eviction(self, channel_id: int):
+        handle = self._evictions.pop(channel_id, None)
+        if handle is not None:
+            handle.cancel()
+
+    async def __evict(self, game_voice_channel: GameVoiceChannel):
+        # a member may have joined after the eviction was scheduled
+        if self.__get_channel(game_voice_channel.vc_id) is not game_voice_channel:
+            return
+        if not self.__is_empty(game_voice_channel.voice_channel):
+            return
+
+        self.__remove_channel(game_voice_channel)
+        await game_voice_channel.teardown()
+        self.metrics.increment("channels_evicted")
+
+    def __on_spectator_changed(self, member: discord.Member):
+        # the role backend changes the spectator state without a nickname update event
+        if member.guild.shard_id != self.shard_id or member.voice is None or member.voice.channel is None:
+            return
+        game_voice_channel = self.__get_channel(member.voice.channel.id)
+        if game_voice_channel is not None:
+            self.post_event(game_voice_channel.vc_id, lambda: game_voice_channel.on_update_member(member))
+
+    def post_event(self, channel_id: int, job: Callable[[], Awaitable[None]]):
+        """
+        Queue an event handler of a voice channel.
+        Handlers of the same channel run in order, handlers of different channels run concurrently.
+        """
+        mailbox = self._mailboxes.get(channel_id)
+        if mailbox is None:
+            mailbox = ChannelMailbox(channel_id, self.__release_mailbox)
+            self._mailboxes[channel_id] = mailbox
+            self.metrics.set_gauge("mailboxes_live", len(self._mailboxes))
+        mailbox.post(job)
+
+    def run_event(self, channel_id: int, job: Callable[[], Awaitable[T]]) -> "asyncio.Future[T]":
+        """
+        Queue a handler like post_event, and get a future of its result.
+        UI callbacks run through it, so that they never race the voice channel events.
+        """
+        future = asyncio.get_running_loop().create_future()
+
+        async def run():
+            try:
+                result = await job()
+            except BaseException as e:
+                if not future.done():
+                    if isinstance(e, Exception):
+                        future.set_exception(e)
+                    else:
+                        future.cancel()
+                raise
+            if not future.done():
+                future.set_result(result)
+        self.post_event(channel_id, run)
+        return future
+
+    def __release_mailbox(self, mailbox: ChannelMailbox):
+        if self._mailboxes.get(mailbox.channel_id) is mailbox:
+            del self._mailboxes[mailbox.channel_id]
+            self.metrics.set_gauge("mailboxes_live", len(self._mailboxes))
+
     async def on_left_member(self, member: discord.Member, voice_channel: discord.VoiceChannel):
         """
         Handle the event when a member leaves a voice channel.
@@ -47,17 +162,24 @@ class GameVoiceChannelManager:
             return
         
         await game_voice_channel.on_left_member(member)
+        if member.voice is None or not IngressFilter.is_managed(member.voice.channel):
+            # the spectator states are only kept for the members of managed voice channels
+            SpectatorRegistry().forget(member)
+
+        if self.__is_empty(voice_channel):
+            self.__schedule_eviction(game_voice_channel)
 
     async def on_join_member(self, member: discord.Member, voice_channel: discord.VoiceChannel):
         """
         Handle the event when a member joins a voice channel.
         """
+        self.__cancel_eviction(voice_channel.id)
         game_voice_channel = self.__get_channel(voice_channel.id)
         if game_voice_channel is None:
             if voice_channel.category is None:
                 return
 
-            setting = ChannelSettings().get_channel_setting(voice_channel.category.id)
+            setting = ChannelSettings().get_channel_setting(voice_channel.guild.id, voice_channel.category.id)
             if setting is None:
                 return
 
@@ -66,4 +188,113 @@ class GameVoiceChannelManager:
         await game_voice_channel.on_join_member(member)
 
     def get_channel(self, channel_id: int):
-        return self.__get_channel(channel_id)
\ No newline at end of file
+        return self.__get_channel(channel_id)
+
+    def get_guild_ids(self) -> set[int]:
+        """
+        Get the IDs of the guilds that have live voice channels.
+        """
+        return {game_voice_channel.voice_channel.guild.id for game_voice_channel in self._channels.values()}
+
+    async def reconcile(self, guilds: Iterable[discord.Guild]) -> int:
+        """
+        Diff the gateway voice states of all managed categories of the shard against the manager state,
+        and apply only the differences. At most reconcile_workers channels are applied at once.
+
+        Returns:
+            int: the number of voice channels that had differences
+        """
+        semaphore = asyncio.Semaphore(self.reconcile_workers)
+        jobs = []
+
+        def get_members(voice_channel: discord.VoiceChannel):
+            return [m for m in voice_channel.members if not m.bot]
+
+        def make_job(voice_channel: discord.VoiceChannel, setting: ChannelSetting, done: asyncio.Future):
+            async def job():
+                try:
+                    async with semaphore:
+                        game_voice_channel = self.__get_channel(voice_channel.id)
+                        if game_voice_channel is None:
+                            game_voice_channel = self.__add_channel(GameVoiceChannel(voice_channel, setting))
+                        # the members are read again, since events may have been handled in the meantime
+                        await game_voice_channel.reconcile(get_members(voice_channel))
+                        if self.__is_empty(voice_channel):
+                            self.__schedule_eviction(game_voice_channel)
+                finally:
+                    done.set_result(None)
+            return job
+
+        for guild in guilds:
+            if guild.shard_id != self.shard_id:
+                continue
+            for category in guild.categories:
+                setting = ChannelSettings().get_channel_setting(guild.id, category.id)
+                if setting is None:
+                    continue
+                for voice_channel in category.voice_channels:
+                    members = get_members(voice_channel)
+                    game_voice_channel = self.__get_channel(voice_channel.id)
+                    if game_voice_channel is None:
+                        if len(members) == 0:
+                            continue
+                    elif not game_voice_channel.roster.verify():
+                        # voice states and nicknames may have changed while the bot was not receiving events
+                        self.post_event(voice_channel.id, game_voice_channel.update_status)
+
+                    if game_voice_channel is not None and not game_voice_channel.needs_reconcile(members):
+                        if len(members) == 0:
+                            # restored channels that were left empty while the bot was offline
+                            self.__schedule_eviction(game_voice_channel)
+                        continue
+
+                    done = asyncio.get_running_loop().create_future()
+                    # run in the mailbox, so that live events of the channel keep their order
+                    self.post_event(voice_channel.id, make_job(voice_channel, setting, done))
+                    jobs.append(done)
+
+        await asyncio.gather(*jobs)
+        return len(jobs)
+
+    def to_snapshot(self) -> dict:
+        """
+        Get the state of all managed voice channels, keyed by the voice channel ID.
+        """
+        return {str(vc_id): game_voice_channel.to_snapshot() for vc_id, game_voice_channel in self._channels.items()}
+
+    async def restore(self, bot: discord.Client, data: dict) -> int:
+        """
+        Rehydrate the managed voice channels from a snapshot and register their views again.
+
+        Returns:
+            int: the number of restored voice channels
+        """
+        restored = 0
+        for key, value in data.items():
+            if not isinstance(value, dict):
+                continue
+            voice_channel = bot.get_channel(int(key))
+            if not isinstance(voice_channel, discord.VoiceChannel) or voice_channel.category is None:
+                continue
+            # the snapshot holds the channels of all shards
+            if voice_channel.guild.shard_id != self.shard_id:
+                continue
+            if self.__get_channel(voice_channel.id) is not None:
+                continue
+
+            setting = ChannelSettings().get_channel_setting(voice_channel.guild.id, voice_channel.category.id)
+            if setting is None:
+                continue
+
+            owner = None
+            if isinstance(value.get("owner"), int):
+                try:
+                    owner = await MemberResolver(self.shard_id).resolve(voice_channel.guild, value["owner"])
+                except Exception as e:
+                    print(f"The owner of the voice channel {voice_channel.id} was not found. {e}")
+
+            game_voice_channel = self.__add_channel(GameVoiceChannel.from_snapshot(voice_channel, setting, value, owner))
+            for view, message_id in await game_voice_channel.get_persistent_views():
+                bot.add_view(view, message_id=message_id)
+            restored += 1
+        return restored
\ No newline at end of file
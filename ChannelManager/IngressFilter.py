@@ -0,0 +1,77 @@
+from typing import Iterable, Optional
+import discord
+from ChannelSettings import ChannelSettings
+from Metrics import Metrics
+
+class IngressFilter:
+    """
+    The class representing a singleton per shard that drops gateway events which cannot affect a managed voice channel.
+    It keeps the IDs of the members in managed voice channels, so every check is a set lookup.
+    """
+
+    _instances = {}
+
+    def __new__(cls, shard_id: int = 0):
+        if shard_id not in cls._instances:
+            instance = super(IngressFilter, cls).__new__(cls)
+            instance.shard_id = shard_id
+            instance.metrics = Metrics(shard_id)
+            instance._voice_members = set()  # set of member IDs in managed voice channels
+            cls._instances[shard_id] = instance
+        return cls._instances[shard_id]
+
+    @staticmethod
+    def is_managed(channel: Optional[discord.abc.GuildChannel]) -> bool:
+        if channel is None or channel.category_id is None:
+            return False
+        # the first event of a configured guild loads its settings
+        return channel.category_id in ChannelSettings().get_all_channels(channel.guild.id)
+
+    def rebuild(self, guilds: Iterable[discord.Guild]):
+        """
+        Collect the members of all managed voice channels of the shard from the gateway cache.
+        """
+        voice_members = set()
+        for guild in guilds:
+            if guild.shard_id != self.shard_id:
+                continue
+            managed = ChannelSettings().get_all_channels(guild.id)
+            if len(managed) == 0:
+                continue
+            for category in guild.categories:
+                if category.id not in managed:
+                    continue
+                for voice_channel in category.voice_channels:
+                    voice_members.update(m.id for m in voice_channel.members if not m.bot)
+        self._voice_members = voice_members
+
+    def seed(self, guild: discord.Guild):
+        """
+        Add the members of all voice channels of a guild that has just been loaded.
+        The settings may not be migrated yet, so unmanaged voice channels are included until the next rebuild.
+        """
+        for voice_channel in guild.voice_channels:
+            self._voice_members.update(m.id for m in voice_channel.members if not m.bot)
+
+    def accept_voice_state(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState) -> bool:
+        """
+        Track the member and check whether the voice state update moved them into or out of a managed voice channel.
+        """
+        if before.channel == after.channel:
+            return self.__count(False)
+
+        if self.is_managed(after.channel):
+            self._voice_members.add(member.id)
+        else:
+            self._voice_members.discard(member.id)
+        return self.__count(self.is_managed(before.channel) or self.is_managed(after.channel))
+
+    def accept_member_update(self, member: discord.Member) -> bool:
+        """
+        Check whether the member is in a managed voice channel.
+        """
+        return self.__count(member.id in self._voice_members)
+
+    def __count(self, accepted: bool) -> bool:
+        self.metrics.increment("ingress_handled" if accepted else "ingress_filtered")
+        return accepted
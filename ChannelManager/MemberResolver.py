@@ -0,0 +1,49 @@
+import time
+from collections import OrderedDict
+import discord
+from Metrics import Metrics
+
+class MemberResolver:
+    """
+    The class representing a singleton per shard that resolves member IDs to members.
+    The gateway cache is used first, and members fetched over REST are kept in a small LRU for rest_ttl seconds,
+    because the lean member cache only holds the members in voice channels.
+    """
+
+    _instances = {}
+    capacity = 256
+    rest_ttl = 300.0
+
+    def __new__(cls, shard_id: int = 0):
+        if shard_id not in cls._instances:
+            instance = super(MemberResolver, cls).__new__(cls)
+            instance.metrics = Metrics(shard_id)
+            instance._fetched = OrderedDict()  # map of (guild ID, member ID) to (member, expiration time), least recently used first
+            cls._instances[shard_id] = instance
+        return cls._instances[shard_id]
+
+    async def resolve(self, guild: discord.Guild, member_id: int) -> discord.Member:
+        """
+        Get a member, fetching them over REST only if they are not cached.
+        Raises the same errors as discord.Guild.fetch_member.
+        """
+        member = guild.get_member(member_id)
+        if member is not None:
+            self.metrics.increment("member_cache_gateway_hits")
+            return member
+
+        key = (guild.id, member_id)
+        entry = self._fetched.get(key)
+        if entry is not None:
+            if entry[1] > time.monotonic():
+                self._fetched.move_to_end(key)
+                self.metrics.increment("member_cache_lru_hits")
+                return entry[0]
+            del self._fetched[key]
+
+        self.metrics.increment("member_cache_misses")
+        member = await guild.fetch_member(member_id)
+        self._fetched[key] = (member, time.monotonic() + self.rest_ttl)
+        if len(self._fetched) > self.capacity:
+            self._fetched.popitem(last=False)
+        return member
@@ -0,0 +1,48 @@
+from typing import Optional
+
+class Metrics:
+    """
+    The class representing a singleton per shard that collects counters and gauges of the bot.
+    Metrics() holds the totals of the process, and the values of Metrics(shard_id) are added to it.
+    """
+
+    _instances = {}
+
+    def __new__(cls, shard_id: Optional[int] = None):
+        if shard_id not in cls._instances:
+            instance = super(Metrics, cls).__new__(cls)
+            instance.shard_id = shard_id
+            instance._counters = {}
+            instance._gauges = {}
+            cls._instances[shard_id] = instance
+        return cls._instances[shard_id]
+
+    @classmethod
+    def shards(cls) -> dict[int, "Metrics"]:
+        """
+        Get the metrics of every shard that has recorded anything, sorted by shard ID.
+        """
+        return {k: cls._instances[k] for k in sorted(k for k in cls._instances if k is not None)}
+
+    def increment(self, name: str, amount: int = 1):
+        self._counters[name] = self._counters.get(name, 0) + amount
+        if self.shard_id is not None:
+            Metrics().increment(name, amount)
+
+    def set_gauge(self, name: str, value: int):
+        if self.shard_id is not None:
+            total = Metrics()
+            total.set_gauge(name, total._gauges.get(name, 0) + value - self._gauges.get(name, 0))
+        self._gauges[name] = value
+
+    def get(self, name: str) -> int:
+        if name in self._gauges:
+            return self._gauges[name]
+        return self._counters.get(name, 0)
+
+    def snapshot(self) -> dict[str, int]:
+        """
+        Get a copy of all counters and gauges, sorted by name.
+        """
+        values = {**self._counters, **self._gauges}
+        return {k: values[k] for k in sorted(values)}
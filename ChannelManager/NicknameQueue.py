@@ -0,0 +1,119 @@
+import asyncio
+from typing import Optional
+from discord import Member
+from Metrics import Metrics
+from RestScheduler import RestPriority, RestScheduler
+
+class PendingNick:
+    """
+    The class representing the nickname a member will have once the queued edit is written.
+    """
+
+    def __init__(self, member: Member, nick: Optional[str], future: asyncio.Future):
+        self.member = member
+        self.nick = nick
+        self.future = future
+
+class NicknameQueue:
+    """
+    The class representing a singleton per shard that queues nickname edits per member.
+    Edits of a member that are not written yet are collapsed into the last one,
+    and an edit is dropped if it would leave the nickname unchanged.
+    The edits are paced by the member route of the REST scheduler.
+    """
+
+    _instances = {}
+
+    def __new__(cls, shard_id: int = 0):
+        if shard_id not in cls._instances:
+            instance = super(NicknameQueue, cls).__new__(cls)
+            instance.shard_id = shard_id
+            instance._pending = {}  # map of (guild ID, member ID) to PendingNick
+            instance._writers = {}  # map of (guild ID, member ID) to the task writing its edits
+            cls._instances[shard_id] = instance
+        return cls._instances[shard_id]
+
+    @staticmethod
+    def __get_current_nick(member: Member) -> Optional[str]:
+        # interaction users are not the cached members, so their nickname may be outdated
+        cached = member.guild.get_member(member.id)
+        return cached.nick if cached is not None else member.nick
+
+    def get_nick(self, member: Member) -> Optional[str]:
+        """
+        Get the nickname of a member including the edit that is still queued.
+        """
+        pending = self._pending.get((member.guild.id, member.id))
+        if pending is not None:
+            return pending.nick
+        return self.__get_current_nick(member)
+
+    async def set_nick(self, member: Member, nick: Optional[str]) -> bool:
+        """
+        Queue a nickname edit of a member.
+
+        Parameters:
+            member (Member): the member whose nickname is changed
+            nick (str, optional): the new nickname, or None to remove it
+        Returns:
+            bool: whether the nickname was written, False if the edit was collapsed or dropped
+        """
+        key = (member.guild.id, member.id)
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.get(key)
+
+        if pending is not None:
+            # the queued edit has not started, so only the last nickname is written
+            if not pending.future.done():
+                pending.future.set_result(False)
+            Metrics(member.guild.shard_id).increment("nickname_edits_coalesced")
+            pending.member = member
+            pending.nick = nick
+            pending.future = future
+        else:
+            if key not in self._writers and nick == self.__get_current_nick(member):
+                Metrics(member.guild.shard_id).increment("nickname_edits_dropped")
+                return False
+            self._pending[key] = PendingNick(member, nick, future)
+            if key not in self._writers:
+                self._writers[key] = asyncio.create_task(self.__write(key))
+
+        return await future
+
+    async def __write(self, key: tuple[int, int]):
+        """
+        Write the queued edits of a member one by one, so that they are never reordered.
+        """
+        # the member cache is updated by the gateway later, so the nickname written last is kept here
+        written: list[Optional[str]] = []
+        try:
+            while key in self._pending:
+                await self.__write_once(key, written)
+        finally:
+            del self._writers[key]
+
+    async def __write_once(self, key: tuple[int, int], written: list[Optional[str]]):
+        taken: list[PendingNick] = []
+
+        async def call() -> bool:
+            # edits requested from here on are queued again, since this one can no longer change
+            pending = self._pending.pop(key)
+            taken.append(pending)
+            current = written[-1] if len(written) > 0 else self.__get_current_nick(pending.member)
+            if pending.nick == current:
+                Metrics(pending.member.guild.shard_id).increment("nickname_edits_dropped")
+                return False
+            await pending.member.edit(nick=pending.nick)
+            written.append(pending.nick)
+            Metrics(pending.member.guild.shard_id).increment("nickname_edits_sent")
+            return True
+
+        try:
+            result = await RestScheduler(self.shard_id).request(RestPriority.NICKNAME, ("member", key[0]), call)
+        except Exception as e:
+            pending = taken[0] if len(taken) > 0 else self._pending.pop(key)
+            if not pending.future.done():
+                pending.future.set_exception(e)
+            return
+        if not taken[0].future.done():
+            taken[0].future.set_result(result)
@@ -1,5 +1,6 @@
-﻿from typing import Tuple
+﻿from typing import Optional, Tuple
 from discord import Member
+from NicknameQueue import NicknameQueue
 
 spectator_prefix = "👀観戦＠"
 old_spectator_prefix = "観戦"
@@ -14,6 +15,13 @@ def is_spectator(member: Member):
         return True
     return False
 
+async def edit_nick(member: Member, nick: Optional[str]):
+    """
+    Change the nickname of a member through the nickname queue.
+    Edits that are still queued are replaced, so only the net effect is written.
+    """
+    await NicknameQueue(member.guild.shard_id).set_nick(member, nick)
+
 async def change_to_spectator(member: Member) -> Tuple[bool, str]:
     """
     Change the nickname of a member to a spectator format.
@@ -23,19 +31,21 @@ async def change_to_spectator(member: Member) -> Tuple[bool, str]:
     """
 
     try:
-        if member.nick is None:
-            await member.edit(nick=spectator_prefix + member.name)
+        # the queued nickname is used, so that a toggle cancels an edit that is not written yet
+        current_nick = NicknameQueue(member.guild.shard_id).get_nick(member)
+        if current_nick is None:
+            await edit_nick(member, spectator_prefix + member.name)
             return [True, "名前を変更しました。"]
 
-        if member.nick.startswith(spectator_prefix):
-            if member.nick.startswith(old_spectator_prefix):
-                await member.edit(nick=member.nick[len(old_spectator_prefix):])
+        if current_nick.startswith(spectator_prefix):
+            if current_nick.startswith(old_spectator_prefix):
+                await edit_nick(member, current_nick[len(old_spectator_prefix):])
             return [False, "既に観戦者になっています。"]
 
-        old_nick = member.nick
+        old_nick = current_nick
         if old_nick.startswith(old_spectator_prefix):
             old_nick = old_nick[len(old_spectator_prefix):]
-        await member.edit(nick=spectator_prefix + old_nick)
+        await edit_nick(member, spectator_prefix + old_nick)
         return [True, "名前を変更しました。"]
     except Exception as e:
         return [False, "名前を変更できませんでした。\nサーバープロフィールを編集し、自身のニックネームの先頭に「" + spectator_prefix +"」を付けてください。"]
@@ -43,20 +53,21 @@ async def change_to_spectator(member: Member) -> Tuple[bool, str]:
 
 async def change_to_player(member: Member) -> Tuple[bool, str]:
     try:
-        if member.nick is None:
+        current_nick = NicknameQueue(member.guild.shard_id).get_nick(member)
+        if current_nick is None:
             return [False, "既に参加者になっています。"]
 
-        nick = member.nick
+        nick = current_nick
         if nick is not None:
             while nick.startswith(spectator_prefix):
                 nick = nick[len(spectator_prefix):]
             if len(nick) == 0 or nick == member.name:
                 nick = None
 
-        if nick == member.nick:
+        if nick == current_nick:
             return [False, "既に参加者になっています。"]
 
-        await member.edit(nick=nick if len(nick) > 0 else None)
+        await edit_nick(member, nick)
         return [True, "名前を変更しました。"]
     except Exception as e:
         return [False, "名前を変更できませんでした。\nサーバープロフィールを編集し、自身のニックネームの先頭から「" + spectator_prefix + "」を取り除いてください。"]
\ No newline at end of file
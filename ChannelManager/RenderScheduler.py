@@ -0,0 +1,50 @@
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+class RenderScheduler:
+    """
+    The class representing a debounced renderer for a single voice channel.
+    Requests are coalesced so that at most one render runs per interval,
+    and a request made while rendering always triggers one more render.
+    """
+
+    __slots__ = ("render", "interval", "__dirty", "__task")
+
+    def __init__(self, render: Callable[[], Awaitable[None]], interval: float):
+        """
+        The constructor for RenderScheduler class.
+
+        Parameters:
+            render (Callable[[], Awaitable[None]]): coroutine function that writes the current state
+            interval (float): minimum seconds between two renders
+        """
+        self.render = render
+        self.interval = interval
+        self.__dirty = False
+        self.__task: Optional[asyncio.Task] = None
+
+    def mark_dirty(self):
+        """
+        Request a render. The render is flushed at the end of the current window.
+        """
+        self.__dirty = True
+        if self.__task is None or self.__task.done():
+            self.__task = asyncio.get_running_loop().create_task(self.__run())
+
+    def cancel(self):
+        """
+        Drop any pending render.
+        """
+        self.__dirty = False
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
+
+    async def __run(self):
+        while self.__dirty:
+            await asyncio.sleep(self.interval)
+            self.__dirty = False
+            try:
+                await self.render()
+            except Exception as e:
+                print(f"An error occurred while rendering the channel status: {e}")
@@ -0,0 +1,166 @@
+import asyncio
+import heapq
+import itertools
+import time
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Hashable, Optional
+from Metrics import Metrics
+
+class RestPriority(IntEnum):
+    """
+    Priority classes of outbound REST requests. Smaller values run first.
+    """
+    INTERACTIVE = 0  # interaction responses and owner panels
+    NICKNAME = 1     # nickname edits
+    BACKGROUND = 2   # status and embed refreshes
+
+class RouteBucket:
+    """
+    The class representing a token bucket that paces requests of a single route.
+    """
+
+    def __init__(self, capacity: int, per_second: float):
+        self.capacity = capacity
+        self.per_second = per_second
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def wait_time(self, reserved: float, now: float) -> float:
+        """
+        Get the seconds until a request can be taken while leaving `reserved` tokens in the bucket.
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.per_second)
+        self.updated = now
+        needed = reserved + 1 - self.tokens
+        return needed / self.per_second if needed > 0 else 0
+
+    def take(self):
+        self.tokens -= 1
+
+class RestScheduler:
+    """
+    The class representing a singleton per shard that schedules outbound REST requests by priority.
+    Lower priorities leave part of every route bucket unused, so that they are delayed before they can delay interactive requests.
+    The running requests are limited per route, so a slow route never holds up the others,
+    and interactive requests never wait for a running slot.
+    """
+
+    _instances = {}
+    bucket_capacity = 5
+    bucket_per_second = 1.0
+    # interactive requests have to start within this many seconds
+    interaction_deadline = 3.0
+    # tokens of each route bucket that a priority must leave for higher ones
+    reserved_tokens = {RestPriority.INTERACTIVE: 0, RestPriority.NICKNAME: 1, RestPriority.BACKGROUND: 2}
+    # requests of lower priorities that may run at the same time per route, interactive requests are not limited
+    route_concurrency = {RestPriority.NICKNAME: 2, RestPriority.BACKGROUND: 1}
+
+    def __new__(cls, shard_id: int = 0):
+        if shard_id not in cls._instances:
+            instance = super(RestScheduler, cls).__new__(cls)
+            instance.metrics = Metrics(shard_id)
+            instance._queue = []
+            instance._buckets = {}
+            instance._order = itertools.count()
+            instance._running = {}  # map of route to the number of running requests of lower priorities
+            instance._tasks = set()
+            instance._wakeup = None
+            instance._dispatcher = None
+            cls._instances[shard_id] = instance
+        return cls._instances[shard_id]
+
+    async def request(self, priority: RestPriority, route: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run a REST request when its priority and its route allow it.
+
+        Parameters:
+            priority (RestPriority): priority class of the request
+            route (Hashable): key of the rate limit bucket, e.g. ("channel", channel_id)
+            call (Callable[[], Awaitable[Any]]): coroutine function that performs the request
+        Returns:
+            Any: the result of the request
+        """
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._order), time.monotonic(), route, call, future))
+        self.metrics.increment(f"rest_queued_{priority.name.lower()}")
+        self.__wake()
+        return await future
+
+    def __wake(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.get_running_loop().create_task(self.__dispatch())
+        self._wakeup.set()
+
+    def __get_bucket(self, route: Hashable) -> RouteBucket:
+        bucket = self._buckets.get(route)
+        if bucket is None:
+            bucket = RouteBucket(self.bucket_capacity, self.bucket_per_second)
+            self._buckets[route] = bucket
+        return bucket
+
+    async def __dispatch(self):
+        while True:
+            self._wakeup.clear()
+            delay = self.__start_runnable()
+            self.metrics.set_gauge("rest_queue_length", len(self._queue))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def __start_runnable(self) -> Optional[float]:
+        """
+        Start every queued request that may run now, highest priority first.
+        Returns the seconds until the earliest blocked request may run, or None to wait for a wakeup.
+        """
+        now = time.monotonic()
+        delay: Optional[float] = None
+        waiting = []
+        for entry in sorted(self._queue):
+            priority, _, queued_at, route, call, future = entry
+            if future.done():
+                continue
+            limited = priority != RestPriority.INTERACTIVE
+            if limited and self._running.get(route, 0) >= self.route_concurrency[priority]:
+                waiting.append(entry)
+                continue
+            bucket = self.__get_bucket(route)
+            wait = bucket.wait_time(self.reserved_tokens[priority], now)
+            if wait > 0:
+                delay = wait if delay is None else min(delay, wait)
+                waiting.append(entry)
+                continue
+
+            bucket.take()
+            if priority == RestPriority.INTERACTIVE and now - queued_at > self.interaction_deadline:
+                self.metrics.increment("rest_deadline_missed")
+            if limited:
+                self._running[route] = self._running.get(route, 0) + 1
+            task = asyncio.get_running_loop().create_task(self.__run(route if limited else None, call, future))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        heapq.heapify(waiting)
+        self._queue = waiting
+        return delay
+
+    async def __run(self, route: Optional[Hashable], call: Callable[[], Awaitable[Any]], future: asyncio.Future):
+        try:
+            result = await call()
+            if not future.done():
+                future.set_result(result)
+        except asyncio.CancelledError:
+            # the caller must not wait forever for a request that never finishes
+            if not future.done():
+                future.cancel()
+            raise
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        finally:
+            if route is not None:
+                self._running[route] -= 1
+                if self._running[route] == 0:
+                    del self._running[route]
+            self._wakeup.set()
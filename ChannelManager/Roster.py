@@ -0,0 +1,99 @@
+from typing import Callable
+from discord import Member, VoiceChannel
+from Metrics import Metrics
+
+class Roster:
+    """
+    The class representing an index of the members in a voice channel, split into players and spectators.
+    It is updated from the voice state and member update events, so counts and membership checks never scan the member list.
+    Bot members are not indexed, since their events are ignored.
+    """
+
+    __slots__ = ("voice_channel", "__is_spectator", "players", "spectators")
+
+    # compare the index with the gateway cache after every update, and rebuild it on a mismatch
+    self_check = False
+
+    def __init__(self, voice_channel: VoiceChannel, is_spectator: Callable[[Member], bool]):
+        """
+        The constructor for Roster class.
+
+        Parameters:
+            voice_channel (discord.VoiceChannel): the voice channel whose members are indexed
+            is_spectator (Callable[[Member], bool]): function that tells the spectator state of a member
+        """
+        self.voice_channel = voice_channel
+        self.__is_spectator = is_spectator
+        self.players: set[int] = set()
+        self.spectators: set[int] = set()
+        self.rebuild()
+
+    def __len__(self) -> int:
+        return len(self.players) + len(self.spectators)
+
+    def __contains__(self, member_id: int) -> bool:
+        return member_id in self.players or member_id in self.spectators
+
+    def count_players(self) -> int:
+        return len(self.players)
+
+    def is_spectator(self, member_id: int) -> bool:
+        return member_id in self.spectators
+
+    def rebuild(self):
+        """
+        Build the index again from the gateway cache.
+        """
+        self.players.clear()
+        self.spectators.clear()
+        for member in self.voice_channel.members:
+            if not member.bot:
+                self.__put(member)
+
+    def add(self, member: Member):
+        self.__put(member)
+        self.__check()
+
+    def remove(self, member: Member):
+        self.players.discard(member.id)
+        self.spectators.discard(member.id)
+        self.__check()
+
+    def update(self, member: Member):
+        """
+        Move the member between players and spectators after their spectator state has changed.
+        """
+        if member.id in self:
+            self.__put(member)
+        self.__check()
+
+    def __put(self, member: Member):
+        if self.__is_spectator(member):
+            self.players.discard(member.id)
+            self.spectators.add(member.id)
+        else:
+            self.spectators.discard(member.id)
+            self.players.add(member.id)
+
+    def __check(self):
+        if self.self_check:
+            self.verify()
+
+    def verify(self) -> bool:
+        """
+        Verify the index against the gateway cache. The index is rebuilt if they differ.
+
+        Returns:
+            bool: whether the index matched the gateway cache
+        """
+        members = [m for m in self.voice_channel.members if not m.bot]
+        spectators = {m.id for m in members if self.__is_spectator(m)}
+        players = {m.id for m in members} - spectators
+        if players == self.players and spectators == self.spectators:
+            return True
+
+        print(f"The roster of {self.voice_channel.id} differs from the cache. players: {sorted(self.players ^ players)}, spectators: {sorted(self.spectators ^ spectators)}")
+        Metrics(self.voice_channel.guild.shard_id).increment("roster_mismatches")
+        self.players = players
+        self.spectators = spectators
+        return False
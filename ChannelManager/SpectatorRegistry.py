@@ -0,0 +1,80 @@
+from typing import Callable
+import discord
+from discord import Member
+from RestScheduler import RestPriority, RestScheduler
+
+class SpectatorRegistry:
+    """
+    The class representing a singleton that tracks spectators of categories using the role backend.
+    The registry is the source of truth and the spectator role only mirrors it,
+    so a state change never has to wait for the role edit.
+    Each spectator role has its own state, and the states of a member are forgotten when they leave the managed voice channels.
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(SpectatorRegistry, cls).__new__(cls)
+            cls._instance._states = {}  # map of (guild ID, member ID) to a map of role ID to whether the member is a spectator
+            cls._instance._listeners = []
+        return cls._instance
+
+    def add_listener(self, listener: Callable[[Member], None]):
+        """
+        Add a function that is called with the member whenever their spectator state changes.
+        """
+        self._listeners.append(listener)
+
+    def is_spectator(self, member: Member, role_id: int) -> bool:
+        states = self._states.setdefault((member.guild.id, member.id), {})
+        if role_id not in states:
+            # the role of a member seen for the first time restores the state after a restart
+            states[role_id] = member.get_role(role_id) is not None
+        return states[role_id]
+
+    def forget(self, member: Member):
+        """
+        Drop the states of a member, which are restored from their roles when they are seen again.
+        """
+        self._states.pop((member.guild.id, member.id), None)
+
+    def on_member_update(self, before: Member, after: Member):
+        """
+        Follow the spectator roles that have been added or removed by someone else.
+        """
+        states = self._states.get((after.guild.id, after.id))
+        if states is None:
+            return
+        changed = False
+        for role_id, spectator in states.items():
+            has_role = after.get_role(role_id) is not None
+            if has_role != (before.get_role(role_id) is not None) and has_role != spectator:
+                states[role_id] = has_role
+                changed = True
+        if changed:
+            for listener in self._listeners:
+                listener(after)
+
+    async def set_spectator(self, member: Member, role_id: int, spectator: bool) -> bool:
+        """
+        Change the spectator state of a member and mirror it to the role.
+
+        Returns:
+            bool: whether the state has changed
+        """
+        if self.is_spectator(member, role_id) == spectator:
+            return False
+
+        self._states[(member.guild.id, member.id)][role_id] = spectator
+        for listener in self._listeners:
+            listener(member)
+
+        role = discord.Object(role_id)
+        call = (lambda: member.add_roles(role)) if spectator else (lambda: member.remove_roles(role))
+        try:
+            await RestScheduler(member.guild.shard_id).request(RestPriority.NICKNAME, ("member", member.guild.id), call)
+        except Exception as e:
+            # the role is only a mirror, so the state stays changed
+            print(f"Failed to mirror the spectator role of {member.id}. {e}")
+        return True
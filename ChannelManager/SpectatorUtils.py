@@ -0,0 +1,41 @@
+from typing import Optional, Tuple
+from discord import Member
+from ChannelSettings import ChannelSetting
+from SpectatorRegistry import SpectatorRegistry
+import NicknameUtils
+
+def get_spectator_role(setting: Optional[ChannelSetting]) -> Optional[int]:
+    """
+    Get the spectator role of the category, or None if the nickname backend is used.
+    """
+    if setting is None or setting.spectator_backend != "role":
+        return None
+    return setting.spectator_role
+
+def is_spectator(member: Member, setting: Optional[ChannelSetting]) -> bool:
+    if member is None:
+        return False
+
+    role_id = get_spectator_role(setting)
+    if role_id is None:
+        return NicknameUtils.is_spectator(member)
+
+    return SpectatorRegistry().is_spectator(member, role_id)
+
+async def change_to_spectator(member: Member, setting: Optional[ChannelSetting]) -> Tuple[bool, str]:
+    role_id = get_spectator_role(setting)
+    if role_id is None:
+        return await NicknameUtils.change_to_spectator(member)
+
+    if not await SpectatorRegistry().set_spectator(member, role_id, True):
+        return [False, "既に観戦者になっています。"]
+    return [True, "観戦者に変更しました。"]
+
+async def change_to_player(member: Member, setting: Optional[ChannelSetting]) -> Tuple[bool, str]:
+    role_id = get_spectator_role(setting)
+    if role_id is None:
+        return await NicknameUtils.change_to_player(member)
+
+    if not await SpectatorRegistry().set_spectator(member, role_id, False):
+        return [False, "既に参加者になっています。"]
+    return [True, "参加者に変更しました。"]
@@ -0,0 +1,68 @@
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+class PlannedAction:
+    """
+    The class representing a single step of a transition plan.
+    """
+
+    def __init__(self, name: str, run: Callable[[], Awaitable[None]], depends_on: tuple[str, ...]):
+        self.name = name
+        self.run = run
+        self.depends_on = depends_on
+
+class TransitionPlan:
+    """
+    The class representing a set of actions with explicit dependencies.
+    Actions that do not depend on each other run concurrently, up to max_concurrency at a time.
+    """
+
+    max_concurrency = 3
+
+    def __init__(self):
+        self.actions: dict[str, PlannedAction] = {}
+
+    def add(self, name: str, run: Callable[[], Awaitable[None]], depends_on: tuple[str, ...] = ()) -> "TransitionPlan":
+        """
+        Add an action to the plan. Dependencies have to be added before the action that depends on them.
+
+        Parameters:
+            name (str): unique name of the action
+            run (Callable[[], Awaitable[None]]): coroutine function that performs the action
+            depends_on (tuple[str, ...]): names of the actions that have to finish first
+        """
+        if name in self.actions:
+            raise ValueError(f"The action \"{name}\" is already planned.")
+        for dependency in depends_on:
+            if dependency not in self.actions:
+                raise ValueError(f"The action \"{name}\" depends on the unknown action \"{dependency}\".")
+        self.actions[name] = PlannedAction(name, run, depends_on)
+        return self
+
+    def names(self) -> list[str]:
+        return list(self.actions.keys())
+
+    def dependencies(self, name: str) -> tuple[str, ...]:
+        return self.actions[name].depends_on
+
+    async def execute(self, max_concurrency: Optional[int] = None):
+        """
+        Run all actions. A failed action is reported and does not stop the actions that depend on it,
+        since dependencies only describe the order in which the actions have to be seen.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or self.max_concurrency)
+        tasks: dict[str, asyncio.Task] = {}
+
+        async def run_action(action: PlannedAction):
+            for dependency in action.depends_on:
+                await asyncio.gather(tasks[dependency], return_exceptions=True)
+            async with semaphore:
+                try:
+                    await action.run()
+                except Exception as e:
+                    print(f"An error occurred while running the action \"{action.name}\": {e}")
+
+        # dependencies are always added first, so their tasks exist before the dependent ones
+        for action in self.actions.values():
+            tasks[action.name] = asyncio.get_running_loop().create_task(run_action(action))
+        await asyncio.gather(*tasks.values())
@@ -0,0 +1,73 @@
+"""
+Compare the memory of the default member cache with the lean member cache on a synthetic large guild.
+
+Usage: python benchmarks/member_cache_benchmark.py [members] [members_in_voice]
+"""
+import gc
+import sys
+import tracemalloc
+import discord
+
+def build_guild_payload(members: int, members_in_voice: int, voice_channels: int = 50) -> dict:
+    channels = [{"id": str(1000 + i), "type": 2, "name": f"VC{i}", "position": i, "permission_overwrites": [], "bitrate": 64000, "user_limit": 0} for i in range(voice_channels)]
+    member_payloads = [{
+        "user": {"id": str(10**17 + i), "username": f"user{i}", "discriminator": "0", "avatar": None, "global_name": f"User {i}"},
+        "roles": [],
+        "joined_at": "2024-01-01T00:00:00+00:00",
+        "nick": None,
+        "deaf": False,
+        "mute": False,
+        "flags": 0
+    } for i in range(members)]
+    voice_states = [{
+        "user_id": str(10**17 + i),
+        "channel_id": str(1000 + i % voice_channels),
+        "session_id": f"session{i}",
+        "deaf": False, "mute": False, "self_deaf": False, "self_mute": False, "self_video": False, "suppress": False
+    } for i in range(members_in_voice)]
+    return {
+        "id": "1", "name": "synthetic", "member_count": members, "roles": [], "emojis": [], "stickers": [], "features": [],
+        "channels": channels, "voice_states": voice_states, "members": member_payloads
+    }
+
+def measure(member_cache_flags: discord.MemberCacheFlags, payload: dict) -> tuple[int, int]:
+    """
+    Returns:
+        tuple[int, int]: the number of cached members and the bytes held by the guild
+    """
+    intents = discord.Intents.default()
+    intents.members = True
+    intents.voice_states = True
+    client = discord.Client(intents=intents, member_cache_flags=member_cache_flags)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    guild = discord.Guild(data=payload, state=client._connection)
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return len(guild.members), size
+
+def main():
+    members = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    members_in_voice = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    # the default mode receives every member through chunking, the lean mode only through voice states
+    payload = build_guild_payload(members, members_in_voice)
+
+    default_flags = discord.MemberCacheFlags.from_intents(discord.Intents.default() | discord.Intents(members=True))
+    lean_flags = discord.MemberCacheFlags.none()
+    lean_flags.voice = True
+
+    print(f"{members} members, {members_in_voice} in voice")
+    results = {}
+    for name, flags in (("default", default_flags), ("lean", lean_flags)):
+        cached, size = measure(flags, payload)
+        results[name] = size
+        print(f"{name:>8}: {cached:>7} cached members, {size / 1024 / 1024:8.2f} MiB")
+    print(f"lean mode uses {results['lean'] / results['default']:.1%} of the default memory")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Measure the memory held per configured category and per tracked voice channel.
+
+Usage: python benchmarks/settings_memory_benchmark.py [entries...]
+"""
+import gc
+import os
+import sys
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ChannelSettings import ChannelLiveSetting, ChannelSetting, GuildSettings
+from GameVoiceChannel import GameVoiceChannel
+
+# number of categories of a guild
+categories_per_guild = 10
+
+def measure(build) -> int:
+    """
+    Returns:
+        int: the bytes held by the objects that build returns
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    objects = build()
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    del objects
+    return sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+
+def build_categories(entries: int) -> list[GuildSettings]:
+    data = {"recruitment_channel": 10**17, "max_number": 4, "category": "DEFAULT", "selects": ["RANK"]}
+    return [
+        GuildSettings(guild, {10**17 + guild * categories_per_guild + i: ChannelSetting.from_dict(data) for i in range(categories_per_guild)}, {})
+        for guild in range(entries // categories_per_guild)]
+
+def build_voice_channels(entries: int, voice_channels: list, setting: ChannelSetting) -> list[GameVoiceChannel]:
+    game_voice_channels = []
+    for voice_channel in voice_channels[:entries]:
+        game_voice_channel = GameVoiceChannel(voice_channel, setting)
+        game_voice_channel.current_setting = ChannelLiveSetting("可", "可", 4, "誰でもどうぞ！", {"RANK": "Gold"})
+        game_voice_channels.append(game_voice_channel)
+    return game_voice_channels
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+    # the voice channels belong to the gateway cache, so they are created before the measurement
+    guild = SimpleNamespace(id=1, shard_id=0)
+    voice_channels = [SimpleNamespace(id=10**17 + i, guild=guild, members=[]) for i in range(max(sizes))]
+    setting = ChannelSetting()
+
+    for entries in sizes:
+        categories = measure(lambda: build_categories(entries))
+        live = measure(lambda: build_voice_channels(entries, voice_channels, setting))
+        print(f"{entries:>7} entries: {categories / entries:8.1f} bytes per configured category, {live / entries:8.1f} bytes per tracked VC")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Measure how long the event loop stalls while handlers read and write user texts on a disk with a slow fsync.
+The blocking mode runs the queries on the event loop like older versions, the async mode awaits UserData.
+
+Usage: python benchmarks/user_data_latency_benchmark.py [fsync_ms] [handlers]
+"""
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ChannelSettings import ChannelLiveSetting, ChannelSetting
+from database.UserData import UserData
+
+class SlowFsyncConnection(sqlite3.Connection):
+    """
+    A connection whose commits take as long as a sync on a slow disk.
+    """
+
+    delay = 0.05
+
+    def commit(self):
+        time.sleep(self.delay)
+        super().commit()
+
+def summarize(values: list[float]) -> str:
+    values = sorted(values)
+    return f"median {values[len(values) // 2] * 1000:7.1f} ms, p99 {values[int(len(values) * 0.99)] * 1000:7.1f} ms, max {values[-1] * 1000:7.1f} ms"
+
+async def run(handler, handlers: int) -> tuple[list[float], list[float]]:
+    """
+    Returns:
+        tuple[list[float], list[float]]: the lags of the event loop and the latencies of the handlers in seconds
+    """
+    lags = []
+    latencies = []
+    done = asyncio.Event()
+
+    async def monitor():
+        # a heartbeat that should wake up every millisecond
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - start - 0.001)
+
+    async def interaction(user_id: int):
+        await asyncio.sleep(random.random())
+        start = time.perf_counter()
+        await handler(SimpleNamespace(id=user_id))
+        latencies.append(time.perf_counter() - start)
+
+    monitor_task = asyncio.create_task(monitor())
+    await asyncio.gather(*(interaction(10**17 + i) for i in range(handlers)))
+    done.set()
+    await monitor_task
+    return lags, latencies
+
+def main():
+    SlowFsyncConnection.delay = (float(sys.argv[1]) if len(sys.argv) > 1 else 50.0) / 1000
+    handlers = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    channel_setting = ChannelSetting(category="DEFAULT", with_random_status=True)
+    live_setting = ChannelLiveSetting("可", "可", 4, "誰でもどうぞ！", {"RANK": "Gold"})
+    print(f"{handlers} handlers within 1 s, {SlowFsyncConnection.delay * 1000:.0f} ms per commit")
+
+    with tempfile.TemporaryDirectory() as directory:
+        UserData.path = os.path.join(directory, "user_data.db")
+        UserData.connection_factory = SlowFsyncConnection
+        user_data = UserData()
+
+        # the queries of older versions, run on the event loop
+        connection = sqlite3.connect(UserData.path, factory=SlowFsyncConnection)
+        async def blocking_handler(user):
+            connection.execute("SELECT KIND, TEXT FROM USER_TEXTS_V2 WHERE USER_ID = ? AND CATEGORY = ?", (user.id, "DEFAULT")).fetchall()
+            connection.execute("INSERT OR REPLACE INTO USER_TEXTS_V2 (USER_ID, CATEGORY, KIND, TEXT) VALUES (?, ?, ?, ?)", (user.id, "DEFAULT", UserData.last_text_recruitment, live_setting.message))
+            connection.commit()
+
+        async def async_handler(user):
+            await user_data.get_user_texts(user, "DEFAULT")
+            await user_data.push_history(user, live_setting, channel_setting)
+
+        async def warm_up():
+            # the tables are created by the first call
+            await user_data.get_user_texts(SimpleNamespace(id=0), "DEFAULT")
+        asyncio.run(warm_up())
+
+        for name, handler in (("blocking", blocking_handler), ("async", async_handler)):
+            lags, latencies = asyncio.run(run(handler, handlers))
+            print(f"{name:>8}: event loop lag {summarize(lags)}")
+            print(f"{'':>8}  handler latency {summarize(latencies)}")
+        connection.close()
+
+if __name__ == "__main__":
+    main()
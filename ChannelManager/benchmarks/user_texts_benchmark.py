@@ -0,0 +1,100 @@
+"""
+Compare the lookup latency of the old USER_TEXTS table with USER_TEXTS_V2 and the cache of UserData, and measure the migration between the tables.
+
+Usage: python benchmarks/user_texts_benchmark.py [rows] [lookups]
+"""
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.UserData import UserData
+
+categories = ["DEFAULT", "APEX", "VALORANT", "LOL"]
+kinds = [UserData.last_text_recruitment, UserData.last_text_random, UserData.last_text_live, f"{UserData.templates_prefix}1", f"{UserData.selects_prefix}RANK"]
+
+def build_old_table(path: str, rows: int) -> int:
+    """
+    Returns:
+        int: the number of users
+    """
+    users = rows // (len(categories) * len(kinds))
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE USER_TEXTS (USER_ID TEXT, TYPE TEXT, TEXT TEXT, UNIQUE (USER_ID, TYPE))")
+    connection.executemany(
+        "INSERT INTO USER_TEXTS (USER_ID, TYPE, TEXT) VALUES (?, ?, ?)",
+        ((str(10**17 + user), f"{category}_{kind}", "誰でもどうぞ！") for user in range(users) for category in categories for kind in kinds))
+    connection.commit()
+    connection.close()
+    return users
+
+def summarize(latencies: list[float]) -> tuple[float, float, float]:
+    """
+    Returns:
+        tuple[float, float, float]: the mean, median and 99th percentile latency in microseconds
+    """
+    latencies.sort()
+    return sum(latencies) / len(latencies), latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "user_data.db")
+        users = build_old_table(path, rows)
+        keys = [(10**17 + random.randrange(users), random.choice(categories)) for _ in range(lookups)]
+        print(f"{users * len(categories) * len(kinds)} rows of {users} users, {lookups} lookups")
+
+        def measure_query(query: str, get_key) -> tuple[float, float, float]:
+            connection = sqlite3.connect(path)
+            latencies = []
+            for user_id, category in keys:
+                start = time.perf_counter()
+                connection.execute(query, get_key(user_id, category)).fetchall()
+                latencies.append((time.perf_counter() - start) * 1e6)
+            connection.close()
+            return summarize(latencies)
+
+        results = {}
+        results["USER_TEXTS"] = measure_query("SELECT USER_ID, TYPE, TEXT FROM USER_TEXTS WHERE USER_ID = ? AND TYPE LIKE ?",
+                                              lambda user_id, category: (str(user_id), f"{category}_%"))
+
+        async def migrate_and_lookup():
+            UserData.path = path
+            start = time.perf_counter()
+            user_data = UserData()
+            while user_data.migrating or not user_data._ready.done():
+                await asyncio.sleep(0.01)
+            print(f"migration: {time.perf_counter() - start:.2f} s")
+
+            results["USER_TEXTS_V2"] = measure_query("SELECT KIND, TEXT FROM USER_TEXTS_V2 WHERE USER_ID = ? AND CATEGORY = ?",
+                                                     lambda user_id, category: (user_id, category))
+            async def measure_get_user_texts() -> tuple[float, float, float]:
+                latencies = []
+                for user_id, category in keys:
+                    start = time.perf_counter()
+                    await user_data.get_user_texts(SimpleNamespace(id=user_id), category)
+                    latencies.append((time.perf_counter() - start) * 1e6)
+                return summarize(latencies)
+
+            # the whole call includes the hop to a reader thread and back to the event loop
+            UserData.cache_capacity = 0
+            results["get_user_texts"] = await measure_get_user_texts()
+            # every key is read once to fill the cache, then every lookup is a hit
+            UserData.cache_capacity = lookups
+            await measure_get_user_texts()
+            results["cached"] = await measure_get_user_texts()
+        asyncio.run(migrate_and_lookup())
+
+        for name, (mean, median, p99) in results.items():
+            print(f"{name:>14}: mean {mean:7.1f} us, median {median:7.1f} us, p99 {p99:7.1f} us")
+
+if __name__ == "__main__":
+    main()
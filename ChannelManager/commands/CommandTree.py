@@ -5,6 +5,9 @@ from discord import app_commands, Interaction
 from discord.ext import commands
 
 from ChannelSettings import ChannelSetting, ChannelSettings, SelectsSetting
+from Metrics import Metrics
+from ChannelCache import ChannelCache
+from CommandSync import sync_command_tree
 
 class ConfirmView(discord.ui.View):
     def __init__(self, label: str, callback: Callable[[discord.Interaction], Awaitable[None]]):
@@ -24,6 +27,27 @@ class CommandTree(commands.Cog):
     vc_edit_group = app_commands.Group(name="edit", parent=vc_group, description="管理対象のVCの詳細設定を編集するコマンド群。")
     vc_edit_selects_group = app_commands.Group(name="selects", parent=vc_group, description="管理対象のVCのセレクタ設定項目を編集するコマンド群。")
 
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        # the settings of the guild are loaded in the background before a command uses them
+        if interaction.guild is not None:
+            await ChannelSettings().preload(interaction.guild.id)
+        return True
+
+    @app_commands.command(name="vcmg_sync", description="コマンド一覧をDiscordに強制的に再登録します。")
+    @app_commands.default_permissions(administrator=True)
+    async def force_sync(self, interaction: discord.Interaction):
+        # the command tree is global, so the administrators of a guild must not sync it
+        if not await self.bot.is_owner(interaction.user):
+            await interaction.response.send_message("このコマンドはBotの所有者のみ使用できます。", ephemeral=True)
+            return
+        await interaction.response.defer(ephemeral=True)
+        try:
+            await sync_command_tree(self.bot.tree, True)
+            await interaction.followup.send("コマンド一覧を再登録しました。", ephemeral=True)
+        except Exception as e:
+            print(f"Failed to sync the command tree. {e}")
+            await interaction.followup.send("コマンド一覧の再登録に失敗しました。", ephemeral=True)
+
     async def __send_confirm_message(self, interaction: discord.Interaction, content: str, label: str, callback: Callable[[discord.Interaction], Awaitable[None]]):
         view = ConfirmView(label, callback)
         return await interaction.response.send_message(content, ephemeral=True, view=view)
@@ -34,7 +58,7 @@ class CommandTree(commands.Cog):
     @app_commands.describe(default_value="セレクタの初期値。省略した場合、このセレクタは省略可能なセレクタとして扱われます。")
     @app_commands.describe(selection1="セレクタの選択項目。以降同様です。")
     async def select_new(self, interaction: discord.Interaction, identifier: str, label: str, default_value: Optional[str], selection1: Optional[str], selection2: Optional[str], selection3: Optional[str], selection4: Optional[str], selection5: Optional[str], selection6: Optional[str], selection7: Optional[str], selection8: Optional[str]):
-        if ChannelSettings().get_selects_setting(identifier) is not None:
+        if ChannelSettings().get_selects_setting(interaction.guild.id, identifier) is not None:
             await interaction.response.send_message(f"セレクタ {identifier} は既に登録済みです。", ephemeral=True)
             return
 
@@ -44,14 +68,14 @@ class CommandTree(commands.Cog):
             setting.default_value = default_value
             setting.label = label
             setting.selects = valid_selections
-        ChannelSettings().edit_selects_settings(identifier, edit_setting)
+        ChannelSettings().edit_selects_settings(interaction.guild.id, identifier, edit_setting)
         await interaction.response.send_message(f"セレクタ {identifier} を追加しました。", ephemeral=True)
 
     @select_group.command(name="label", description="セレクタの表示上の名称を取得、あるいは変更します。")
     @app_commands.describe(identifier="セレクタの識別子。")
     @app_commands.describe(label="セレクタの表示上の名称。日本語を使用できます。省略すると現在の名称を表示します。")
     async def select_label(self, interaction: discord.Interaction, identifier: str, label: Optional[str]):
-        setting = ChannelSettings().get_selects_setting(identifier)
+        setting = ChannelSettings().get_selects_setting(interaction.guild.id, identifier)
         if setting is None:
             await interaction.response.send_message(f"セレクタ {identifier} が見つかりません。", ephemeral=True)
             return
@@ -62,14 +86,14 @@ class CommandTree(commands.Cog):
 
         def edit_setting(setting: SelectsSetting):
             setting.label = label
-        ChannelSettings().edit_selects_settings(identifier, edit_setting)
+        ChannelSettings().edit_selects_settings(interaction.guild.id, identifier, edit_setting)
         await interaction.response.send_message(f"セレクタ {identifier} の表示名を`{label}`に変更しました。", ephemeral=True)
 
     @select_group.command(name="remove", description="セレクタの選択項目を削除します。")
     @app_commands.describe(identifier="セレクタの識別子。")
     @app_commands.describe(index1="削除する選択項目の位置。位置は先頭を1番目として順に数えます。以降同様です。")
     async def select_remove(self, interaction: discord.Interaction, identifier: str, index1: int, index2: Optional[int], index3: Optional[int], index4: Optional[int], index5: Optional[int], index6: Optional[int], index7: Optional[int], index8: Optional[int]):
-        setting = ChannelSettings().get_selects_setting(identifier)
+        setting = ChannelSettings().get_selects_setting(interaction.guild.id, identifier)
         if setting is None:
             await interaction.response.send_message(f"セレクタ {identifier} が見つかりません。", ephemeral=True)
             return
@@ -86,7 +110,7 @@ class CommandTree(commands.Cog):
             def edit_setting(setting: SelectsSetting):
                 for s in selects:
                     setting.selects.remove(s)
-            ChannelSettings().edit_selects_settings(identifier, edit_setting)
+            ChannelSettings().edit_selects_settings(interaction.guild.id, identifier, edit_setting)
             await interaction.response.send_message(f"セレクタ {identifier} から{len(selects)}個の項目を削除しました。", ephemeral=True)
         await self.__send_confirm_message(interaction, content, "すべて削除" if len(selects) > 1 else "削除", callback)
 
@@ -94,7 +118,7 @@ class CommandTree(commands.Cog):
     @app_commands.describe(identifier="セレクタの識別子。")
     @app_commands.describe(selection1="追加する設定項目。以降同様です。")
     async def select_add(self, interaction: discord.Interaction, identifier: str, selection1: str, selection2: Optional[str], selection3: Optional[str], selection4: Optional[str], selection5: Optional[str], selection6: Optional[str], selection7: Optional[str], selection8: Optional[str]):
-        setting = ChannelSettings().get_selects_setting(identifier)
+        setting = ChannelSettings().get_selects_setting(interaction.guild.id, identifier)
         if setting is None:
             await interaction.response.send_message(f"セレクタ {identifier} が見つかりません。", ephemeral=True)
             return
@@ -106,18 +130,18 @@ class CommandTree(commands.Cog):
 
         def edit_setting(setting: SelectsSetting):
             setting.selects.extend(valid_selections)
-        ChannelSettings().edit_selects_settings(identifier, edit_setting)
+        ChannelSettings().edit_selects_settings(interaction.guild.id, identifier, edit_setting)
         await interaction.response.send_message(f"セレクタ {identifier} に{len(valid_selections)}個の選択項目を追加しました。", ephemeral=True)
 
     @select_group.command(name="list", description="セレクタの一覧を表示します。")
     @app_commands.describe(identifier="指定しない場合、全セレクタの識別子一覧を表示します。セレクタの識別子を指定すると、そのセレクタの全設定項目を表示します。")
     async def select_list(self, interaction: discord.Interaction, identifier: Optional[str]):
         if identifier is None:
-            message = "**◆全セレクタ一覧◆**\n\n" + "\n".join(map(lambda s: f"・{s} (表示名: {ChannelSettings().get_selects_setting(s).label})", ChannelSettings().get_all_selects()))
+            message = "**◆全セレクタ一覧◆**\n\n" + "\n".join(map(lambda s: f"・{s} (表示名: {ChannelSettings().get_selects_setting(interaction.guild.id, s).label})", ChannelSettings().get_all_selects(interaction.guild.id)))
             await interaction.response.send_message(message, ephemeral=True)
             return
         
-        setting = ChannelSettings().get_selects_setting(identifier)
+        setting = ChannelSettings().get_selects_setting(interaction.guild.id, identifier)
         if setting is None:
             await interaction.response.send_message(f"セレクタ {identifier} が見つかりません。", ephemeral=True)
             return
@@ -134,8 +158,9 @@ class CommandTree(commands.Cog):
     @app_commands.describe(can_edit_max_users="VCごとの募集人数の変更を許可するか。")
     @app_commands.describe(category="入力履歴の記録カテゴリ。英大文字を推奨します。同カテゴリ間で入力履歴を共有します。")
     @app_commands.describe(selects="追加のセレクタ選択項目。")
-    async def vc_new(self, interaction: discord.Interaction, category_channel: discord.CategoryChannel, recruitment_channel: Optional[discord.TextChannel], max_users: Optional[int], with_random_status: Optional[bool], with_live_status: Optional[bool], with_users_status: Optional[bool], can_edit_max_users: Optional[bool], category: Optional[str], selects: Optional[str]):
-        if ChannelSettings().get_channel_setting(category_channel.id) is not None:
+    @app_commands.describe(single_panel="VCごとの操作パネルを1つのメッセージにまとめ、書き換えて使用するか。")
+    async def vc_new(self, interaction: discord.Interaction, category_channel: discord.CategoryChannel, recruitment_channel: Optional[discord.TextChannel], max_users: Optional[int], with_random_status: Optional[bool], with_live_status: Optional[bool], with_users_status: Optional[bool], can_edit_max_users: Optional[bool], category: Optional[str], selects: Optional[str], single_panel: Optional[bool]):
+        if ChannelSettings().get_channel_setting(interaction.guild.id, category_channel.id) is not None:
             await interaction.response.send_message(f"このカテゴリは既に登録済みです。", ephemeral=True)
             return 
         def edit_setting(channel_setting: ChannelSetting):
@@ -146,53 +171,75 @@ class CommandTree(commands.Cog):
             if with_live_status is not None:
                channel_setting.with_live_status = with_live_status
             if with_users_status is not None:
-               channel_setting.with_users_status = with_users_status
+               channel_setting.with_number_status = with_users_status
             if can_edit_max_users is not None:
-               channel_setting.can_edit_max_users = can_edit_max_users
+               channel_setting.can_edit_max_number = can_edit_max_users
+            if single_panel is not None:
+               channel_setting.single_panel = single_panel
             channel_setting.category = category or "DEFAULT"
             if selects is not None:
                 channel_setting.selects = [selects]
 
-        ChannelSettings().edit_channel_setting(category_channel.id, edit_setting)
+        ChannelSettings().edit_channel_setting(interaction.guild.id, category_channel.id, edit_setting)
         await interaction.response.send_message(f"{category_channel.name} カテゴリを管理対象に追加しました。", ephemeral=True)
 
     @vc_group.command(name="remove", description="管理対象のVCを除外します。")
     @app_commands.describe(category_channel="管理単位のカテゴリチャンネル。")
     async def vc_edit_recruitment(self, interaction: discord.Interaction, category_channel: discord.CategoryChannel, recruitment_channel: discord.TextChannel):
-        settings = ChannelSettings().get_channel_setting(category_channel.id)
+        settings = ChannelSettings().get_channel_setting(interaction.guild.id, category_channel.id)
         if settings is None:
             await interaction.response.send_message(f"管理対象外のカテゴリです。", ephemeral=True)
             return 
 
-        ChannelSettings().remove_channel_setting()
+        ChannelSettings().remove_channel_setting(interaction.guild.id, category_channel.id)
         await interaction.response.send_message(f"{category_channel.name} カテゴリを管理対象から除外しました。", ephemeral=True)
 
     @vc_edit_group.command(name="recruitment", description="募集文の掲示先を変更します。")
     @app_commands.describe(category_channel="管理単位のカテゴリチャンネル。")
     @app_commands.describe(recruitment_channel="募集を掲示するテキストチャンネル。")
     async def vc_edit_recruitment(self, interaction: discord.Interaction, category_channel: discord.CategoryChannel, recruitment_channel: Optional[discord.TextChannel]):
-        settings = ChannelSettings().get_channel_setting(category_channel.id)
+        settings = ChannelSettings().get_channel_setting(interaction.guild.id, category_channel.id)
         if settings is None:
             await interaction.response.send_message(f"管理対象外のカテゴリです。", ephemeral=True)
             return 
 
         def edit_setting(channel_setting: ChannelSetting):
             channel_setting.recruitment_channel = recruitment_channel.id if recruitment_channel is not None else None
-        ChannelSettings().edit_channel_setting(category_channel.id, edit_setting)
+        ChannelSettings().edit_channel_setting(interaction.guild.id, category_channel.id, edit_setting)
 
         if recruitment_channel is None:
             await interaction.response.send_message(f"{category_channel.name} カテゴリを募集文掲載の対象から除外しました。", ephemeral=True)
         else:
             await interaction.response.send_message(f"{category_channel.name} カテゴリの掲示先を {recruitment_channel.name} チャンネルに変更しました。", ephemeral=True)
 
+    @vc_edit_group.command(name="spectator", description="観戦状態の管理方法を変更します。")
+    @app_commands.describe(category_channel="管理単位のカテゴリチャンネル。")
+    @app_commands.describe(spectator_role="観戦者に付与するロール。指定しない場合はニックネームで管理します。")
+    async def vc_edit_spectator(self, interaction: discord.Interaction, category_channel: discord.CategoryChannel, spectator_role: Optional[discord.Role]):
+        settings = ChannelSettings().get_channel_setting(interaction.guild.id, category_channel.id)
+        if settings is None:
+            await interaction.response.send_message(f"管理対象外のカテゴリです。", ephemeral=True)
+            return 
+
+        def edit_setting(channel_setting: ChannelSetting):
+            channel_setting.spectator_backend = "role" if spectator_role is not None else "nickname"
+            channel_setting.spectator_role = spectator_role.id if spectator_role is not None else None
+        ChannelSettings().edit_channel_setting(interaction.guild.id, category_channel.id, edit_setting)
+
+        if spectator_role is None:
+            await interaction.response.send_message(f"{category_channel.name} カテゴリの観戦状態をニックネームで管理します。", ephemeral=True)
+        else:
+            await interaction.response.send_message(f"{category_channel.name} カテゴリの観戦状態を {spectator_role.name} ロールで管理します。", ephemeral=True)
+
     @vc_edit_group.command(name="options", description="ON/OFFで切り替えられるオプションを編集します。")
     @app_commands.describe(category_channel="管理単位のカテゴリチャンネル。")
     @app_commands.describe(with_random_status="ゲーム中の雑談可否を表示するか。")
     @app_commands.describe(with_live_status="他ゲームの配信可否を表示するか。")
     @app_commands.describe(with_users_status="空き人数を表示するか。")
     @app_commands.describe(can_edit_max_users="VCごとの募集人数の変更を許可するか。")
-    async def vc_edit_options(self, interaction: discord.Interaction, category_channel: discord.CategoryChannel, with_random_status: Optional[bool], with_live_status: Optional[bool], with_users_status: Optional[bool], can_edit_max_users: Optional[bool]):
-        settings = ChannelSettings().get_channel_setting(category_channel.id)
+    @app_commands.describe(single_panel="VCごとの操作パネルを1つのメッセージにまとめ、書き換えて使用するか。")
+    async def vc_edit_options(self, interaction: discord.Interaction, category_channel: discord.CategoryChannel, with_random_status: Optional[bool], with_live_status: Optional[bool], with_users_status: Optional[bool], can_edit_max_users: Optional[bool], single_panel: Optional[bool]):
+        settings = ChannelSettings().get_channel_setting(interaction.guild.id, category_channel.id)
         if settings is None:
             await interaction.response.send_message(f"管理対象外のカテゴリです。", ephemeral=True)
             return 
@@ -203,45 +250,47 @@ class CommandTree(commands.Cog):
             if with_live_status is not None:
                channel_setting.with_live_status = with_live_status
             if with_users_status is not None:
-               channel_setting.with_users_status = with_users_status
+               channel_setting.with_number_status = with_users_status
             if can_edit_max_users is not None:
-               channel_setting.can_edit_max_users = can_edit_max_users
-        ChannelSettings().edit_channel_settings(category_channel.id, edit_setting)
+               channel_setting.can_edit_max_number = can_edit_max_users
+            if single_panel is not None:
+               channel_setting.single_panel = single_panel
+        ChannelSettings().edit_channel_setting(interaction.guild.id, category_channel.id, edit_setting)
         await interaction.response.send_message(f"{category_channel.name} カテゴリのオプションを更新しました。", ephemeral=True)
 
     @vc_edit_group.command(name="max", description="デフォルトの最大募集人数を変更します。")
     @app_commands.describe(category_channel="管理単位のカテゴリチャンネル。")
     @app_commands.describe(max_users="最大募集人数。")
     async def vc_edit_max(self, interaction: discord.Interaction, category_channel: discord.CategoryChannel, max_users: int):
-        settings = ChannelSettings().get_channel_setting(category_channel.id)
+        settings = ChannelSettings().get_channel_setting(interaction.guild.id, category_channel.id)
         if settings is None:
             await interaction.response.send_message(f"管理対象外のカテゴリです。", ephemeral=True)
             return 
 
         def edit_setting(channel_setting: ChannelSetting):
              channel_setting.max_number = max_users
-        ChannelSettings().edit_channel_setting(category_channel.id, edit_setting)
+        ChannelSettings().edit_channel_setting(interaction.guild.id, category_channel.id, edit_setting)
         await interaction.response.send_message(f"{category_channel.name} カテゴリのデフォルトの最大募集人数を{max_users}人に変更しました。", ephemeral=True)
 
     @vc_edit_group.command(name="category", description="入力履歴の記録カテゴリを変更します。")
     @app_commands.describe(category_channel="管理単位のカテゴリチャンネル。")
     @app_commands.describe(category="入力履歴の記録カテゴリ。英大文字を推奨します。同カテゴリ間で入力履歴を共有します。")
     async def vc_edit_category(self, interaction: discord.Interaction, category_channel: discord.CategoryChannel, category: str):
-        settings = ChannelSettings().get_channel_setting(category_channel.id)
+        settings = ChannelSettings().get_channel_setting(interaction.guild.id, category_channel.id)
         if settings is None:
             await interaction.response.send_message(f"管理対象外のカテゴリです。", ephemeral=True)
             return 
 
         def edit_setting(channel_setting: ChannelSetting):
              channel_setting.category = category
-        ChannelSettings().edit_channel_setting(category_channel.id, edit_setting)
+        ChannelSettings().edit_channel_setting(interaction.guild.id, category_channel.id, edit_setting)
         await interaction.response.send_message(f"{category_channel.name} カテゴリの記録カテゴリを {category} に変更しました。", ephemeral=True)
 
     @vc_edit_selects_group.command(name="add", description="セレクタ設定項目を追加します。")
     @app_commands.describe(category_channel="管理単位のカテゴリチャンネル。")
     @app_commands.describe(selects="セレクタの識別子。")
     async def vc_edit_selects_add(self, interaction: discord.Interaction, category_channel: discord.CategoryChannel, selects: str):
-        settings = ChannelSettings().get_channel_setting(category_channel.id)
+        settings = ChannelSettings().get_channel_setting(interaction.guild.id, category_channel.id)
         if settings is None:
             await interaction.response.send_message(f"管理対象外のカテゴリです。", ephemeral=True)
             return 
@@ -252,14 +301,14 @@ class CommandTree(commands.Cog):
 
         def edit_setting(channel_setting: ChannelSetting):
             channel_setting.selects.append(selects)
-        ChannelSettings().edit_channel_setting(category_channel.id, edit_setting)
+        ChannelSettings().edit_channel_setting(interaction.guild.id, category_channel.id, edit_setting)
         await interaction.response.send_message(f"{category_channel.name} カテゴリでセレクタ {selects} を使用するようになりました。", ephemeral=True)
 
     @vc_edit_selects_group.command(name="remove", description="セレクタ設定項目を削除します。")
     @app_commands.describe(category_channel="管理単位のカテゴリチャンネル。")
     @app_commands.describe(selects="セレクタの識別子。")
     async def vc_edit_selects_remove(self, interaction: discord.Interaction, category_channel: discord.CategoryChannel, selects: str):
-        settings = ChannelSettings().get_channel_setting(category_channel.id)
+        settings = ChannelSettings().get_channel_setting(interaction.guild.id, category_channel.id)
         if settings is None:
             await interaction.response.send_message(f"管理対象外のカテゴリです。", ephemeral=True)
             return 
@@ -270,24 +319,23 @@ class CommandTree(commands.Cog):
 
         def edit_setting(channel_setting: ChannelSetting):
             channel_setting.selects.remove(selects)
-        ChannelSettings().edit_channel_setting(category_channel.id, edit_setting)
+        ChannelSettings().edit_channel_setting(interaction.guild.id, category_channel.id, edit_setting)
         await interaction.response.send_message(f"{category_channel.name} カテゴリでセレクタ {selects} を使用しなくなりました。", ephemeral=True)
 
     @vc_group.command(name="list", description="管理対象の全カテゴリを確認します。")
     async def vc_list(self, interaction: discord.Interaction):
-        channels = await interaction.guild.fetch_channels()
         def get_channel(channel_id: int):
-            for channel in channels:
-                if channel.id == channel_id:
-                    return channel.name
-            return "[ID: " + channel_id + "]"
-        message = "**◆全カテゴリチャンネル一覧◆**\n\n" + "\n".join(map(lambda channel_id: f"・{get_channel(channel_id)}", ChannelSettings().get_all_channels()))
+            channel = ChannelCache(interaction.guild.shard_id).get(interaction.guild, channel_id)
+            if channel is not None:
+                return channel.name
+            return f"[ID: {channel_id}]"
+        message = "**◆全カテゴリチャンネル一覧◆**\n\n" + "\n".join(map(lambda channel_id: f"・{get_channel(channel_id)}", ChannelSettings().get_all_channels(interaction.guild.id)))
         await interaction.response.send_message(message, ephemeral=True)
 
     @vc_group.command(name="show", description="管理対象のカテゴリの詳細情報を確認します。")
     @app_commands.describe(category_channel="管理単位のカテゴリチャンネル。")
     async def vc_show(self, interaction: discord.Interaction, category_channel: discord.CategoryChannel):
-        settings = ChannelSettings().get_channel_setting(category_channel.id)
+        settings = ChannelSettings().get_channel_setting(interaction.guild.id, category_channel.id)
         if settings is None:
             await interaction.response.send_message(f"管理対象外のカテゴリです。", ephemeral=True)
             return 
@@ -304,12 +352,49 @@ class CommandTree(commands.Cog):
             message += f"空き人数の表示: {'表示' if settings.with_number_status else '非表示'}\n"
             message += f"VCごとの募集人数の変更: {'許可' if settings.can_edit_max_number else '禁止'}\n"
             message += f"入力履歴の記録カテゴリ: {settings.category}\n"
+            message += f"操作パネル: {'単一メッセージ' if settings.single_panel else '個別メッセージ'}\n"
+            if settings.spectator_backend == "role" and settings.spectator_role is not None:
+                message += f"観戦状態の管理: <@&{settings.spectator_role}> ロール\n"
+            else:
+                message += f"観戦状態の管理: ニックネーム\n"
             if len(settings.selects) > 0:
                 message += f"使用セレクタ: {', '.join(settings.selects)}\n"
         else:
             message += f"このカテゴリは募集が無効です。"
 
         await interaction.response.send_message(message, ephemeral=True)
+
+    @vc_group.command(name="stats", description="VCマネージャの動作統計を確認します。")
+    async def vc_stats(self, interaction: discord.Interaction):
+        metrics = Metrics().snapshot()
+        if len(metrics) == 0:
+            await interaction.response.send_message("統計情報はまだありません。", ephemeral=True)
+            return
+
+        message = "**◆動作統計◆**\n\n" + "\n".join(map(lambda item: f"・{item[0]}: {item[1]}", metrics.items()))
+        if isinstance(self.bot, commands.AutoShardedBot):
+            for shard_id, shard_metrics in Metrics.shards().items():
+                message += f"\n\n**◆シャード {shard_id}◆**\n\n" + "\n".join(map(lambda item: f"・{item[0]}: {item[1]}", shard_metrics.snapshot().items()))
+        chunks = self.__split_message(message)
+        await interaction.response.send_message(chunks[0], ephemeral=True)
+        for chunk in chunks[1:]:
+            await interaction.followup.send(chunk, ephemeral=True)
+
+    @staticmethod
+    def __split_message(message: str, limit: int = 2000) -> list[str]:
+        """
+        Split a message between its lines into messages of at most limit characters, which is what Discord accepts.
+        """
+        chunks = [""]
+        for line in message.split("\n"):
+            line = line[:limit]
+            if len(chunks[-1]) + 1 + len(line) > limit:
+                chunks.append(line)
+            elif chunks[-1] == "":
+                chunks[-1] = line
+            else:
+                chunks[-1] += "\n" + line
+        return [chunk for chunk in chunks if chunk.strip() != ""]
         
 
 async def setup(bot):
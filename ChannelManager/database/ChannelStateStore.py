@@ -0,0 +1,59 @@
+import json, os
+from database.SharedStore import SharedStore
+
+class ChannelStateStore:
+    """
+    The class representing a singleton that saves the state of managed voice channels.
+    The state is saved to a local file, or per shard to the shared store when the bot runs as a cluster.
+    """
+
+    _instance = None
+    state_path = "channel_state.json"
+    state_namespace_prefix = "channel_state:"
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ChannelStateStore, cls).__new__(cls)
+        return cls._instance
+
+    def load(self) -> dict:
+        if SharedStore.enabled():
+            data = {}
+            store = SharedStore()
+            for namespace in store.get_namespaces(self.state_namespace_prefix):
+                data.update(store.get_all(namespace))
+            return data
+
+        if not os.path.isfile(self.state_path):
+            return {}
+        try:
+            with open(self.state_path, "r", encoding='utf-8') as f:
+                data = json.load(f)
+                return data if isinstance(data, dict) else {}
+        except Exception as e:
+            print(f"Failed to load the channel state. {e}")
+            return {}
+
+    def save(self, shards: dict[int, dict]):
+        """
+        Save the state of every shard of this process.
+        The state of a shard is replaced as a whole, so that a crash never leaves a broken state behind.
+
+        Parameters:
+            shards (dict[int, dict]): the state of the voice channels keyed by the shard ID
+        """
+        if SharedStore.enabled():
+            # the other processes of the cluster own the other shards
+            for shard_id, data in shards.items():
+                SharedStore().replace(f"{self.state_namespace_prefix}{shard_id}", data)
+            return
+
+        data = {}
+        for value in shards.values():
+            data.update(value)
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, "w", encoding='utf-8') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.state_path)
@@ -0,0 +1,230 @@
+import atexit, json, os, queue, threading, time
+from concurrent.futures import Future
+from typing import Any, Callable, Optional, Union
+
+class SettingsJournal:
+    """
+    The class representing a write-behind store of one settings file.
+    Changes are appended to a journal by a background thread, so callers never wait for the disk.
+    The journal is compacted into the settings file by an atomic rename, so a crash never leaves a broken settings file behind.
+    All journals share one writer thread, which is the only thread that touches their files and state.
+    """
+
+    # number of journal entries after which the journal is compacted into the settings file
+    compact_threshold = 100
+    # seconds without new entries after which a journal is compacted into the settings file
+    compact_idle = 30.0
+
+    # entries of (journal, line), where a line of None compacts the journal and a callable runs on the writer thread
+    _queue: queue.Queue = queue.Queue()
+    _thread: Optional[threading.Thread] = None
+    _lock = threading.Lock()
+
+    def __init__(self, path: str):
+        """
+        The constructor for SettingsJournal class.
+
+        Parameters:
+            path (str): path of the settings file. The journal is written next to it.
+        """
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.__state: dict[str, Any] = {}
+        self.__entries = 0
+
+    def load(self) -> dict[str, Any]:
+        """
+        Read the settings file and apply the journal to it.
+        The files are read by the writer thread after the changes queued before, so this waits for them.
+        """
+        future = Future()
+        def command():
+            try:
+                future.set_result(self.__load())
+            except Exception as e:
+                future.set_exception(e)
+        self.__post(command)
+        return future.result()
+
+    def __load(self) -> dict[str, Any]:
+        state = {}
+        if os.path.isfile(self.path):
+            with open(self.path, "r", encoding='utf-8-sig') as f:
+                state = json.load(f)
+
+        entries = 0
+        if os.path.isfile(self.journal_path):
+            with open(self.journal_path, "rb+") as f:
+                valid = 0
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("The entry has no end of line.")
+                        entry = json.loads(line.decode('utf-8'))
+                    except ValueError:
+                        # the last entry was cut off by a crash, and is dropped so that new entries are not appended to it
+                        f.truncate(valid)
+                        break
+                    self.__apply(state, entry)
+                    valid += len(line)
+                    entries += 1
+
+        self.__state = json.loads(json.dumps(state))
+        self.__entries = entries
+        return state
+
+    @staticmethod
+    def __apply(state: dict[str, Any], entry: dict):
+        if entry["op"] == "put":
+            state[entry["key"]] = entry["value"]
+        elif entry["op"] == "delete":
+            state.pop(entry["key"], None)
+
+    def retire(self):
+        """
+        Rename the settings file and the journal after their settings have been moved elsewhere, so that they are never loaded again.
+        """
+        self.__post(self.__retire)
+
+    def __retire(self):
+        for path in (self.path, self.journal_path):
+            if os.path.isfile(path):
+                os.replace(path, path + ".migrated")
+        self.__state = {}
+        self.__entries = 0
+
+    def put(self, key: str, value: Any):
+        # the value is serialized now, so later changes of the object are not written by this entry
+        self.__post(json.dumps({"op": "put", "key": key, "value": value}, ensure_ascii=False))
+
+    def delete(self, key: str):
+        self.__post(json.dumps({"op": "delete", "key": key}, ensure_ascii=False))
+
+    def close(self):
+        """
+        Compact the journal into the settings file in the background. The journal must not be used afterwards.
+        """
+        self.__post(None)
+
+    def __post(self, line: Union[str, Callable[[], None], None]):
+        cls = SettingsJournal
+        with cls._lock:
+            if cls._thread is None:
+                cls._thread = threading.Thread(target=cls.__run, name="SettingsJournal", daemon=True)
+                cls._thread.start()
+                atexit.register(cls.shutdown)
+        cls._queue.put((self, line))
+
+    @classmethod
+    def flush(cls):
+        """
+        Wait until every queued change has been written.
+        """
+        cls._queue.join()
+
+    @classmethod
+    def shutdown(cls):
+        """
+        Write every queued change and compact all journals into their settings files.
+        """
+        with cls._lock:
+            thread = cls._thread
+            cls._thread = None
+        if thread is None:
+            return
+        atexit.unregister(cls.shutdown)
+        cls._queue.put((None, None))
+        thread.join()
+
+    @classmethod
+    def __run(cls):
+        dirty = {}  # map of the journals with entries that are not compacted yet to the time of their last entry
+        while True:
+            # a dirty journal is compacted once it has been idle for compact_idle seconds, even if nothing is queued
+            timeout = max(0.0, min(dirty.values()) + cls.compact_idle - time.monotonic()) if len(dirty) > 0 else None
+            try:
+                items = [cls._queue.get(timeout=timeout)]
+            except queue.Empty:
+                items = []
+            # every change that is already queued is written with one fsync per journal
+            while not cls._queue.empty():
+                items.append(cls._queue.get())
+
+            stop = any(journal is None for journal, _ in items)
+            batches: dict[SettingsJournal, list[str]] = {}
+            closed = set()
+            try:
+                for journal, line in items:
+                    if journal is None:
+                        continue
+                    if line is None:
+                        closed.add(journal)
+                    elif isinstance(line, str):
+                        batches.setdefault(journal, []).append(line)
+                    else:
+                        # a command reads or replaces the files, so everything queued before it is written first
+                        cls.__settle(batches, closed, dirty, False)
+                        try:
+                            line()
+                        except Exception as e:
+                            print(f"Failed to update the settings journal of {journal.path}. {e}")
+                        if journal.__entries == 0:
+                            dirty.pop(journal, None)
+                cls.__settle(batches, closed, dirty, stop)
+            finally:
+                for _ in items:
+                    cls._queue.task_done()
+            if stop:
+                return
+
+    @classmethod
+    def __settle(cls, batches: dict["SettingsJournal", list[str]], closed: set["SettingsJournal"], dirty: dict["SettingsJournal", float], compact_all: bool):
+        """
+        Append the batched entries to their journals, and compact the closed, full and idle journals.
+        """
+        for journal, lines in batches.items():
+            try:
+                journal.__append(lines)
+                dirty[journal] = time.monotonic()
+            except Exception as e:
+                print(f"Failed to write the settings journal of {journal.path}. {e}")
+        batches.clear()
+
+        now = time.monotonic()
+        for journal in list(dirty):
+            if not (compact_all or journal in closed or journal.__entries >= cls.compact_threshold or now - dirty[journal] >= cls.compact_idle):
+                continue
+            try:
+                journal.__compact()
+                del dirty[journal]
+            except Exception as e:
+                print(f"Failed to compact the settings journal of {journal.path}. {e}")
+                # tried again after another compact_idle seconds
+                dirty[journal] = now
+        closed.clear()
+
+    def __append(self, lines: list[str]):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.journal_path, "a", encoding='utf-8') as f:
+            for line in lines:
+                f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        for line in lines:
+            self.__apply(self.__state, json.loads(line))
+        self.__entries += len(lines)
+
+    def __compact(self):
+        if self.__entries == 0:
+            return
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding='utf-8-sig') as f:
+            json.dump(self.__state, f, indent=4, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        # a crash before the truncation only replays entries that are already in the settings file
+        with open(self.journal_path, "w", encoding='utf-8') as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self.__entries = 0
@@ -0,0 +1,145 @@
+import json, os, sqlite3, threading
+from typing import Any, Optional
+
+class SharedStore:
+    """
+    The class representing a singleton key-value store that is shared by all processes of a cluster.
+    It is a SQLite database in WAL mode, so readers never block the writer of another process.
+    Every write is recorded in a change log, which the other processes poll to reload what has changed.
+    """
+
+    _instance = None
+    # number of change log rows kept for processes that poll late
+    change_log_size = 1000
+    # namespace of the markers of the namespaces that have been seeded
+    seeded_namespace = "seeded"
+    # namespace that poll_changes returns when changes were dropped from the log before this process polled them,
+    # so everything that has been read from the store must be read again
+    lost_changes_namespace = "*"
+
+    @staticmethod
+    def get_path() -> Optional[str]:
+        """
+        Get the path of the shared store, or None if the bot runs without one.
+        """
+        return os.getenv("CHANNEL_MANAGER_SHARED_STORE") or None
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return cls.get_path() is not None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(SharedStore, cls).__new__(cls)
+            cls._instance.__open(cls.get_path())
+        return cls._instance
+
+    def __open(self, path: str):
+        # the store is used from worker threads, and every access holds the lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA busy_timeout=5000")
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS KEY_VALUES (
+                NAMESPACE TEXT,
+                KEY TEXT,
+                VALUE TEXT,
+                PRIMARY KEY (NAMESPACE, KEY)
+            )
+        ''')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS CHANGES (
+                ID INTEGER PRIMARY KEY AUTOINCREMENT,
+                NAMESPACE TEXT,
+                ORIGIN INTEGER
+            )
+        ''')
+        self.connection.commit()
+        self.last_change = self.connection.execute("SELECT COALESCE(MAX(ID), 0) FROM CHANGES").fetchone()[0]
+
+    def get_all(self, namespace: str) -> dict[str, Any]:
+        with self.lock:
+            rows = self.connection.execute("SELECT KEY, VALUE FROM KEY_VALUES WHERE NAMESPACE = ?", (namespace,)).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def get_namespaces(self, prefix: str) -> list[str]:
+        with self.lock:
+            rows = self.connection.execute("SELECT DISTINCT NAMESPACE FROM KEY_VALUES WHERE NAMESPACE LIKE ?", (prefix + "%",)).fetchall()
+        return [row[0] for row in rows]
+
+    def replace(self, namespace: str, values: dict[str, Any]):
+        """
+        Replace all values of a namespace in one transaction and notify the other processes.
+        """
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM KEY_VALUES WHERE NAMESPACE = ?", (namespace,))
+            self.connection.executemany(
+                "INSERT INTO KEY_VALUES (NAMESPACE, KEY, VALUE) VALUES (?, ?, ?)",
+                [(namespace, key, json.dumps(value, ensure_ascii=False)) for key, value in values.items()])
+            self.__log_change(namespace)
+
+    def seed(self, namespace: str, values: dict[str, Any]) -> bool:
+        """
+        Fill a namespace with values only once. The store remembers the seeding, so a namespace emptied later is never filled again.
+
+        Returns:
+            bool: whether the values have been written by this call
+        """
+        with self.lock, self.connection:
+            # the immediate transaction keeps other processes from seeding the same namespace at the same time
+            self.connection.execute("BEGIN IMMEDIATE")
+            if self.connection.execute("SELECT 1 FROM KEY_VALUES WHERE NAMESPACE = ? AND KEY = ?", (self.seeded_namespace, namespace)).fetchone() is not None:
+                return False
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO KEY_VALUES (NAMESPACE, KEY, VALUE) VALUES (?, ?, ?)",
+                [(namespace, key, json.dumps(value, ensure_ascii=False)) for key, value in values.items()])
+            self.connection.execute("INSERT INTO KEY_VALUES (NAMESPACE, KEY, VALUE) VALUES (?, ?, 'true')", (self.seeded_namespace, namespace))
+            self.__log_change(namespace)
+            return True
+
+    def put(self, namespace: str, key: str, value: Any):
+        """
+        Write one value and notify the other processes.
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO KEY_VALUES (NAMESPACE, KEY, VALUE) VALUES (?, ?, ?)",
+                (namespace, key, json.dumps(value, ensure_ascii=False)))
+            self.__log_change(namespace)
+
+    def delete(self, namespace: str, key: str):
+        """
+        Delete one value and notify the other processes.
+        """
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM KEY_VALUES WHERE NAMESPACE = ? AND KEY = ?", (namespace, key))
+            self.__log_change(namespace)
+
+    def notify(self, namespace: str):
+        """
+        Notify the other processes that a namespace kept outside the store has changed.
+        """
+        with self.lock, self.connection:
+            self.__log_change(namespace)
+
+    def __log_change(self, namespace: str):
+        cursor = self.connection.execute("INSERT INTO CHANGES (NAMESPACE, ORIGIN) VALUES (?, ?)", (namespace, os.getpid()))
+        self.connection.execute("DELETE FROM CHANGES WHERE ID <= ?", (cursor.lastrowid - self.change_log_size,))
+
+    def poll_changes(self) -> set[str]:
+        """
+        Get the namespaces that other processes have written since the last poll.
+        """
+        with self.lock:
+            rows = self.connection.execute("SELECT ID, NAMESPACE, ORIGIN FROM CHANGES WHERE ID > ? ORDER BY ID", (self.last_change,)).fetchall()
+        if len(rows) == 0:
+            return set()
+        # the IDs have no holes, so a first ID after the next one means that the rows in between have been deleted
+        lost = rows[0][0] > self.last_change + 1
+        self.last_change = rows[-1][0]
+        changed = {namespace for _, namespace, origin in rows if origin != os.getpid()}
+        if lost:
+            changed.add(self.lost_changes_namespace)
+        return changed
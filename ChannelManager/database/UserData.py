@@ -1,13 +1,20 @@
-import sqlite3
-from typing import Optional
+import asyncio, atexit, queue, sqlite3, threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
 from discord import Member
 from ChannelSettings import ChannelLiveSetting, ChannelSetting
+from Metrics import Metrics
+from database.SharedStore import SharedStore
+
+T = TypeVar("T")
 
 class UserTexts:
+    __slots__ = ("last_text_recruitment", "last_text_random", "last_text_live", "templates", "selects")
+
     def __init__(self):
         self.last_text_recruitment: Optional[str] = None
         self.last_text_random: Optional[str] = None
-        self.last_text_random: Optional[str] = None
         self.last_text_live: Optional[str] = None
         self.templates: dict[str, str] = {}
         self.selects: dict[str, str] = {}
@@ -16,128 +23,412 @@ class UserTexts:
         if select_id in self.selects:
             return self.selects[select_id]
         return None
+
+    def copy(self) -> "UserTexts":
+        ut = UserTexts()
+        ut.last_text_recruitment = self.last_text_recruitment
+        ut.last_text_random = self.last_text_random
+        ut.last_text_live = self.last_text_live
+        ut.templates = dict(self.templates)
+        ut.selects = dict(self.selects)
+        return ut
     
 
 class UserData:
     """
     The class representing a singleton that saves users data.
+    SQLite is never called on the event loop. Writes run in order on one writer thread, reads run on a small pool
+    of reader threads, every thread has its own connection, and the handlers await the results.
+    The writes that queue up while the disk syncs are committed together, so a slow sync is paid once per batch.
+    The texts are stored in USER_TEXTS_V2 without a rowid, keyed by the user, the category and the kind of the text,
+    so the texts of a user in a category are one range of the primary key.
+    The rows of the USER_TEXTS table of older versions are moved into it in batches on the writer thread.
+    The texts of the cache_capacity most recently used pairs of user and category are cached, and writes go through the cache.
+    The cache is only exact within one process. The processes of a cluster share the database, so every write is announced
+    in the change log of the shared store, and the other processes drop the entry when they poll it.
     """
 
     _instance = None
+    path = "user_data.db"
+    # the class of the connections, which can be replaced to instrument them
+    connection_factory = sqlite3.Connection
+    # number of reader threads
+    read_connections = 2
+    # number of pairs of user and category whose texts are cached
+    cache_capacity = 1024
     max_templates = 3
+    # rows moved from the old table per transaction, so that other writes never wait long for the migration
+    migration_batch_size = 1000
+    # a failed batch of the migration is retried after migration_retry_delay seconds, doubled on every failure in a row
+    migration_retries = 5
+    migration_retry_delay = 1.0
 
     last_text_recruitment = "LAST_RECRUITMENT"
     last_text_random = "LAST_RANDOM"
     last_text_live = "LAST_LIVE"
     templates_prefix = "TEMPLATE_"
     selects_prefix = "SELECTS_"
+    # prefix of the namespaces that announce the changed texts in the change log of the shared store
+    changes_namespace = "user_texts"
     
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(UserData, cls).__new__(cls)
-            cls._instance.connection = sqlite3.connect("user_data.db")
-            cls._instance.cursor = cls._instance.connection.cursor()
-            cls._instance.__create_tables_if_not_exist()
+            cls._instance.migrating = False
+            cls._instance.metrics = Metrics()
+            cls._instance._cache = OrderedDict()  # map of (user ID, category) to UserTexts, least recently used first
+            cls._instance._loading = {}  # map of (user ID, category) to the number of reads in flight
+            cls._instance._stale = set()  # keys written while they were read, whose reads must not be cached
+            cls._instance._local = threading.local()
+            cls._instance._writes = queue.Queue()  # entries of (command, future), and None to stop the writer
+            cls._instance._writer = threading.Thread(target=cls._instance.__run_writer, name="UserDataWriter", daemon=True)
+            cls._instance._writer.start()
+            atexit.register(cls._instance.close)
+            cls._instance._readers = ThreadPoolExecutor(max_workers=cls.read_connections, thread_name_prefix="UserDataReader", initializer=cls._instance.__connect, initargs=(True,))
+            # the tables are created before anything is read
+            cls._instance._ready = cls._instance.__submit_write(cls._instance.__create_tables_if_not_exist)
         return cls._instance
+
+    def __connect(self, read_only: bool):
+        connection = sqlite3.connect(self.path, factory=self.connection_factory)
+        if not read_only:
+            # the processes of a cluster share the database, so readers must not block the writer
+            connection.execute("PRAGMA journal_mode=WAL")
+        # in WAL mode a commit is synced at the next checkpoint instead of on every write
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=5000")
+        connection.execute("PRAGMA temp_store=MEMORY")
+        connection.execute("PRAGMA cache_size=-8192")
+        if read_only:
+            connection.execute("PRAGMA query_only=ON")
+        self._local.connection = connection
+
+    async def __read(self, query: Callable[[sqlite3.Connection], T]) -> T:
+        await asyncio.wrap_future(self._ready)
+        return await asyncio.wrap_future(self._readers.submit(lambda: query(self._local.connection)))
+
+    def __submit_write(self, command: Callable[[sqlite3.Connection], T]) -> "Future[T]":
+        future = Future()
+        self._writes.put((command, future))
+        return future
+
+    async def __write(self, command: Callable[[sqlite3.Connection], T]) -> T:
+        return await asyncio.wrap_future(self.__submit_write(command))
+
+    def close(self):
+        """
+        Write every queued change and stop the writer thread.
+        """
+        if self._writer.is_alive():
+            self._writes.put(None)
+            self._writer.join()
+
+    def __run_writer(self):
+        self.__connect(False)
+        connection: sqlite3.Connection = self._local.connection
+        while True:
+            batch = [self._writes.get()]
+            while not self._writes.empty():
+                batch.append(self._writes.get())
+
+            stop = None in batch
+            items = [item for item in batch if item is not None and item[1].set_running_or_notify_cancel()]
+            results = []
+            try:
+                connection.execute("BEGIN IMMEDIATE")
+                for command, future in items:
+                    # a failed command is rolled back without the other commands of the batch
+                    connection.execute("SAVEPOINT command")
+                    try:
+                        results.append((future, command(connection), None))
+                        connection.execute("RELEASE command")
+                    except Exception as e:
+                        connection.execute("ROLLBACK TO command")
+                        connection.execute("RELEASE command")
+                        results.append((future, None, e))
+                connection.commit()
+            except Exception as e:
+                if connection.in_transaction:
+                    connection.rollback()
+                results = [(future, None, e) for _, future in items]
+
+            for future, result, error in results:
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+            if stop:
+                connection.close()
+                return
     
-    def __create_tables_if_not_exist(self):
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS USER_TEXTS (
-                USER_ID TEXT,
-                TYPE TEXT,
+    def __create_tables_if_not_exist(self, connection: sqlite3.Connection):
+        connection.execute('''
+            CREATE TABLE IF NOT EXISTS USER_TEXTS_V2 (
+                USER_ID INTEGER NOT NULL,
+                CATEGORY TEXT NOT NULL,
+                KIND TEXT NOT NULL,
                 TEXT TEXT,
-                UNIQUE (USER_ID, TYPE)
-            )
+                PRIMARY KEY (USER_ID, CATEGORY, KIND)
+            ) WITHOUT ROWID
         ''')
-        self.connection.commit()
+        if connection.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'USER_TEXTS'").fetchone()[0] > 0:
+            if connection.execute("SELECT EXISTS (SELECT 1 FROM USER_TEXTS)").fetchone()[0]:
+                self.migrating = True
+                self.__migrated = 0
+                self.__migration_failures = 0
+                self.__schedule_migration()
+            else:
+                # the migration has finished in an earlier run
+                connection.execute("DROP TABLE USER_TEXTS")
+
+    @classmethod
+    def split_type(cls, type_name: str) -> tuple[str, str]:
+        """
+        Split a TYPE of the old table, which is "{category}_{kind}", into the category and the kind.
+        """
+        # the kind starts at the first prefix, since the value after it may contain the other prefix
+        indexes = [index for index in (type_name.find("_" + prefix) for prefix in (cls.templates_prefix, cls.selects_prefix)) if index >= 0]
+        if len(indexes) > 0:
+            index = min(indexes)
+            return type_name[:index], type_name[index + 1:]
+        for kind in (cls.last_text_recruitment, cls.last_text_random, cls.last_text_live):
+            if type_name.endswith("_" + kind):
+                return type_name[:-len(kind) - 1], kind
+        # the row was never read by older versions, but it is kept
+        return type_name, ""
+
+    def __schedule_migration(self):
+        self.__submit_write(self.__migrate).add_done_callback(self.__on_migrated)
+
+    def __on_migrated(self, future: Future):
+        error = future.exception()
+        if error is None:
+            self.__migration_failures = 0
+            moved = future.result()
+            self.__migrated += moved
+            if moved > 0:
+                self.__schedule_migration()
+                return
+            # the empty table is dropped at the next start, since it may still be read until the flag is seen
+            self.migrating = False
+            print(f"Migrated {self.__migrated} user texts.")
+            return
+        # the failed batch has been rolled back, and the old table stays merged into the reads until it is empty
+        self.__migration_failures += 1
+        if self.__migration_failures > self.migration_retries:
+            print(f"Gave up migrating the user texts after {self.migration_retries} retries. The old table is still read until the next start. {error}")
+            return
+        delay = self.migration_retry_delay * 2 ** (self.__migration_failures - 1)
+        print(f"Failed to migrate the user texts, retrying in {delay:.1f} seconds. {error}")
+        timer = threading.Timer(delay, self.__schedule_migration)
+        timer.daemon = True
+        timer.start()
+
+    def __migrate(self, connection: sqlite3.Connection) -> int:
+        # one batch per command, so that the writes of the handlers run between the batches.
+        # The next batch is queued once this one is committed.
+        rows = connection.execute("SELECT ROWID, USER_ID, TYPE, TEXT FROM USER_TEXTS LIMIT ?", (self.migration_batch_size,)).fetchall()
+        values = []
+        for _, user_id, type_name, text in rows:
+            if str(user_id).isdigit():
+                values.append((int(user_id), *self.split_type(type_name), text))
+        # the rows that have been written since the migration started are newer, so they are kept
+        connection.executemany("INSERT OR IGNORE INTO USER_TEXTS_V2 (USER_ID, CATEGORY, KIND, TEXT) VALUES (?, ?, ?, ?)", values)
+        connection.executemany("DELETE FROM USER_TEXTS WHERE ROWID = ?", [(row[0],) for row in rows])
+        return len(rows)
+
+    @staticmethod
+    def __get_prefix_range(prefix: str) -> tuple[str, str]:
+        # the kinds that start with the prefix, as a range of the primary key
+        return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+    def __update_cache_metrics(self):
+        hits = self.metrics.get("user_texts_cache_hits")
+        lookups = hits + self.metrics.get("user_texts_cache_misses")
+        self.metrics.set_gauge("user_texts_cache_hit_rate_percent", hits * 100 // lookups if lookups > 0 else 0)
+        self.metrics.set_gauge("user_texts_cache_size", len(self._cache))
+
+    def __set_text(self, ut: UserTexts, kind: str, text: Optional[str]):
+        if kind == self.last_text_recruitment:
+            ut.last_text_recruitment = text
+        elif kind == self.last_text_random:
+            ut.last_text_random = text
+        elif kind == self.last_text_live:
+            ut.last_text_live = text
+        elif kind.startswith(self.templates_prefix):
+            key = kind[len(self.templates_prefix):]
+            ut.templates[key] = text
+        elif kind.startswith(self.selects_prefix):
+            key = kind[len(self.selects_prefix):]
+            ut.selects[key] = text
+
+    async def __write_through(self, key: tuple[int, str], command: Callable[[sqlite3.Connection], None], update: Callable[[UserTexts], None]):
+        # the cache is updated after the commit, and a read in flight is not cached since it may have missed the write
+        try:
+            await self.__write(command)
+        except Exception:
+            self._cache.pop(key, None)
+            self.__update_cache_metrics()
+            raise
+        if key in self._loading:
+            self._stale.add(key)
+        cached = self._cache.get(key)
+        if cached is not None:
+            update(cached)
+        if SharedStore.enabled():
+            try:
+                await asyncio.to_thread(SharedStore().notify, f"{self.changes_namespace}:{key[0]}:{key[1]}")
+            except Exception as e:
+                print(f"Failed to announce the changed user texts to the cluster. {e}")
+
+    def invalidate(self, namespaces: set[str]):
+        """
+        Drop the cached texts that another process of the cluster has changed.
+        """
+        if SharedStore.lost_changes_namespace in namespaces:
+            # the changed texts are unknown, so nothing that has been cached or is being read can be trusted
+            self._cache.clear()
+            self._stale.update(self._loading)
+        for namespace in namespaces:
+            kind, _, key = namespace.partition(":")
+            user_id, _, category = key.partition(":")
+            if kind != self.changes_namespace or not user_id.isdigit():
+                continue
+            cache_key = (int(user_id), category)
+            self._cache.pop(cache_key, None)
+            if cache_key in self._loading:
+                self._stale.add(cache_key)
+        self.__update_cache_metrics()
+
+    def get_cached_user_texts(self, user: Member, category: str) -> Optional[UserTexts]:
+        """
+        Get the texts of a user in a category if they are cached, without waiting for the database.
+        The result is a copy, which the caller may change.
+        """
+        cache_key = (user.id, category)
+        cached = self._cache.get(cache_key)
+        if cached is None:
+            return None
+        self._cache.move_to_end(cache_key)
+        self.metrics.increment("user_texts_cache_hits")
+        self.__update_cache_metrics()
+        return cached.copy()
+
+    async def get_user_texts(self, user: Member, category: str) -> UserTexts:
+        """
+        Get the texts of a user in a category. The result is a copy, which the caller may change.
+        """
+        cached = self.get_cached_user_texts(user, category)
+        if cached is not None:
+            return cached
+        user_id = user.id
+        cache_key = (user_id, category)
+        self.metrics.increment("user_texts_cache_misses")
+
+        def query(connection: sqlite3.Connection):
+            rows = []
+            if self.migrating:
+                # the rows that have not been moved yet are read from the old table, and the new table takes precedence
+                old_rows = connection.execute('''
+                    SELECT TYPE, TEXT FROM USER_TEXTS
+                    WHERE USER_ID = ? AND TYPE LIKE ?
+                ''', (str(user_id), f"{category}_%")).fetchall()
+                rows += [(type_name[len(category) + 1:], text) for type_name, text in old_rows]
+
+            rows += connection.execute('''
+                SELECT KIND, TEXT FROM USER_TEXTS_V2
+                WHERE USER_ID = ? AND CATEGORY = ?
+            ''', (user_id, category)).fetchall()
+            return rows
+
+        self._loading[cache_key] = self._loading.get(cache_key, 0) + 1
+        try:
+            rows = await self.__read(query)
+        finally:
+            stale = cache_key in self._stale
+            self._loading[cache_key] -= 1
+            if self._loading[cache_key] == 0:
+                del self._loading[cache_key]
+                self._stale.discard(cache_key)
 
-    def get_user_texts(self, user: Member, category: str):
-        user_id = str(user.id)
-        search_pattern = f"{category}_%"
-        
-        self.cursor.execute('''
-            SELECT USER_ID, TYPE, TEXT FROM USER_TEXTS
-            WHERE USER_ID = ? AND TYPE LIKE ?
-        ''', (user_id, search_pattern))
-        
-        results = self.cursor.fetchall()
-        
         ut = UserTexts()
-        for row in results:
-            type_name = row[1][len(category) + 1:]
-            if type_name == self.last_text_recruitment:
-                ut.last_text_recruitment = row[2]
-            elif type_name == self.last_text_random:
-                ut.last_text_random = row[2]
-            elif type_name == self.last_text_live:
-                ut.last_text_live = row[2]
-            elif type_name.startswith(self.templates_prefix):
-                key = type_name[len(self.templates_prefix):]
-                ut.templates[key] = row[2]    
-            elif type_name.startswith(self.selects_prefix):
-                key = type_name[len(self.selects_prefix):]
-                ut.selects[key] = row[2]
+        for kind, text in rows:
+            self.__set_text(ut, kind, text)
+        if not stale and self.cache_capacity > 0 and cache_key not in self._cache:
+            self._cache[cache_key] = ut.copy()
+            if len(self._cache) > self.cache_capacity:
+                self._cache.popitem(last=False)
+        self.__update_cache_metrics()
         return ut
 
-    def push_history(self, user: Member, live_setting: ChannelLiveSetting, channel_setting: ChannelSetting):
+    async def push_history(self, user: Member, live_setting: ChannelLiveSetting, channel_setting: ChannelSetting):
         """
         Update the last used texts for a user using UPSERT operation.
         """
-        user_id = str(user.id)
         category = channel_setting.category
         
+        # the values are collected now, since the settings may change before the write runs
         updates = []
         
         # recruitment text
         if live_setting.message is not None:
-            type_name = f"{category}_{self.last_text_recruitment}"
-            updates.append((user_id, type_name, live_setting.message))
+            updates.append((user.id, category, self.last_text_recruitment, live_setting.message))
         
         # with random status
         if channel_setting.with_random_status and live_setting.random_status is not None:
-            type_name = f"{category}_{self.last_text_random}"
-            updates.append((user_id, type_name, live_setting.random_status))
+            updates.append((user.id, category, self.last_text_random, live_setting.random_status))
         
         # with live status
         if channel_setting.with_live_status and live_setting.live_status is not None:
-            type_name = f"{category}_{self.last_text_live}"
-            updates.append((user_id, type_name, live_setting.live_status))
+            updates.append((user.id, category, self.last_text_live, live_setting.live_status))
         
         for k, v in live_setting.selects.items():
-            type_name = f"{category}_{self.selects_prefix}{k}"
-            updates.append((user_id, type_name, v))
-
-        # update the database
-        for update in updates:
-            self.cursor.execute('''
-                INSERT INTO USER_TEXTS (USER_ID, TYPE, TEXT)
-                VALUES (?, ?, ?)
-                ON CONFLICT(USER_ID, TYPE) DO UPDATE SET 
+            updates.append((user.id, category, f"{self.selects_prefix}{k}", v))
+
+        def command(connection: sqlite3.Connection):
+            connection.executemany('''
+                INSERT INTO USER_TEXTS_V2 (USER_ID, CATEGORY, KIND, TEXT)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(USER_ID, CATEGORY, KIND) DO UPDATE SET
                 TEXT = excluded.TEXT
-            ''', update)
-        
-        self.connection.commit()
+            ''', updates)
+            if self.migrating:
+                # the old rows must not be moved over the new ones
+                connection.executemany('''
+                    DELETE FROM USER_TEXTS
+                    WHERE USER_ID = ? AND TYPE = ?
+                ''', [(str(user_id), f"{category}_{kind}") for user_id, category, kind, _ in updates])
 
-    def push_template(self, user: Member, templates: dict[str,str], category: str):
+        def update(ut: UserTexts):
+            for _, _, kind, text in updates:
+                self.__set_text(ut, kind, text)
+        await self.__write_through((user.id, category), command, update)
+
+    async def push_template(self, user: Member, templates: dict[str,str], category: str):
         """
         Update the template text for a user using UPSERT operation.
         """
-        user_id = str(user.id)
-        
-        # delete old templates
-        template_search_pattern = f"{category}_{self.templates_prefix}%"
-        self.cursor.execute('''
-            DELETE FROM USER_TEXTS
-            WHERE USER_ID = ? AND TYPE LIKE ?
-        ''', (user_id, template_search_pattern))
-        
-        # insert new templates
-        for key, text in templates.items():
-            type_name = f"{category}_{self.templates_prefix}{key}"
-            self.cursor.execute('''
-                INSERT INTO USER_TEXTS (USER_ID, TYPE, TEXT)
-                VALUES (?, ?, ?)
-            ''', (user_id, type_name, text))
-        
-        self.connection.commit()
+        user_id = user.id
+        values = [(user_id, category, f"{self.templates_prefix}{key}", text) for key, text in templates.items()]
+
+        def command(connection: sqlite3.Connection):
+            # delete old templates
+            connection.execute('''
+                DELETE FROM USER_TEXTS_V2
+                WHERE USER_ID = ? AND CATEGORY = ? AND KIND >= ? AND KIND < ?
+            ''', (user_id, category, *self.__get_prefix_range(self.templates_prefix)))
+            if self.migrating:
+                connection.execute('''
+                    DELETE FROM USER_TEXTS
+                    WHERE USER_ID = ? AND TYPE LIKE ?
+                ''', (str(user_id), f"{category}_{self.templates_prefix}%"))
+
+            # insert new templates
+            connection.executemany('''
+                INSERT INTO USER_TEXTS_V2 (USER_ID, CATEGORY, KIND, TEXT)
+                VALUES (?, ?, ?, ?)
+            ''', values)
 
+        def update(ut: UserTexts):
+            ut.templates = {kind[len(self.templates_prefix):]: text for _, _, kind, text in values}
+        await self.__write_through((user_id, category), command, update)
@@ -0,0 +1,52 @@
+import asyncio
+from discord.ext import commands, tasks
+from ChannelSettings import ChannelSettings
+from Cluster import mark_ready
+from GameVoiceChannelManager import GameVoiceChannelManager
+
+class ChannelSettingsEvents(commands.Cog):
+    """
+    Migrates the settings of older versions into the guild shards once the bot is ready,
+    and evicts the settings of guilds that have not been used for a while.
+    """
+
+    evict_interval = 60.0
+
+    def __init__(self, bot):
+        self.bot = bot
+        # set once the settings are in the guild shards, so that the voice channels can be restored
+        self.migrated = asyncio.Event()
+        self.migrate_task = None
+
+    async def cog_load(self):
+        self.migrate_task = asyncio.create_task(self.__migrate_when_ready())
+        self.evict_settings.change_interval(seconds=self.evict_interval)
+        self.evict_settings.start()
+
+    async def cog_unload(self):
+        self.evict_settings.cancel()
+        if self.migrate_task is not None:
+            self.migrate_task.cancel()
+
+    async def __migrate_when_ready(self):
+        await self.bot.wait_until_ready()
+        try:
+            migrated = ChannelSettings().migrate(self.bot.guilds)
+            if migrated > 0:
+                print(f"Migrated the settings of {migrated} categories.")
+        except Exception as e:
+            print(f"Failed to migrate the settings. {e}")
+        self.migrated.set()
+        # the other processes of a cluster start once the command tree is synced and the settings are migrated
+        mark_ready()
+
+    @tasks.loop(seconds=60.0)
+    async def evict_settings(self):
+        # the settings of guilds with live voice channels are referenced by them, so they are kept
+        pinned = set()
+        for manager in GameVoiceChannelManager.shards():
+            pinned.update(manager.get_guild_ids())
+        ChannelSettings().evict(pinned)
+
+async def setup(bot):
+    await bot.add_cog(ChannelSettingsEvents(bot))
@@ -0,0 +1,107 @@
+﻿import asyncio
+from discord.ext import commands, tasks
+from ChannelSettings import ChannelSettings
+from GameVoiceChannelManager import GameVoiceChannelManager
+from database.ChannelStateStore import ChannelStateStore
+from IngressFilter import IngressFilter
+
+class ChannelStateEvents(commands.Cog):
+    """
+    Saves the state of the managed voice channels periodically and on shutdown,
+    restores it once the bot is ready after a restart, and reconciles it with
+    the gateway voice states at startup and after every reconnect.
+    """
+
+    snapshot_interval = 60.0
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.restored = False
+        self.restore_task = None
+
+    async def cog_load(self):
+        self.restore_task = asyncio.create_task(self.__restore_when_ready())
+
+    async def cog_unload(self):
+        self.save_snapshot.cancel()
+        if self.restore_task is not None:
+            self.restore_task.cancel()
+        if self.restored:
+            await self.__save()
+
+    async def __restore_when_ready(self):
+        await self.bot.wait_until_ready()
+        # the settings must be in the guild shards before the voice channels are restored
+        settings_events = self.bot.get_cog("ChannelSettingsEvents")
+        if settings_events is not None:
+            await settings_events.migrated.wait()
+        await asyncio.gather(*(ChannelSettings().preload(guild.id) for guild in self.bot.guilds))
+        data = await asyncio.to_thread(ChannelStateStore().load)
+        for shard_id in self.__get_shard_ids():
+            try:
+                restored = await GameVoiceChannelManager(shard_id).restore(self.bot, data)
+                print(f"Restored {restored} voice channels of shard {shard_id}.")
+            except Exception as e:
+                print(f"Failed to restore the channel state of shard {shard_id}. {e}")
+        # the snapshot must not be overwritten before it has been read
+        self.restored = True
+        self.save_snapshot.change_interval(seconds=self.snapshot_interval)
+        self.save_snapshot.start()
+        await asyncio.gather(*(self.__reconcile(shard_id) for shard_id in self.__get_shard_ids()))
+
+    def __is_sharded(self) -> bool:
+        return isinstance(self.bot, commands.AutoShardedBot)
+
+    def __get_shard_ids(self) -> list[int]:
+        if self.__is_sharded():
+            return sorted(self.bot.shards.keys())
+        return [0]
+
+    async def __reconcile(self, shard_id: int):
+        # voice states may have changed while the bot was not receiving events
+        guilds = [guild for guild in self.bot.guilds if guild.shard_id == shard_id]
+        # the settings of every configured guild are needed, so they are loaded in the background first
+        await asyncio.gather(*(ChannelSettings().preload(guild.id) for guild in guilds))
+        IngressFilter(shard_id).rebuild(guilds)
+        try:
+            changed = await GameVoiceChannelManager(shard_id).reconcile(guilds)
+            print(f"Reconciled {changed} voice channels of shard {shard_id}.")
+        except Exception as e:
+            print(f"Failed to reconcile the voice channels of shard {shard_id}. {e}")
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # on_ready is dispatched again when the gateway starts a new session
+        if self.restored and not self.__is_sharded():
+            await self.__reconcile(0)
+
+    @commands.Cog.listener()
+    async def on_resumed(self):
+        if self.restored and not self.__is_sharded():
+            await self.__reconcile(0)
+
+    # a sharded bot reconnects each shard on its own, so only that shard is reconciled
+
+    @commands.Cog.listener()
+    async def on_shard_ready(self, shard_id: int):
+        if self.restored:
+            await self.__reconcile(shard_id)
+
+    @commands.Cog.listener()
+    async def on_shard_resumed(self, shard_id: int):
+        if self.restored:
+            await self.__reconcile(shard_id)
+
+    async def __save(self):
+        data = {manager.shard_id: manager.to_snapshot() for manager in GameVoiceChannelManager.shards()}
+        try:
+            await asyncio.to_thread(ChannelStateStore().save, data)
+        except Exception as e:
+            print(f"Failed to save the channel state. {e}")
+
+    @tasks.loop(seconds=60.0)
+    async def save_snapshot(self):
+        await self.__save()
+
+async def setup(bot):
+    await bot.add_cog(ChannelStateEvents(bot))
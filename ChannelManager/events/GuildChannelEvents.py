@@ -0,0 +1,18 @@
+import discord
+from discord.ext import commands
+from ChannelCache import ChannelCache
+
+class GuildChannelEvents(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before, after):
+        ChannelCache(after.guild.shard_id).invalidate(after.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        ChannelCache(channel.guild.shard_id).invalidate(channel.id)
+
+async def setup(bot):
+    await bot.add_cog(GuildChannelEvents(bot))
@@ -0,0 +1,37 @@
+import asyncio
+from discord.ext import commands, tasks
+from ChannelSettings import ChannelSettings
+from database.SharedStore import SharedStore
+from database.UserData import UserData
+
+class SharedStoreEvents(commands.Cog):
+    """
+    Polls the change log of the shared store, and reloads the settings and drops the cached user texts that other processes of the cluster have changed.
+    """
+
+    poll_interval = 1.0
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    async def cog_load(self):
+        if not SharedStore.enabled():
+            return
+        self.poll_changes.change_interval(seconds=self.poll_interval)
+        self.poll_changes.start()
+
+    async def cog_unload(self):
+        self.poll_changes.cancel()
+
+    @tasks.loop(seconds=1.0)
+    async def poll_changes(self):
+        try:
+            changed = await asyncio.to_thread(SharedStore().poll_changes)
+            if len(changed) > 0:
+                await ChannelSettings().reload(changed)
+                UserData().invalidate(changed)
+        except Exception as e:
+            print(f"Failed to poll the shared store. {e}")
+
+async def setup(bot):
+    await bot.add_cog(SharedStoreEvents(bot))
@@ -1,40 +1,73 @@
 import discord
 from discord.ext import commands
+from ChannelSettings import ChannelSettings
 from GameVoiceChannelManager import GameVoiceChannelManager
+from IngressFilter import IngressFilter
+from SpectatorRegistry import SpectatorRegistry
 import NicknameUtils
 
 class VoiceChannelEvents(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    # the members in voice channels are tracked as soon as a guild is loaded,
+    # since the managed voice channels are only collected after the channel state has been restored
+
+    @commands.Cog.listener()
+    async def on_guild_available(self, guild):
+        IngressFilter(guild.shard_id).seed(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild):
+        IngressFilter(guild.shard_id).seed(guild)
+
     @commands.Cog.listener()
     async def on_voice_state_update(self, member, before, after):
         # Ignore bot members
         if member.bot:
             return
+
+        # the first event of a configured guild loads its settings in the background
+        await ChannelSettings().preload(member.guild.id)
         
-        # If the voice channel has not changed, do nothing
-        if before.channel == after.channel:
+        # If the voice channel has not changed or is not managed, do nothing
+        if not IngressFilter(member.guild.shard_id).accept_voice_state(member, before, after):
             return
 
+        manager = GameVoiceChannelManager.for_guild(member.guild)
+
         if before.channel is not None:
-            await GameVoiceChannelManager().on_left_member(member, before.channel)
+            left_channel = before.channel
+            async def on_left():
+                await manager.on_left_member(member, left_channel)
+            manager.post_event(left_channel.id, on_left)
 
         if after.channel is not None:
-            await GameVoiceChannelManager().on_join_member(member, after.channel)
+            joined_channel = after.channel
+            async def on_join():
+                await manager.on_join_member(member, joined_channel)
+            manager.post_event(joined_channel.id, on_join)
 
     @commands.Cog.listener()
     async def on_member_update(self, before, after):
+        # Most updates are of members who are not in a managed voice channel
+        if not IngressFilter(after.guild.shard_id).accept_member_update(after):
+            return
+
+        # a spectator role added or removed by hand is reported to the channel by the registry
+        SpectatorRegistry().on_member_update(before, after)
+
         if NicknameUtils.is_spectator(before) == NicknameUtils.is_spectator(after):
             return
 
         if after.voice == None or after.voice.channel == None:
             return
         
-        vc = GameVoiceChannelManager().get_channel(after.voice.channel.id)
+        manager = GameVoiceChannelManager.for_guild(after.guild)
+        vc = manager.get_channel(after.voice.channel.id)
 
         if vc is not None:
-            await vc.on_update_member()
+            manager.post_event(vc.vc_id, lambda: vc.on_update_member(after))
 
 async def setup(bot):
     await bot.add_cog(VoiceChannelEvents(bot))
\ No newline at end of file
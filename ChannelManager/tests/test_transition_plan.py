@@ -0,0 +1,63 @@
+"""
+Check the dependency edges of the transition plans of a voice channel.
+
+Usage: python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ChannelSettings import ChannelSetting
+from GameVoiceChannel import GameVoiceChannel
+
+def build_voice_channel(single_panel: bool) -> GameVoiceChannel:
+    guild = SimpleNamespace(id=1, shard_id=0)
+    voice_channel = SimpleNamespace(id=10, guild=guild, members=[])
+    return GameVoiceChannel(voice_channel, ChannelSetting(recruitment_channel=20, single_panel=single_panel))
+
+def message(message_id: int) -> SimpleNamespace:
+    return SimpleNamespace(id=message_id)
+
+class OwnerTransitionPlanTest(unittest.TestCase):
+
+    def test_owner_set(self):
+        channel = build_voice_channel(False)
+        channel.no_owner_ui_message = message(1)
+        plan = channel.plan_owner_transition(SimpleNamespace(id=100))
+        self.assertEqual(plan.names(), ["clear_status", "delete_no_owner_ui", "show_management_ui", "show_recruitment_ui"])
+        self.assertEqual(plan.dependencies("show_recruitment_ui"), ("show_management_ui",))
+        self.assertEqual(plan.dependencies("show_management_ui"), ())
+        self.assertEqual(plan.dependencies("delete_no_owner_ui"), ())
+
+    def test_owner_set_single_panel(self):
+        channel = build_voice_channel(True)
+        plan = channel.plan_owner_transition(SimpleNamespace(id=100))
+        self.assertEqual(plan.names(), ["clear_status", "ensure_owner_is_player", "show_recruitment_ui"])
+        # the panel takes the place of the management UI, which makes the owner a player first
+        self.assertEqual(plan.dependencies("show_recruitment_ui"), ("ensure_owner_is_player",))
+
+    def test_owner_cleared(self):
+        channel = build_voice_channel(False)
+        channel.recruitment_message = message(1)
+        channel.management_ui_message = message(2)
+        channel.recruitment_ui_message = message(3)
+        plan = channel.plan_owner_transition(None)
+        self.assertEqual(plan.names(), ["clear_status", "delete_recruitment_message", "show_no_owner_ui", "delete_management_ui", "delete_recruitment_ui"])
+        for name in plan.names():
+            self.assertEqual(plan.dependencies(name), ())
+
+    def test_teardown(self):
+        channel = build_voice_channel(False)
+        channel.recruitment_message = message(1)
+        channel.no_owner_ui_message = message(2)
+        channel.panel_message = message(3)
+        plan = channel.plan_teardown()
+        self.assertEqual(plan.names(), ["delete_recruitment_message", "delete_no_owner_ui", "delete_panel"])
+        for name in plan.names():
+            self.assertEqual(plan.dependencies(name), ())
+
+if __name__ == "__main__":
+    unittest.main()
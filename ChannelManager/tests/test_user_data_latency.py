@@ -0,0 +1,62 @@
+"""
+Check that reading and writing user texts never stalls the event loop, even when every commit waits for a slow fsync.
+
+Usage: python -m unittest discover tests
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from ChannelSettings import ChannelLiveSetting, ChannelSetting
+from database.UserData import UserData
+from user_data_latency_benchmark import SlowFsyncConnection, run
+
+class UserDataLatencyTest(unittest.TestCase):
+
+    # seconds a commit takes, which the event loop would stall for if it ran there
+    fsync_delay = 0.05
+    handlers = 50
+    # the event loop must wake up this late at most, in 99% of the heartbeats
+    max_p99_lag = 0.02
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path, self.connection_factory = UserData.path, UserData.connection_factory
+        UserData.path = os.path.join(self.directory.name, "user_data.db")
+        UserData.connection_factory = SlowFsyncConnection
+        SlowFsyncConnection.delay = self.fsync_delay
+        UserData._instance = None
+
+    def tearDown(self):
+        UserData().close()
+        UserData._instance = None
+        UserData.path, UserData.connection_factory = self.path, self.connection_factory
+        self.directory.cleanup()
+
+    def test_event_loop_lag_under_slow_fsync(self):
+        user_data = UserData()
+        channel_setting = ChannelSetting(category="DEFAULT", with_random_status=True)
+        live_setting = ChannelLiveSetting("可", "可", 4, "誰でもどうぞ！", {"RANK": "Gold"})
+
+        async def handler(user):
+            await user_data.get_user_texts(user, "DEFAULT")
+            await user_data.push_history(user, live_setting, channel_setting)
+
+        async def measure():
+            # the tables are created by the first call
+            await user_data.get_user_texts(SimpleNamespace(id=0), "DEFAULT")
+            return await run(handler, self.handlers)
+
+        lags, latencies = asyncio.run(measure())
+        self.assertEqual(len(latencies), self.handlers)
+        lags.sort()
+        self.assertLess(lags[int(len(lags) * 0.99)], self.max_p99_lag)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,9 +5,9 @@ from typing import Awaitable, Optional, Union, List, Callable, Protocol
 
 from discord.ui import UserSelect
 from ChannelSettings import ChannelLiveSetting, ChannelSetting
-import NicknameUtils
+import SpectatorUtils
 from ui.RecruitmentUI import UserData
-from ui.DeleteTemplateUI import DeleteTemplateUI
+from ui.DeleteTemplateUI import DeleteTemplateUI, DeleteTemplateView
 
 class ManagementUICallbacks:
 
@@ -25,7 +25,7 @@ class ManagementUICallbacks:
         self.on_change_max_users = on_change_max_users
 
 class TemplateTextModal(discord.ui.Modal):
-    def __init__(self, templates: dict[str,str], category: str, text: str):
+    def __init__(self, templates: Optional[dict[str,str]], category: str, text: str):
         super().__init__(title="定型文の登録")
 
         self.add_item(
@@ -43,9 +43,30 @@ class TemplateTextModal(discord.ui.Modal):
 
     async def on_submit(self, interaction: discord.Interaction) -> None:
         user_input = self.children[0].value
-        self.templates[user_input] = self.text
-        UserData().push_template(interaction.user, self.templates, self.category)
-        await interaction.response.send_message("定型文を登録しました。", delete_after=5)
+        # the interaction is deferred first, since the read and the write may wait for the commits queued before them
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        templates = self.templates
+        if templates is None:
+            # the templates were not cached when the modal was opened, so they are read now
+            templates = (await UserData().get_user_texts(interaction.user, self.category)).templates
+            if user_input not in templates and len(templates) >= UserData.max_templates:
+                async def save_after_delete(interaction: discord.Interaction):
+                    await interaction.response.defer(ephemeral=True, thinking=True)
+                    await self.__save(interaction, templates, user_input)
+                view = DeleteTemplateView(templates, save_after_delete)
+                await interaction.followup.send("定型文の保存数が上限に達しています。\n削除する定型文を選択してください。", view=view, ephemeral=True)
+                return
+        await self.__save(interaction, templates, user_input)
+
+    async def __save(self, interaction: discord.Interaction, templates: dict[str,str], name: str):
+        # the result is reported only after the write, so a failed write is never reported as saved
+        templates[name] = self.text
+        try:
+            await UserData().push_template(interaction.user, templates, self.category)
+            await interaction.followup.send("定型文を登録しました。", ephemeral=True)
+        except Exception as e:
+            print(f"An error occurred while saving the templates of {interaction.user.id}. {e}")
+            await interaction.followup.send("定型文の登録に失敗しました。", ephemeral=True)
         
 class NumberSelectView(discord.ui.View):
     def __init__(self, owner: discord.Member, callback: Callable[[discord.Interaction, int], None]):
@@ -74,7 +95,7 @@ class ManagementView(discord.ui.View):
                 if await self.__can_use(interaction) and await self.__has_settings(interaction):
                     await interaction.response.send_message(content="募集人数を選択してください。", ephemeral=True, delete_after=20, view=NumberSelectView(self.owner, self.callbacks.on_change_max_users))
 
-            button_number = discord.ui.Button(label="募集人数を変更", style=discord.ButtonStyle.gray, emoji="👥")
+            button_number = discord.ui.Button(label="募集人数を変更", style=discord.ButtonStyle.gray, emoji="👥", custom_id="vcmg:management:max_users")
             button_number.callback = number_callback
             button_number.row = 2
             self.add_item(button_number)
@@ -94,21 +115,21 @@ class ManagementView(discord.ui.View):
             return False
         return True
 
-    @discord.ui.button(label="観戦する", style=discord.ButtonStyle.gray, emoji="👀", row = 0)
+    @discord.ui.button(label="観戦する", style=discord.ButtonStyle.gray, emoji="👀", row = 0, custom_id="vcmg:management:spectator")
     async def change_to_spectator_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        result = await NicknameUtils.change_to_spectator(interaction.user)
+        result = await SpectatorUtils.change_to_spectator(interaction.user, self.channel_settings)
         await interaction.response.send_message(result[1], ephemeral=True, delete_after=5)
         if result[0]:
             await self.callbacks.on_change_to_spectator(interaction)
 
-    @discord.ui.button(label="参加する", style=discord.ButtonStyle.green, emoji="🎮", row = 0)
+    @discord.ui.button(label="参加する", style=discord.ButtonStyle.green, emoji="🎮", row = 0, custom_id="vcmg:management:player")
     async def change_to_player_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        result = await NicknameUtils.change_to_player(interaction.user)
+        result = await SpectatorUtils.change_to_player(interaction.user, self.channel_settings)
         await interaction.response.send_message(result[1], ephemeral=True, delete_after=5)
         if result[0]:
             await self.callbacks.on_change_to_player(interaction)
 
-    @discord.ui.button(label="募集文を編集", style=discord.ButtonStyle.grey, emoji="📝", row = 1)
+    @discord.ui.button(label="募集文を編集", style=discord.ButtonStyle.grey, emoji="📝", row = 1, custom_id="vcmg:management:edit_recruitment")
     async def edit_recruitment(self, interaction: discord.Interaction, button: discord.ui.Button):
         if await self.__can_use(interaction):
             result = await self.callbacks.on_edit_recruitment(interaction)
@@ -117,20 +138,23 @@ class ManagementView(discord.ui.View):
             else:
                 await interaction.response.send_message(result[1], 5)
 
-    @discord.ui.button(label="定型文に保存", style=discord.ButtonStyle.grey, emoji="💿", row = 1)
+    @discord.ui.button(label="定型文に保存", style=discord.ButtonStyle.grey, emoji="💿", row = 1, custom_id="vcmg:management:save_template")
     async def save_template(self, interaction: discord.Interaction, button: discord.ui.Button):
         if await self.__can_use(interaction) and await self.__has_settings(interaction):
-            templates = UserData().get_user_texts(interaction.user, self.channel_settings.category).templates
+            # a modal cannot follow a deferred response, so the database is never awaited here;
+            # the templates are usually cached since the recruitment UI read them, and otherwise the modal reads them on submit
+            user_texts = UserData().get_cached_user_texts(interaction.user, self.channel_settings.category)
+            templates = user_texts.templates if user_texts is not None else None
 
             async def send_modal(interaction: discord.Interaction):
                 await interaction.response.send_modal(TemplateTextModal(templates, self.channel_settings.category, self.live_settings.message))
 
-            if len(templates) >= UserData.max_templates:
+            if templates is not None and len(templates) >= UserData.max_templates:
                 await DeleteTemplateUI.send_edit_recruitment_message(interaction, templates, send_modal)
             else:
                 await send_modal(interaction)
 
-    @discord.ui.button(label="募集主を譲渡する", style=discord.ButtonStyle.red, emoji="✖", row = 1)
+    @discord.ui.button(label="募集主を譲渡する", style=discord.ButtonStyle.red, emoji="✖", row = 1, custom_id="vcmg:management:release_owner")
     async def release_owner(self, interaction: discord.Interaction, button: discord.ui.Button):
         if await self.__can_use(interaction):
             await self.callbacks.on_release_owner(interaction)
@@ -140,26 +164,14 @@ class ManagementView(discord.ui.View):
 class ManagementUI:
 
     @staticmethod
-    async def send_management_message(voice_channel: discord.VoiceChannel, channel_settings: ChannelSetting, live_settings: Optional[ChannelLiveSetting], owner: discord.Member, callbacks: ManagementUICallbacks) -> Optional[discord.Message]:
-        try:
-            if voice_channel is None:
-                print("Channel is None!")
-                return None
-            
-            # Generate the embed message
-            embed = discord.Embed(
-                title="VC管理",
-                description="部屋主: " + owner.display_name,
-                color=discord.Color.blue()
-            )
-            
-            # Generate view for owner offer
-            view = ManagementView(callbacks, channel_settings, live_settings, owner)
-            
-            # Send the message
-            message = await voice_channel.send(embed=embed, view=view)
-            return message
-            
-        except Exception as e:
-            print(f"An error occurred while sending the message {e}")
-            return None
+    def build_management_message(channel_settings: ChannelSetting, live_settings: Optional[ChannelLiveSetting], owner: discord.Member, callbacks: ManagementUICallbacks) -> tuple[discord.Embed, ManagementView]:
+        # Generate the embed message
+        embed = discord.Embed(
+            title="VC管理",
+            description="部屋主: " + owner.display_name,
+            color=discord.Color.blue()
+        )
+        
+        # Generate view for owner offer
+        view = ManagementView(callbacks, channel_settings, live_settings, owner)
+        return embed, view
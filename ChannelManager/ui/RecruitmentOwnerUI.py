@@ -15,7 +15,7 @@ class RecruitmentOwnerView(discord.ui.View):
         super().__init__(timeout=None)
         self.callbacks = callbacks
         
-    @discord.ui.button(label="募集主になる", style=discord.ButtonStyle.primary, emoji="💬")
+    @discord.ui.button(label="募集主になる", style=discord.ButtonStyle.primary, emoji="💬", custom_id="vcmg:owner:request")
     async def become_admin_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         result = await self.callbacks.on_recruitment_owner(interaction)
 
@@ -32,27 +32,14 @@ class RecruitmentOwnerView(discord.ui.View):
 class RecruitmentOwnerUI:
 
     @staticmethod
-    async def send_owner_selection_message(voice_channel: discord.VoiceChannel, callbacks: RecruitmentOwnerUICallbacks) -> Optional[discord.Message]:
-
-        try:
-            if voice_channel is None:
-                print("Channel is None!")
-                return None
-            
-            # Generate the embed message
-            embed = discord.Embed(
-                title="募集主がいません！",
-                description="次に募集するユーザが下のボタンを押してください。",
-                color=discord.Color.blue()
-            )
-            
-            # Generate view for owner offer
-            view = RecruitmentOwnerView(callbacks)
-            
-            # Send the message
-            message = await voice_channel.send(embed=embed, view=view)
-            return message
-            
-        except Exception as e:
-            print(f"An error occurred while sending the message {e}")
-            return None
+    def build_owner_selection_message(callbacks: RecruitmentOwnerUICallbacks) -> tuple[discord.Embed, RecruitmentOwnerView]:
+        # Generate the embed message
+        embed = discord.Embed(
+            title="募集主がいません！",
+            description="次に募集するユーザが下のボタンを押してください。",
+            color=discord.Color.blue()
+        )
+        
+        # Generate view for owner offer
+        view = RecruitmentOwnerView(callbacks)
+        return embed, view
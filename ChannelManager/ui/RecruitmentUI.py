@@ -4,7 +4,7 @@ from discord.ext import commands
 from typing import Awaitable, Optional, Union, List, Callable, Protocol
 from ChannelSettings import ChannelSetting, ChannelLiveSetting, ChannelSettings, SelectsSetting
 import NicknameUtils
-from database.UserData import UserData
+from database.UserData import UserData, UserTexts
 
 class RecruimentUICallbacks:
     def __init__(self, 
@@ -49,9 +49,9 @@ class CustomSelectsView(discord.ui.View):
 
 
 class RecruimentView(discord.ui.View):
-    def __init__(self, callbacks: RecruimentUICallbacks, embed_updater: Callable[[str], Awaitable[None]], owner: discord.Member, channel_settings: ChannelSetting, live_settings: Optional[ChannelLiveSetting]):
+    def __init__(self, callbacks: RecruimentUICallbacks, embed_updater: Callable[[str], Awaitable[None]], owner: discord.Member, channel_settings: ChannelSetting, live_settings: Optional[ChannelLiveSetting], user_texts: UserTexts):
         super().__init__(timeout=None)
-        self.user_texts = UserData().get_user_texts(owner, channel_settings.category)
+        self.user_texts = user_texts
         self.callbacks = callbacks
         self.owner = owner
         self.text = (live_settings is not None and live_settings.message) or self.user_texts.last_text_recruitment or "誰でもどうぞ！"
@@ -82,7 +82,7 @@ class RecruimentView(discord.ui.View):
             return False
         return True
 
-    @discord.ui.button(label="募集文を編集", style=discord.ButtonStyle.gray, emoji="📝",row=0)
+    @discord.ui.button(label="募集文を編集", style=discord.ButtonStyle.gray, emoji="📝",row=0, custom_id="vcmg:recruitment:edit_text")
     async def edit_text(self, interaction: discord.Interaction, button: discord.ui.Button):
         if await self.__can_edit(interaction):
             await interaction.response.send_modal(RecruimentTextModal("募集文を編集", "募集文", self.__update_text))
@@ -111,21 +111,24 @@ class RecruimentView(discord.ui.View):
             embed.add_field(name="ゲーム中の雑談可否", value=self.random_status, inline=False)
 
         # Show custom selections
-        for selects_id in self.channel_settings.selects:
-            selects_setting: Optional[SelectsSetting] = ChannelSettings().get_selects_setting(selects_id)
-            if selects_id is None:
+        for field in ChannelSettings().get_render_plan(self.owner.guild.id, self.channel_settings).fields:
+            if not field.enabled:
                 continue
-            select = (self.selects[selects_id] if selects_id in self.selects else None) or selects_setting.default_value or "(未設定)"
-            embed.add_field(name=selects_setting.label, value=select, inline=False)
+            select = self.selects.get(field.selects_id) or field.default_value or "(未設定)"
+            embed.add_field(name=field.label, value=select, inline=False)
         return embed;
 
     def __add_post_item(self):
         async def post_callback(interaction: discord.Interaction):
             live_setting = ChannelLiveSetting(self.live_status, self.random_status, self.last_max_number, self.text, self.selects)
-            UserData().push_history(self.owner, live_setting, self.channel_settings)
+            # the interaction is answered first, since the write may wait for the commits queued before it
             await self.callbacks.on_start_recruiment(interaction, live_setting)
+            try:
+                await UserData().push_history(self.owner, live_setting, self.channel_settings)
+            except Exception as e:
+                print(f"An error occurred while saving the history of {self.owner.id}. {e}")
 
-        button = discord.ui.Button(label="投稿", style=discord.ButtonStyle.green)
+        button = discord.ui.Button(label="投稿", style=discord.ButtonStyle.green, custom_id="vcmg:recruitment:post")
         button.callback = post_callback
         button.row = self.unused_row
         self.add_item(button)
@@ -146,17 +149,17 @@ class RecruimentView(discord.ui.View):
         async def deny_callback(interaction: discord.Interaction):
             await binary_callback(False, interaction)
 
-        button = discord.ui.Button(label="カスタム配信設定",emoji="🎥", style=discord.ButtonStyle.grey)
+        button = discord.ui.Button(label="カスタム配信設定",emoji="🎥", style=discord.ButtonStyle.grey, custom_id="vcmg:recruitment:live_custom")
         button.callback = button_callback
         button.row = self.unused_row
         self.add_item(button)
 
-        button_allowed = discord.ui.Button(label="配信を許可", style=discord.ButtonStyle.green)
+        button_allowed = discord.ui.Button(label="配信を許可", style=discord.ButtonStyle.green, custom_id="vcmg:recruitment:live_allow")
         button_allowed.callback = allow_callback
         button_allowed.row = self.unused_row
         self.add_item(button_allowed)
 
-        button_denied = discord.ui.Button(label="配信を禁止", style=discord.ButtonStyle.red)
+        button_denied = discord.ui.Button(label="配信を禁止", style=discord.ButtonStyle.red, custom_id="vcmg:recruitment:live_deny")
         button_denied.callback = deny_callback
         button_denied.row = self.unused_row
         self.add_item(button_denied)
@@ -178,17 +181,17 @@ class RecruimentView(discord.ui.View):
         async def deny_callback(interaction: discord.Interaction):
             await binary_callback(False, interaction)
 
-        button = discord.ui.Button(label="カスタム雑談設定", emoji="💬", style=discord.ButtonStyle.grey)
+        button = discord.ui.Button(label="カスタム雑談設定", emoji="💬", style=discord.ButtonStyle.grey, custom_id="vcmg:recruitment:random_custom")
         button.callback = button_callback
         button.row = self.unused_row
         self.add_item(button)
 
-        button_allowed = discord.ui.Button(label="雑談を許可", style=discord.ButtonStyle.green)
+        button_allowed = discord.ui.Button(label="雑談を許可", style=discord.ButtonStyle.green, custom_id="vcmg:recruitment:random_allow")
         button_allowed.callback = allow_callback
         button_allowed.row = self.unused_row
         self.add_item(button_allowed)
 
-        button_denied = discord.ui.Button(label="雑談を禁止", style=discord.ButtonStyle.red)
+        button_denied = discord.ui.Button(label="雑談を禁止", style=discord.ButtonStyle.red, custom_id="vcmg:recruitment:random_deny")
         button_denied.callback = deny_callback
         button_denied.row = self.unused_row
         self.add_item(button_denied)
@@ -196,17 +199,12 @@ class RecruimentView(discord.ui.View):
         self.unused_row += 1
 
     def __add_custom_selects_item(self):
-        valid_selects: list[tuple[str, SelectsSetting]] = []
-        for selects_id in self.channel_settings.selects:
-            selects = ChannelSettings().get_selects_setting(selects_id)
-            if selects is not None:
-                valid_selects.append([selects_id, selects])
-
-        if len(valid_selects) == 0:
+        valid_fields = [field for field in ChannelSettings().get_render_plan(self.owner.guild.id, self.channel_settings).fields if field.enabled]
+        if len(valid_fields) == 0:
             return
 
-        options = [discord.SelectOption(label=entry[1].label + " を編集", value=entry[0]) for entry in valid_selects]
-        select_ui = discord.ui.Select(placeholder="編集する項目を選んでください...", options=options)
+        options = [discord.SelectOption(label=field.label + " を編集", value=field.selects_id) for field in valid_fields]
+        select_ui = discord.ui.Select(placeholder="編集する項目を選んでください...", options=options, custom_id="vcmg:recruitment:selects")
         select_ui.row = self.unused_row
 
         
@@ -218,7 +216,7 @@ class RecruimentView(discord.ui.View):
                     await interaction.response.defer(ephemeral=True)
                     self.selects[current_select_id] = selects
                     await self.__update_embed()
-                await interaction.response.send_message(content="テキストを選択してください。", ephemeral=True, delete_after=20, view=CustomSelectsView(ChannelSettings().get_selects_setting(current_select_id), selector_callback))
+                await interaction.response.send_message(content="テキストを選択してください。", ephemeral=True, delete_after=20, view=CustomSelectsView(ChannelSettings().get_selects_setting(self.owner.guild.id, current_select_id), selector_callback))
         select_ui.callback = inner_callback
         self.add_item(select_ui)
 
@@ -234,7 +232,7 @@ class RecruimentView(discord.ui.View):
                     await self.__update_text(value)
                     await interaction.response.defer(ephemeral=True)
 
-            button = discord.ui.Button(label="定型文: " + key, style=discord.ButtonStyle.grey)
+            button = discord.ui.Button(label="定型文: " + key, style=discord.ButtonStyle.grey, custom_id="vcmg:recruitment:template:" + key)
             button.callback = button_callback
             button.row = 0
             
@@ -245,26 +243,10 @@ class RecruimentView(discord.ui.View):
             add_template_item(key, value)
 
 class RecruitmentUI:
-    
+
     @staticmethod
-    async def send_edit_recruitment_message(voice_channel: discord.VoiceChannel, setting: ChannelSetting, live_setting: Optional[ChannelLiveSetting], owner: discord.Member, callbacks: RecruimentUICallbacks) -> Optional[discord.Message]:
-        try:
-            if voice_channel is None:
-                print("Channel is None!")
-                return None
-            
-            # Generate the embed message
-            message: discord.Message = None
-            async def update_message(embed: discord.Embed):
-                await message.edit(embed=embed)
-            
-            view = RecruimentView(callbacks, update_message, owner, setting, live_setting)
-            
-            # Send the message
-            message = await voice_channel.send(embed=view.get_embed(), view=view)
-            
-            return message
-            
-        except Exception as e:
-            print(f"An error occurred while sending the message {e}")
-            return None
+    async def build_edit_recruitment_message(setting: ChannelSetting, live_setting: Optional[ChannelLiveSetting], owner: discord.Member, callbacks: RecruimentUICallbacks, embed_updater: Callable[[discord.Embed], Awaitable[None]]) -> tuple[discord.Embed, RecruimentView]:
+        # the texts are read before the view is built, since building a view must not wait for the database
+        user_texts = await UserData().get_user_texts(owner, setting.category)
+        view = RecruimentView(callbacks, embed_updater, owner, setting, live_setting, user_texts)
+        return view.get_embed(), view
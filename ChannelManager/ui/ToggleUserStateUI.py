@@ -1,20 +1,22 @@
 ﻿import discord
 from typing import Awaitable, Optional, Union, List, Callable, Protocol
-import NicknameUtils
+from ChannelSettings import ChannelSetting
+import SpectatorUtils
 
 class ToggleUserStateView(discord.ui.View):
 
-    def __init__(self):
+    def __init__(self, setting: ChannelSetting):
         super().__init__(timeout=None)
+        self.setting = setting
        
-    @discord.ui.button(label="観戦する", style=discord.ButtonStyle.gray, emoji="👀", row = 0)
+    @discord.ui.button(label="観戦する", style=discord.ButtonStyle.gray, emoji="👀", row = 0, custom_id="vcmg:toggle:spectator")
     async def change_to_spectator_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        result = await NicknameUtils.change_to_spectator(interaction.user)
+        result = await SpectatorUtils.change_to_spectator(interaction.user, self.setting)
         await interaction.response.send_message(result[1], ephemeral=True, delete_after=5)
 
-    @discord.ui.button(label="参加する", style=discord.ButtonStyle.green, emoji="🎮", row = 0)
+    @discord.ui.button(label="参加する", style=discord.ButtonStyle.green, emoji="🎮", row = 0, custom_id="vcmg:toggle:player")
     async def change_to_player_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        result = await NicknameUtils.change_to_player(interaction.user)
+        result = await SpectatorUtils.change_to_player(interaction.user, self.setting)
         await interaction.response.send_message(result[1], ephemeral=True, delete_after=5)
 
             
@@ -22,26 +24,14 @@ class ToggleUserStateView(discord.ui.View):
 class ToggleUserStateUI:
 
     @staticmethod
-    async def send_toggle_state_message(voice_channel: discord.VoiceChannel) -> Optional[discord.Message]:
-        try:
-            if voice_channel is None:
-                print("Channel is None!")
-                return None
-            
-            # Generate the embed message
-            embed = discord.Embed(
-                title="VC管理",
-                description="観戦状態を切り替えられます。",
-                color=discord.Color.blue()
-            )
-            
-            # Generate view
-            view = ToggleUserStateView()
-            
-            # Send the message
-            message = await voice_channel.send(embed=embed, view=view)
-            return message
-            
-        except Exception as e:
-            print(f"An error occurred while sending the message {e}")
-            return None
+    def build_toggle_state_message(setting: ChannelSetting) -> tuple[discord.Embed, ToggleUserStateView]:
+        # Generate the embed message
+        embed = discord.Embed(
+            title="VC管理",
+            description="観戦状態を切り替えられます。",
+            color=discord.Color.blue()
+        )
+        
+        # Generate view
+        view = ToggleUserStateView(setting)
+        return embed, view